@@ -1,28 +1,88 @@
 from flask import Flask, jsonify, send_file, request
 import os
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
 from flask_cors import CORS
 import io
-import base64
+import re
+import hashlib
 from datetime import datetime
 
+from cluster_analytics import CsvClusterAnalytics, StoreClusterAnalytics, analyze_frame
+from lru_cache import LRUCache
+from metrics import ServiceMetrics
+from plot_render import PlotRenderer
+
+# Claim store analysed on GET once a CSV has been imported into it (see claim_store.py), else the claims CSV;
+# either is kept fitted and updated incrementally as it grows
+ANALYTICS_STORE_PATH = os.environ.get("ANALYTICS_STORE_PATH", "claim_store/claims")
+ANALYTICS_DATA_PATH = os.environ.get("ANALYTICS_DATA_PATH", "insurance_claims.csv")
+# Claim dates (YYYY-MM-DD, end exclusive) the store analysis is limited to ("" for no bound)
+ANALYTICS_START = os.environ.get("ANALYTICS_START", "") or None
+ANALYTICS_END = os.environ.get("ANALYTICS_END", "") or None
+# Relative rise in distance-to-centre of newly appended claims that forces a full re-cluster
+ANALYTICS_DRIFT_THRESHOLD = float(os.environ.get("ANALYTICS_DRIFT_THRESHOLD", 0.25))
+# Rendered plots + summaries kept per dataset fingerprint (database claims and uploads)
+ANALYTICS_CACHE_SIZE = int(os.environ.get("ANALYTICS_CACHE_SIZE", 8))
+# Content-addressed store of rendered charts, and processes drawing them in parallel
+PLOT_STORE_DIR = os.environ.get("PLOT_STORE_DIR", "./plot_store")
+PLOT_WORKERS = int(os.environ.get("PLOT_WORKERS", min(4, os.cpu_count() or 1)))
+# Minutes a chart no analysis in the cache refers to is kept in the store before it is deleted
+PLOT_STORE_KEEP_MINUTES = float(os.environ.get("PLOT_STORE_KEEP_MINUTES", 60))
+# /metrics samples pooled across worker processes ("" reports this process only)
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+# Fraction of requests run under cProfile; those taking PROFILE_SLOW_MS or longer are saved to PROFILE_DIR
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 1000))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+PROFILE_ON_DEMAND = os.environ.get("PROFILE_ON_DEMAND", "0") == "1"
+
 app = Flask(__name__)
 CORS(app)
 
-def generate_plot_base64(plt):
-    # Convert plot to base64 string
-    buf = io.BytesIO()
-    plt.savefig(buf, format='svg', bbox_inches='tight')
-    buf.seek(0)
-    plot_data = base64.b64encode(buf.getvalue()).decode('utf-8')
-    plt.close()
-    return plot_data
+metrics = ServiceMetrics("analytics", snapshot_dir=METRICS_DIR or None, flush_seconds=METRICS_FLUSH_SECONDS,
+                         profile_sample_rate=PROFILE_SAMPLE_RATE, profile_slow_ms=PROFILE_SLOW_MS,
+                         profile_dir=PROFILE_DIR, profile_on_demand=PROFILE_ON_DEMAND)
+metrics.instrument(app)
+
+if os.path.isdir(ANALYTICS_STORE_PATH):
+    claims_analytics = StoreClusterAnalytics(ANALYTICS_STORE_PATH, start=ANALYTICS_START, end=ANALYTICS_END,
+                                             drift_threshold=ANALYTICS_DRIFT_THRESHOLD)
+else:
+    claims_analytics = CsvClusterAnalytics(ANALYTICS_DATA_PATH, drift_threshold=ANALYTICS_DRIFT_THRESHOLD)
+analysis_cache = LRUCache(max_entries=ANALYTICS_CACHE_SIZE)
+plot_renderer = PlotRenderer(PLOT_STORE_DIR, workers=PLOT_WORKERS, keep_renders=ANALYTICS_CACHE_SIZE,
+                             keep_seconds=PLOT_STORE_KEEP_MINUTES * 60)
+
+def component_metrics():
+    """Counters the analysis cache, plot store and cluster model already keep, read when /metrics is scraped."""
+    cache, plots, clusters = analysis_cache.stats(), plot_renderer.stats(), claims_analytics.stats()
+    return [
+        ("analysis_cache_hits_total", "counter", "Analyses served from the cache.", [({}, cache["hits"])]),
+        ("analysis_cache_misses_total", "counter", "Analyses computed.", [({}, cache["misses"])]),
+        ("plots_total", "counter", "Charts requested, by whether they were drawn or found in the store.",
+         [({"result": "rendered"}, plots["rendered"]), ({"result": "reused"}, plots["reused"])]),
+        ("plots_pruned_total", "counter", "Charts deleted from the store.", [({}, plots["pruned"])]),
+        ("cluster_fits_total", "counter", "Database cluster model updates, by kind.",
+         [({"kind": "full"}, clusters["full_fits"]), ({"kind": "incremental"}, clusters["incremental_updates"])]),
+        ("analysed_claims", "gauge", "Claims in the current database analysis.", [({}, clusters["rows"])]),
+    ]
+
+metrics.registry.add_collector(component_metrics)
+metrics.registry.add_ratio("analysis_cache_hit_ratio", "Share of analyses served from the cache.",
+                           ["analysis_cache_hits_total"], ["analysis_cache_hits_total", "analysis_cache_misses_total"])
+
+def map_plots(digests, fn):
+    """Apply fn to every chart digest, keeping the nesting of the `plots` response field."""
+    return {name: map_plots(value, fn) if isinstance(value, dict) else fn(value) for name, value in digests.items()}
+
+def summarize(df_analysis):
+    return {
+        "total_claims": len(df_analysis),
+        "cluster_sizes": df_analysis["cluster"].value_counts().to_dict(),
+        "avg_premium": df_analysis["premium_amount"].mean(),
+        "total_sum_assured": df_analysis["sum_assured"].sum()
+    }
 
 @app.route('/api/fraud-analytics', methods=['GET', 'POST'])
 def get_fraud_analytics():
@@ -30,114 +90,97 @@ def get_fraud_analytics():
         # Check if CSV file is provided in the request
         if request.method == 'POST' and 'file' in request.files:
             file = request.files['file']
-            if file.filename.endswith('.csv'):
-                df = pd.read_csv(file)
-            else:
+            if not file.filename.endswith('.csv'):
                 return jsonify({
                     "status": "error",
                     "message": "Please upload a valid CSV file"
                 }), 400
-        else:
-            # Use database data if no CSV is provided
-            df = pd.read_csv("insurance_claims.csv")
-
-        if df.empty:
-            return jsonify({
-                "status": "error",
-                "message": "No data available for analysis"
-            }), 400
-
-        # Rest of your analysis code remains the same
-        features_for_analysis = [
-            'age', 'premium_amount', 'sum_assured', 'income',
-            'channel', 'product_type'
-        ]
-        
-        df_analysis = df[features_for_analysis].copy()
-
-        # Encoding categorical variables
-        le_channel = LabelEncoder()
-        le_product = LabelEncoder()
-        
-        df_analysis['channel'] = le_channel.fit_transform(df_analysis['channel'])
-        df_analysis['product_type'] = le_product.fit_transform(df_analysis['product_type'])
-
-        # Standardize numeric data
-        numeric_cols = df_analysis.select_dtypes(include=[np.number]).columns.tolist()
-        scaler = StandardScaler()
-        df_scaled = scaler.fit_transform(df_analysis[numeric_cols])
-
-        # K-Means Clustering
-        kmeans = KMeans(n_clusters=6, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(df_scaled)
-        df_analysis["cluster"] = clusters
-
-        # PCA for visualization
-        pca = PCA(n_components=2)
-        reduced_data = pca.fit_transform(df_scaled)
-        df_analysis["pca1"] = reduced_data[:, 0]
-        df_analysis["pca2"] = reduced_data[:, 1]
-
-        # Generate plots and convert to base64
-        plots = {}
-
-        # 1. Scatter Plot of Clusters
-        plt.figure(figsize=(10, 6))
-        sns.scatterplot(x=df_analysis["pca1"], y=df_analysis["pca2"], hue=df_analysis["cluster"], 
-                       palette="viridis", alpha=0.7)
-        plt.title("Fraud Detection Clusters (PCA Reduced)")
-        plt.xlabel("Principal Component 1")
-        plt.ylabel("Principal Component 2")
-        plots["cluster_scatter"] = generate_plot_base64(plt)
-
-        # 2. Cluster Size Distribution
-        plt.figure(figsize=(8, 5))
-        sns.countplot(x="cluster", data=df_analysis, palette="coolwarm")
-        plt.title("Cluster Size Distribution")
-        plt.xlabel("Cluster")
-        plt.ylabel("Number of Data Points")
-        plots["cluster_distribution"] = generate_plot_base64(plt)
-
-        # 3. Feature Distributions
-        available_features = [f for f in ["age", "premium_amount", "sum_assured", "income"] 
-                            if f in df_analysis.columns]
-        feature_plots = {}
-        for feature in available_features:
-            plt.figure(figsize=(8, 5))
-            sns.boxplot(x=df_analysis["cluster"], y=df_analysis[feature], palette="Set2")
-            plt.title(f"Distribution of {feature} Across Clusters")
-            plt.xlabel("Cluster")
-            plt.ylabel(feature)
-            feature_plots[feature] = generate_plot_base64(plt)
-        plots["feature_distributions"] = feature_plots
-
-        # 4. Correlation Heatmap
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(df_analysis.corr(), annot=True, cmap="coolwarm", fmt=".2f")
-        plt.title("Feature Correlation Heatmap")
-        plots["correlation_heatmap"] = generate_plot_base64(plt)
-
-        # Calculate summary statistics
-        summary_stats = {
-            "total_claims": len(df_analysis),
-            "cluster_sizes": df_analysis["cluster"].value_counts().to_dict(),
-            "avg_premium": df_analysis["premium_amount"].mean(),
-            "total_sum_assured": df_analysis["sum_assured"].sum()
-        }
 
-        return jsonify({
+            data = file.read()
+            fingerprint = LRUCache.key_for(data)
+            # Uploads are always analysed from scratch, so they never share the database entry
+            entry = analysis_cache.get("upload:" + fingerprint)
+            # Another process sharing the plot store may have pruned charts of an old cached analysis
+            if entry is None or not plot_renderer.stored(entry[0]):
+                with metrics.stage("analytics.read_upload"):
+                    df = pd.read_csv(io.BytesIO(data))
+                if df.empty:
+                    return jsonify({
+                        "status": "error",
+                        "message": "No data available for analysis"
+                    }), 400
+                with metrics.stage("analytics.cluster"):
+                    df_analysis = analyze_frame(df)
+                with metrics.stage("analytics.render"):
+                    entry = (plot_renderer.render(df_analysis), summarize(df_analysis))
+                metrics.count_rows("analytics_upload", len(df))
+                analysis_cache.put("upload:" + fingerprint, entry)
+        else:
+            # Use database data if no CSV is provided; only rows appended since the last call are processed
+            with metrics.stage("analytics.cluster"):
+                fingerprint, df_analysis = claims_analytics.refresh()
+            if df_analysis.empty:
+                return jsonify({
+                    "status": "error",
+                    "message": "No data available for analysis"
+                }), 400
+            # Plots are re-rendered only when the data changed
+            entry = analysis_cache.get(fingerprint)
+            if entry is None or not plot_renderer.stored(entry[0]):
+                with metrics.stage("analytics.render"):
+                    entry = (plot_renderer.render(df_analysis), summarize(df_analysis))
+                analysis_cache.put(fingerprint, entry)
+
+        digests, summary_stats = entry
+        # inline=0 skips the base64 plots; clients then load plot_urls, which are cacheable on their own
+        inline = request.args.get("inline", "1") != "0"
+
+        # The analysis is fully determined by the data and chart digests, so a repeat GET needs no body
+        etag = hashlib.sha256(repr((fingerprint, digests, inline)).encode()).hexdigest()
+        if request.method == 'GET' and request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        with metrics.stage("analytics.encode"):
+            plots = map_plots(digests, plot_renderer.encoded) if inline else None
+        response = jsonify({
             "status": "success",
             "plots": plots,
+            "plot_urls": map_plots(digests, lambda digest: f"/api/fraud-analytics/plots/{digest}.svg"),
             "summary": summary_stats,
             "analysis_date": datetime.now().isoformat(),
-            "data_source": "csv" if request.method == 'POST' else "database"
+            "data_source": "csv" if request.method == 'POST' else "database",
+            "dataset_fingerprint": fingerprint
         })
+        response.set_etag(etag)
+        return response
 
     except Exception as e:
+        metrics.error("fraud_analytics", f"Analytics error: {str(e)}")
         return jsonify({
             "status": "error",
             "message": str(e)
         }), 500
 
+@app.route('/api/fraud-analytics/plots/<digest>.svg', methods=['GET'])
+def get_plot(digest):
+    """A rendered chart by content digest; the digest is its ETag, so revalidation answers 304."""
+    if not re.fullmatch(r"[0-9a-f]{64}", digest):
+        return jsonify({"status": "error", "message": "Invalid plot id"}), 400
+    path = plot_renderer.path_for(digest)
+    if not os.path.exists(path):
+        return jsonify({"status": "error", "message": "Plot not found"}), 404
+
+    response = send_file(path, mimetype="image/svg+xml", etag=digest, max_age=31536000)
+    # A digest always names the same bytes
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/fraud-analytics/stats', methods=['GET'])
+def fraud_analytics_stats():
+    return jsonify({"clusters": claims_analytics.stats(), "cache": analysis_cache.stats(),
+                    "plots": plot_renderer.stats()})
+
 if __name__ == "__main__":
     app.run(debug=True, port=5001)
@@ -0,0 +1,357 @@
+"""Async serving mode for the scoring service: POST /predict on the event loop, slow endpoints on their own pools.
+
+    python asgi.py --port 5000            # one process, under uvicorn
+    python serve.py --asgi --workers 4    # gunicorn with uvicorn workers
+
+`app` is a plain ASGI application around main.py. POST /predict is scored on
+the event loop: features and an in-memory cache lookup take microseconds,
+and the model call is awaited on the micro-batcher's future instead of
+holding a thread. With PREDICTION_CACHE_PATH set, the cache lookup and store
+can wait on the SQLite file lock, so they run on the default lane instead.
+Every other request runs the Flask app on a thread of its lane:
+
+    document  /ocr-predict, /signature_check, /verify-document (rasterization, OCR, signature CNN)
+    bulk      /bulk-predict and /bulk-predict/jobs uploads
+    default   everything else (model admin, stats, /metrics, job status and downloads)
+
+A saturated document or bulk lane queues its own requests, up to
+LANE_QUEUE_LIMIT, then answers 503, while /predict keeps going. Document
+uploads over MAX_DOCUMENT_UPLOAD_BYTES get 413 without being read in full. The lanes are
+threads of this process, so their Python code still shares the GIL with the
+event loop; Poppler and Tesseract run as subprocesses and TensorFlow and
+OpenCV release the GIL, so what the loop waits for is only Python glue, and
+GIL_SWITCH_INTERVAL_MS keeps each of those waits short.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+import main
+
+# Threads running document requests; OCR itself is spread over OCR_WORKERS processes (see main.py).
+# Each one can keep a core busy rasterizing, so by default half the cores are left for /predict
+DOCUMENT_WORKERS = int(os.environ.get("DOCUMENT_WORKERS", max(1, (os.cpu_count() or 1) // 2)))
+
+# Threads running bulk uploads and scored CSV streams
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", 2))
+
+# Threads running every other Flask endpoint
+DEFAULT_WORKERS = int(os.environ.get("DEFAULT_WORKERS", 8))
+
+# Requests that may wait for a busy document or bulk thread before new ones get 503; -1 for no limit
+LANE_QUEUE_LIMIT = int(os.environ.get("LANE_QUEUE_LIMIT", 64))
+
+# How often a thread holding the GIL is asked to hand it over. Python's 5 ms default lets a lane
+# thread running OCR glue or a bulk chunk delay the event loop by that much at every switch
+GIL_SWITCH_INTERVAL_MS = float(os.environ.get("GIL_SWITCH_INTERVAL_MS", 1))
+sys.setswitchinterval(GIL_SWITCH_INTERVAL_MS / 1000)
+
+DOCUMENT_PATHS = {"/ocr-predict", "/signature_check", "/verify-document"}
+BULK_PATHS = {"/bulk-predict", "/bulk-predict/jobs"}
+
+
+class Lane:
+    """A thread pool for one kind of request, so slow requests only queue behind their own kind.
+
+    `active` counts the lane's requests that are running or waiting for a
+    thread. It is only changed on the event loop, so it needs no lock. Once
+    it reaches `workers + queue_limit`, `full` is true and new requests are
+    turned away instead of piling up behind a saturated pool. Request bodies
+    over `max_body` bytes are refused while they are being received.
+    """
+
+    def __init__(self, name, workers, queue_limit=-1, max_body=None):
+        self.name = name
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.max_body = max_body
+        self.active = 0
+        self._executor = None
+        self._executor_pid = None
+
+    @property
+    def full(self):
+        return self.queue_limit >= 0 and self.active >= self.workers + self.queue_limit
+
+    def _get_executor(self):
+        # Threads do not survive fork, so pre-forking servers get a fresh pool per worker
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"lane-{self.name}")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=False)
+        self._executor = None
+
+
+lanes = {
+    "document": Lane("document", DOCUMENT_WORKERS, LANE_QUEUE_LIMIT,
+                     main.MAX_DOCUMENT_UPLOAD_BYTES + main.MULTIPART_OVERHEAD_BYTES),
+    "bulk": Lane("bulk", BULK_WORKERS, LANE_QUEUE_LIMIT),
+    "default": Lane("default", DEFAULT_WORKERS),
+}
+
+rejected = main.metrics.registry.counter("lane_rejected_total", "Requests answered 503 by a full lane.", ["lane"])
+
+
+def lane_metrics():
+    return [
+        ("lane_requests", "gauge", "Requests running or waiting in each ASGI lane.",
+         [({"lane": lane.name}, lane.active) for lane in lanes.values()]),
+        ("lane_workers", "gauge", "Threads in each ASGI lane.",
+         [({"lane": lane.name}, lane.workers) for lane in lanes.values()]),
+    ]
+
+main.metrics.registry.add_collector(lane_metrics)
+
+
+def lane_for(method, path):
+    if method == "POST" and path in DOCUMENT_PATHS:
+        return lanes["document"]
+    if method == "POST" and path in BULK_PATHS:
+        return lanes["bulk"]
+    return lanes["default"]
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, limit=None):
+    """The whole request body, or None if the client disconnected first; BodyTooLarge past `limit` bytes."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, payload, headers=()):
+    body = main.app.json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def cached(fn, *args):
+    """fn(*args) for a prediction cache lookup or store: inline, or on the default lane with a SQLite tier.
+
+    The in-memory tier takes microseconds; the SQLite one can wait seconds for the file lock, which
+    must not stall every other request on the loop.
+    """
+    if main.prediction_cache.sqlite_path:
+        return await lanes["default"].run(fn, *args)
+    return fn(*args)
+
+
+async def score_claim(body):
+    """Status and JSON payload of POST /predict, as the Flask view computes them."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return 400, {"error": "Request body must be JSON"}
+
+    try:
+        try:
+            bundle, input_data, result = await cached(main.claim_features, data)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        if result is None:
+            scored = main.decide_claim(bundle, input_data)
+            if scored is None:
+                # Awaited, not waited on: the loop serves other requests while the batch fills
+                with main.metrics.stage("claim.model"):
+                    scored = await asyncio.wrap_future(bundle.batcher.submit(input_data))
+            result = bundle.describe_row(scored)
+            await cached(main.prediction_cache.put, bundle.cache_version, input_data, result)
+        main.metrics.count_rows("predict")
+        return 200, {"claim_id": data.get("claim_id"), **result}
+    except Exception as e:
+        main.metrics.error("predict", f"Error scoring claim: {str(e)}")
+        return 500, {"error": str(e)}
+
+
+async def predict(receive, send):
+    # Counted like the Flask hooks count requests; sampled profiling only covers Flask requests
+    started = time.perf_counter()
+    main.metrics.in_flight.inc(endpoint="predict")
+    status = 500
+    try:
+        body = await read_body(receive)
+        if body is None:
+            return
+        status, payload = await score_claim(body)
+        await send_json(send, status, payload)
+    finally:
+        main.metrics.in_flight.dec(endpoint="predict")
+        main.metrics.record_request("predict", "POST", status, time.perf_counter() - started)
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "content-type":
+            environ["CONTENT_TYPE"] = value
+        elif name != "content-length":
+            key = "HTTP_" + name.upper().replace("-", "_")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def start_flask(environ):
+    """Run the Flask app on one request; its status, headers and body iterable."""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    body = main.app(environ, start_response)
+    return response["status"], response["headers"], body
+
+
+def endpoint_for(scope):
+    try:
+        return main.app.url_map.bind("").match(scope["path"], scope["method"])[0]
+    except HTTPException:
+        return "unmatched"
+
+
+async def refuse(scope, send, status, message, headers=()):
+    """Answer a request before it reaches Flask, counted as the Flask hooks would count it."""
+    main.metrics.record_request(endpoint_for(scope), scope["method"], status, 0.0)
+    await send_json(send, status, {"error": message}, headers)
+
+
+def content_length(scope):
+    for name, value in scope["headers"]:
+        if name == b"content-length" and value.isdigit():
+            return int(value)
+    return None
+
+
+def too_large(lane):
+    return f"File too large; the limit is {lane.max_body // (1024 * 1024)} MB"
+
+
+async def call_flask(lane, scope, receive, send):
+    if lane.full:
+        rejected.inc(lane=lane.name)
+        await refuse(scope, send, 503, f"Too many {lane.name} requests in progress, retry later",
+                     [(b"retry-after", b"1")])
+        return
+    if lane.max_body is not None and (content_length(scope) or 0) > lane.max_body:
+        await refuse(scope, send, 413, too_large(lane))
+        return
+
+    lane.active += 1
+    try:
+        try:
+            body = await read_body(receive, lane.max_body)
+        except BodyTooLarge:
+            await refuse(scope, send, 413, too_large(lane))
+            return
+        if body is None:
+            return
+        status, headers, iterable = await lane.run(start_flask, wsgi_environ(scope, body))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        try:
+            # Streamed bulk responses score each chunk as it is pulled, so every chunk is pulled on the lane
+            chunks = iter(iterable)
+            while True:
+                chunk = await lane.run(next, chunks, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(iterable, "close"):
+                await lane.run(iterable.close)
+    finally:
+        lane.active -= 1
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # /predict builds features on the loop, so load the bundle before the first request, off the loop
+            try:
+                await lanes["default"].run(main.registry.get, "tabular")
+            except Exception as e:
+                main.metrics.error("startup", f"Error loading the tabular model: {str(e)}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            for lane in lanes.values():
+                lane.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http":
+        main.metrics.registry.ensure_flusher()
+        if scope["method"] == "POST" and scope["path"] == "/predict":
+            await predict(receive, send)
+        else:
+            await call_flask(lane_for(scope["method"], scope["path"]), scope, receive, send)
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 5000)))
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("Async mode needs uvicorn (pip install uvicorn); otherwise run `python main.py` or serve.py.")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    run()
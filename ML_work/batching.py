@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class Histogram:
+    """Cumulative bucket histogram (Prometheus style) for tuning the batch window."""
+
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            for i, bound in enumerate(self.bounds):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {}
+            running = 0
+            for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+                running += count
+                buckets[str(bound)] = running
+            return {
+                "buckets": buckets,
+                "count": self.count,
+                "sum": self.total,
+                "mean": self.total / self.count if self.count else 0.0
+            }
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-row requests into one vectorized call.
+
+    Callers submit one feature row each. A background thread collects rows until
+    `max_batch_size` are queued or the oldest row has waited `max_wait_ms`, then
+    calls `batch_fn` once with a 2-D array and hands each caller its own result.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=5.0, dtype=np.float64):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.dtype = dtype
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_ms = Histogram([0.1, 0.5, 1, 2, 5, 10, 25, 50, 100])
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._worker_pid = None
+        self._closed = False
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so pre-forking servers get a fresh worker per process
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker_pid = os.getpid()
+        self._worker.start()
+
+    def submit(self, row):
+        """Queue a single feature row and return a Future for its result."""
+        future = Future()
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                self._ensure_worker()
+                self._queue.append((row, future, time.perf_counter()))
+                self._cond.notify()
+        if closed:
+            # A closed batcher still answers late callers, one row at a time
+            try:
+                future.set_result(self.batch_fn(np.asarray([row], dtype=self.dtype))[0])
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+    def predict(self, row, timeout=None):
+        return self.submit(row).result(timeout=timeout)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            count = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000.0)
+            self.batch_sizes.observe(len(batch))
+
+            try:
+                rows = np.asarray([row for row, _, _ in batch], dtype=self.dtype)
+                results = self.batch_fn(rows)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def close(self):
+        """Stop batching; the worker thread exits once queued rows are scored."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queued": len(self._queue),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot()
+        }
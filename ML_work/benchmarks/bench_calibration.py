@@ -0,0 +1,78 @@
+"""Latency cost of calibrated probability scoring against plain class prediction.
+
+Loads a model bundle (the one named by model_bundles/LATEST by default) and
+times, per batch size, the flat forest and sklearn paths three ways:
+`predict` (class labels only, what the service used to do), uncalibrated
+`predict_proba`, and the full calibrated score the service now returns
+(probabilities, fraud probability and risk level). Also reports the
+bundle's held-out log loss and Brier score before and after calibration.
+
+Run from ML_work/:  python benchmarks/bench_calibration.py [--bundle model_bundles/<version>]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model_bundles import ModelBundle  # noqa: E402
+
+BATCH_SIZES = (1, 32, 512, 10000)
+
+
+def time_call(fn, X, min_seconds=0.5):
+    """Mean milliseconds per call, repeating until `min_seconds` have passed."""
+    fn(X)
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_seconds:
+        fn(X)
+        calls += 1
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bundles-dir", default="model_bundles")
+    parser.add_argument("--bundle", help="bundle directory (default: the one named by LATEST)")
+    parser.add_argument("--data", default="insurance_claims.csv")
+    args = parser.parse_args()
+
+    path = args.bundle
+    if path is None:
+        with open(os.path.join(args.bundles_dir, "LATEST")) as f:
+            path = os.path.join(args.bundles_dir, f.read().strip())
+    # Same bundle twice: one always on the flat forest, one always on sklearn
+    flat = ModelBundle(path, os.path.basename(path), flat_forest_max_rows=max(BATCH_SIZES))
+    sklearn = ModelBundle(path, os.path.basename(path), flat_forest_max_rows=0)
+    if flat.calibrator is None:
+        print(f"{path} has no calibrator; timing uncalibrated probabilities")
+    X = flat.features.transform_frame(pd.read_csv(args.data).drop(columns="fraud_category"))
+
+    paths = {
+        "flat": (flat.forest.predict, flat.forest.predict_proba, flat.score),
+        "sklearn": (sklearn.sklearn_model().predict, sklearn.sklearn_model().predict_proba, sklearn.score),
+    }
+    print(f"{'path':<8} {'rows':>6} {'predict':>10} {'proba':>10} {'calibrated':>11} {'overhead':>9}")
+    for name, (predict, predict_proba, score) in paths.items():
+        for rows in BATCH_SIZES:
+            batch = X[:rows]
+            base = time_call(predict, batch)
+            proba = time_call(predict_proba, batch)
+            calibrated = time_call(score, batch)
+            print(f"{name:<8} {rows:>6} {base:>8.3f}ms {proba:>8.3f}ms {calibrated:>9.3f}ms "
+                  f"{(calibrated - base) / base * 100:>+8.1f}%")
+
+    metrics_path = os.path.join(path, "metrics.json")
+    if os.path.exists(metrics_path):
+        with open(metrics_path) as f:
+            metrics = json.load(f)
+        for key in ("uncalibrated", "calibrated"):
+            if key in metrics:
+                print(f"{key:<13} log loss {metrics[key]['log_loss']:.4f}  brier {metrics[key]['brier']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Load time and memory of the columnar claim store against the CSV reads it replaces.
+
+Tiles insurance_claims.csv up to --rows claims, imports the result into a
+temporary store, then runs each load in a fresh process and reports wall
+time and peak RSS above the interpreter's baseline with pandas/pyarrow
+imported. CSV loads include parsing both date columns, which every CSV
+caller (training, the feature pipeline) has to do before using the data.
+
+Run from ML_work/ (peak memory is accurate on Linux):  python benchmarks/bench_claim_store.py --rows 1000000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from claim_store import ClaimStore  # noqa: E402
+from features import parse_dates  # noqa: E402
+
+SOME_COLUMNS = ["claim_date", "premium_amount", "sum_assured", "fraud_category"]
+MONTH = ("2025-01-01", "2025-02-01")
+
+
+def csv_load(csv_path, columns=None, month=False):
+    df = pd.read_csv(csv_path, usecols=columns)
+    for column in ("policy_start_date", "claim_date"):
+        if column in df.columns:
+            df[column] = parse_dates(df[column])
+    if month:
+        df = df[(df["claim_date"] >= MONTH[0]) & (df["claim_date"] < MONTH[1])]
+    return df
+
+
+CASES = {
+    "csv: all columns": lambda csv, store: csv_load(csv),
+    "store: all columns": lambda csv, store: ClaimStore(store).load(),
+    "csv: 4 columns": lambda csv, store: csv_load(csv, SOME_COLUMNS),
+    "store: 4 columns": lambda csv, store: ClaimStore(store).load(SOME_COLUMNS),
+    "csv: one month": lambda csv, store: csv_load(csv, month=True),
+    "store: one month": lambda csv, store: ClaimStore(store).load(start=MONTH[0], end=MONTH[1]),
+}
+
+
+def peak_rss_mib():
+    # ru_maxrss survives exec, so a child would report the parent's peak; VmHWM is per process
+    try:
+        with open("/proc/self/status") as f:
+            return int(f.read().split("VmHWM:")[1].split()[0]) / 1024
+    except (OSError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_case(name, csv_path, store_path):
+    baseline = peak_rss_mib()
+    start = time.perf_counter()
+    rows = len(CASES[name](csv_path, store_path)) if name else 0
+    print(json.dumps({"seconds": time.perf_counter() - start, "rows": rows,
+                      "peak_rss_mib": peak_rss_mib() - baseline}))
+
+
+def measure(name, csv_path, store_path):
+    output = subprocess.run([sys.executable, __file__, "--case", name, "--csv", csv_path, "--store", store_path],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def build_dataset(rows, workdir):
+    source = pd.read_csv("insurance_claims.csv")
+    tiled = pd.concat([source] * -(-rows // len(source)), ignore_index=True).iloc[:rows]
+    csv_path = os.path.join(workdir, "claims.csv")
+    tiled.to_csv(csv_path, index=False)
+    store_path = os.path.join(workdir, "store")
+    start = time.perf_counter()
+    ClaimStore(store_path).import_csv(csv_path)
+    print(f"Imported {rows:,} rows in {time.perf_counter() - start:.2f}s")
+    return csv_path, store_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--case")
+    parser.add_argument("--csv")
+    parser.add_argument("--store")
+    args = parser.parse_args()
+
+    if args.case is not None:
+        run_case(args.case, args.csv, args.store)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        csv_path, store_path = build_dataset(args.rows, workdir)
+        size = lambda path: sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs)
+        print(f"On disk: CSV {os.path.getsize(csv_path) / 2 ** 20:.1f} MiB, store {size(store_path) / 2 ** 20:.1f} MiB")
+        for name in CASES:
+            r = measure(name, csv_path, store_path)
+            print(f"{name:<20} {r['seconds']:7.3f}s  {r['rows']:>10,} rows  peak +{r['peak_rss_mib']:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Rows/sec of the compiled FeatureTransformer against the original per-endpoint feature code.
+
+Run from ML_work/:  python benchmarks/bench_features.py
+"""
+import os
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features import FeatureTransformer
+
+warnings.filterwarnings("ignore")
+
+
+def rows_per_sec(fn, rows, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return rows / best
+
+
+def legacy_record(record, scaler, le_channel, le_product):
+    # Feature code as originally written in /predict and /ocr-predict, including its column order:
+    # claim_duration fifth, where the scaler and model expect it last. Only its speed is compared,
+    # since its output was wrong
+    return scaler.transform(np.array([[
+        record["age"], record["premium_amount"], record["sum_assured"], record["income"],
+        (datetime.strptime(record["claim_date"], "%Y-%m-%d") - datetime.strptime(record["policy_start_date"], "%Y-%m-%d")).days,
+        le_channel.transform([record["channel"]])[0],
+        le_product.transform([record["product_type"]])[0]
+    ]]))
+
+
+def legacy_frame(df, scaler, le_channel, le_product):
+    # Feature code as originally written in /bulk-predict
+    df = df.copy()
+    df["claim_date"] = pd.to_datetime(df["claim_date"], dayfirst=True, errors='coerce')
+    df["policy_start_date"] = pd.to_datetime(df["policy_start_date"], dayfirst=True, errors='coerce')
+    df["claim_duration"] = (df["claim_date"] - df["policy_start_date"]).dt.days
+    df_pred = df.drop(columns=["claim_id", "policy_start_date", "claim_date"])
+    df_pred["channel"] = le_channel.transform(df_pred["channel"])
+    df_pred["product_type"] = le_product.transform(df_pred["product_type"])
+    return scaler.transform(df_pred)
+
+
+def main():
+    scaler = joblib.load("scaler.pkl")
+    le_channel = joblib.load("label_encoder_channel.pkl")
+    le_product = joblib.load("label_encoder_product.pkl")
+    features = FeatureTransformer(le_channel, le_product, scaler)
+
+    df = pd.read_csv("insurance_claims.csv").drop(columns=["fraud_category"])
+    for col in ["claim_date", "policy_start_date"]:
+        df[col] = pd.to_datetime(df[col]).dt.strftime("%d-%m-%Y")
+
+    records = df.head(1000).to_dict("records")
+    for record in records:
+        for col in ["claim_date", "policy_start_date"]:
+            record[col] = datetime.strptime(record[col], "%d-%m-%Y").strftime("%Y-%m-%d")
+
+    assert np.allclose(legacy_frame(df, scaler, le_channel, le_product), features.transform_frame(df, dayfirst=True))
+
+    results = {
+        "single_record_legacy": rows_per_sec(
+            lambda: [legacy_record(r, scaler, le_channel, le_product) for r in records], len(records)),
+        "single_record_compiled": rows_per_sec(
+            lambda: [features.transform_record(r) for r in records], len(records)),
+        "frame_legacy": rows_per_sec(
+            lambda: legacy_frame(df, scaler, le_channel, le_product), len(df)),
+        "frame_compiled": rows_per_sec(
+            lambda: features.transform_frame(df, dayfirst=True), len(df)),
+    }
+
+    for name, rate in results.items():
+        print(f"{name:<26} {rate:>14,.0f} rows/sec")
+    print(f"single record speedup: {results['single_record_compiled'] / results['single_record_legacy']:.1f}x")
+    print(f"frame speedup:         {results['frame_compiled'] / results['frame_legacy']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    main()
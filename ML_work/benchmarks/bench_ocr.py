@@ -0,0 +1,84 @@
+"""Claim form extraction: text layer, template field crops and full-page OCR, for latency and field accuracy.
+
+Runs the service's extraction paths on a claim form PDF (by default
+insurance_claim_form.pdf) without the document cache: the default pipeline
+(text layer first, which is all a born-digital form needs), full-page OCR at
+OCR_FULL_PAGE_DPI, and template-mode field OCR at several DPIs. For each it
+reports the median per-document latency and how many of the nine parsed
+fields match the values the form was filled with (test/pdf1.py), so the
+lowest DPI that still reads every field can be picked for OCR_TEMPLATE_DPI.
+
+Run from ML_work/ (needs Tesseract and Poppler):  python benchmarks/bench_ocr.py --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DEFER_BACKGROUND_WORK"] = "1"
+import main as service  # noqa: E402
+
+# Values insurance_claim_form.pdf was generated with
+EXPECTED = {
+    "claim_id": "C12345", "policy_start_date": "2023-01-15", "claim_date": "2024-02-20", "age": "45",
+    "premium_amount": "20000", "sum_assured": "500000", "income": "750000",
+    "channel": "RetailAgency", "product_type": "Health"
+}
+TEMPLATE_DPIS = (72, 100, 150, 200)
+
+
+def run(extract, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        document = extract(data)
+        timings.append((time.perf_counter() - start) * 1000)
+    if document is None:
+        return None
+    fields = service.parse_claim_form(document.text)
+    wrong = sorted(field for field, value in EXPECTED.items() if (fields.get(field) or "").replace(",", "") != value)
+    return {"ms": statistics.median(timings), "correct": len(EXPECTED) - len(wrong), "wrong": wrong,
+            "mode": document.mode}
+
+
+def default_pipeline(data):
+    service.document_cache.clear()
+    return service.extract_text_from_pdf(data)
+
+
+def with_template_dpi(dpi):
+    def extract(data):
+        service.OCR_TEMPLATE_DPI = dpi
+        return service.ocr_form_fields(data)
+    return extract
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", nargs="?", default="insurance_claim_form.pdf")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # Loads OpenCV and starts the OCR pool before anything is timed
+    service.registry.get("ocr")
+    cases = [("default pipeline", default_pipeline),
+             (f"full page @ {service.OCR_FULL_PAGE_DPI} dpi", service.ocr_full_pages)]
+    cases += [(f"template @ {dpi} dpi", with_template_dpi(dpi)) for dpi in TEMPLATE_DPIS]
+
+    with open(args.pdf, "rb") as f:
+        data = f.read()
+    print(f"{'path':<24} {'latency':>10} {'fields':>7}  {'ran':<20} mismatched")
+    for name, extract in cases:
+        result = run(extract, data, args.repeat)
+        if result is None:
+            print(f"{name:<24} {'-':>10} {'-':>7}  layout not recognised")
+            continue
+        print(f"{name:<24} {result['ms']:>8.1f}ms {result['correct']:>4}/{len(EXPECTED)}  {result['mode']:<20} "
+              f"{', '.join(result['wrong']) or '-'}")
+    service.registry.get("ocr").pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
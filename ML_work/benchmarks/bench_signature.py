@@ -0,0 +1,102 @@
+"""Signature CNN backends: conversion, accuracy parity and batched throughput.
+
+    python benchmarks/bench_signature.py --convert   # writes signature.tflite and signature.onnx
+
+Scores the same signature crops with every backend that can be loaded (Keras,
+TFLite, ONNX Runtime), reports the largest score difference and any flipped
+real/forged decisions against Keras, then times each backend at batch sizes
+1, 8 and 32. The crops are the sample signatures in test/ plus random
+augmentations of them, preprocessed exactly as the service does.
+
+Run from ML_work/ (needs tensorflow; tf2onnx and onnxruntime for the ONNX backend).
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from signature_service import (convert_to_onnx, convert_to_tflite, load_backend,  # noqa: E402
+                               preprocess_signature)
+
+SAMPLE_IMAGES = ["test/agh1_1.jpg", "test/agh1fraud_1.jpg"]
+BATCH_SIZES = (1, 8, 32)
+
+
+def sample_batch(n=64, seed=0):
+    rng = np.random.default_rng(seed)
+    images = [cv2.imread(path) for path in SAMPLE_IMAGES if os.path.exists(path)]
+    if not images:
+        images = [rng.integers(0, 256, (200, 400, 3), dtype=np.uint8)]
+    crops = []
+    for i in range(n):
+        image = images[i % len(images)]
+        h, w = image.shape[:2]
+        top, left = rng.integers(0, h // 4 + 1), rng.integers(0, w // 4 + 1)
+        crop = image[top:top + int(h * 0.8), left:left + int(w * 0.8)]
+        crops.append(preprocess_signature(crop))
+    return np.stack(crops)
+
+
+def time_backend(backend, batch, repeats=20):
+    results = {}
+    for size in BATCH_SIZES:
+        chunk = batch[:size]
+        backend.predict(chunk)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            backend.predict(chunk)
+        elapsed = (time.perf_counter() - start) / repeats
+        results[size] = {"batch_ms": elapsed * 1000, "images_per_sec": size / elapsed}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keras", default="signature.keras")
+    parser.add_argument("--tflite", default="signature.tflite")
+    parser.add_argument("--onnx", default="signature.onnx")
+    parser.add_argument("--convert", action="store_true", help="convert the Keras model before benchmarking")
+    parser.add_argument("--quantize", action="store_true", help="dynamic-range quantize the TFLite model")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.convert:
+        convert_to_tflite(args.keras, args.tflite, quantize=args.quantize)
+        try:
+            convert_to_onnx(args.keras, args.onnx)
+        except ImportError as e:
+            print(f"Skipping ONNX conversion: {str(e)}")
+
+    backends = {}
+    for name in ("keras", "tflite", "onnx"):
+        try:
+            backends[name] = load_backend(name, args.keras, args.tflite, args.onnx, args.threads)
+        except Exception as e:
+            print(f"{name:<7} unavailable: {str(e)}")
+    if not backends:
+        return 1
+
+    batch = sample_batch()
+    reference_name = "keras" if "keras" in backends else next(iter(backends))
+    reference = backends[reference_name].predict(batch)
+    ok = True
+    for name, backend in backends.items():
+        scores = backend.predict(batch)
+        max_diff = float(np.abs(scores - reference).max())
+        flipped = int(((scores >= 0.5) != (reference >= 0.5)).sum())
+        ok &= flipped == 0
+        print(f"{name:<7} vs {reference_name}: max |score diff| {max_diff:.2e}, {flipped}/{len(batch)} decisions flipped")
+
+    for name, backend in backends.items():
+        for size, r in time_backend(backend, batch).items():
+            print(f"{name:<7} batch={size:<3} {r['batch_ms']:8.2f} ms/batch  {r['images_per_sec']:8.1f} images/s")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Per-stage latency of the scoring, document and analytics pipelines, saved as JSON.
+
+Times each stage on its own, on fixed-seed generated claims and the bundled
+claim form PDFs, through the same loaders the services use:
+
+    features      claim dict / DataFrame -> unscaled feature matrix
+    scaler        sklearn StandardScaler.transform against the compiled scale
+    forest        flat forest and sklearn predict_proba, and the calibrated score
+    rasterize     Poppler rasterization of page 1 at the template and full-page DPIs
+    tesseract     one field crop and one full page through Tesseract
+    signature     crop preprocessing and the signature CNN at batch sizes 1 and 32
+    clustering    KMeans/PCA fit and projection used by /api/fraud-analytics
+    plots         drawing each analytics chart as SVG
+
+Stages whose dependencies are missing (no Tesseract, Poppler or TensorFlow)
+are recorded as skipped with the reason, and the rest still run. Compare two
+result files with `python benchmarks/suite.py compare a.json b.json`.
+
+Run from ML_work/:  python benchmarks/bench_stages.py [--stages features,forest] [--output results.json]
+"""
+import argparse
+import os
+import sys
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DEFER_BACKGROUND_WORK"] = "1"
+import main as service  # noqa: E402
+from suite import SAMPLE_PDFS, claims, summarize, time_calls, write_results  # noqa: E402
+
+warnings.filterwarnings("ignore")
+
+BATCH_SIZES = (1, 32, 10000)
+SIGNATURE_BATCH_SIZES = (1, 32)
+
+
+def measure(fn, rows, min_seconds):
+    result = summarize(time_calls(fn, min_seconds=min_seconds))
+    result["rows"] = rows
+    result["rows_per_sec"] = rows / (result["p50_ms"] / 1000) if result["p50_ms"] else None
+    return result
+
+
+def bench_features(ctx):
+    bundle = ctx.bundle
+    record = ctx.frame.iloc[0].to_dict()
+    cases = {"record": measure(lambda: bundle.features.raw_record(record), 1, ctx.min_seconds)}
+    for rows in BATCH_SIZES[1:]:
+        frame = ctx.frame.head(rows)
+        cases[f"frame_{rows}"] = measure(lambda: bundle.features.raw_frame(frame), rows, ctx.min_seconds)
+    return cases
+
+
+def bench_scaler(ctx):
+    bundle = ctx.bundle
+    cases = {}
+    for rows in BATCH_SIZES:
+        raw = ctx.raw[:rows]
+        cases[f"sklearn_{rows}"] = measure(lambda: bundle.scaler.transform(raw), rows, ctx.min_seconds)
+        cases[f"compiled_{rows}"] = measure(lambda: bundle.features.scale(raw), rows, ctx.min_seconds)
+    return cases
+
+
+def bench_forest(ctx):
+    bundle = ctx.bundle
+    cases = {}
+    for rows in BATCH_SIZES:
+        X = ctx.X[:rows]
+        if bundle.forest is not None:
+            cases[f"flat_{rows}"] = measure(lambda: bundle.forest.predict_proba(X), rows, ctx.min_seconds)
+        model = bundle.sklearn_model()
+        cases[f"sklearn_{rows}"] = measure(lambda: model.predict_proba(X), rows, ctx.min_seconds)
+        # What the service runs: flat forest up to FLAT_FOREST_MAX_ROWS, then calibration and risk levels
+        cases[f"score_{rows}"] = measure(lambda: bundle.score(X), rows, ctx.min_seconds)
+    return cases
+
+
+def rasterize(ctx, dpi):
+    ocr = service.registry.get("ocr")
+    return np.array(ocr.convert_from_bytes(ctx.pdf_data, dpi=dpi, first_page=1, last_page=1,
+                                           poppler_path=service.POPPLER_PATH)[0])
+
+
+def bench_rasterize(ctx):
+    cases = {}
+    for name, dpi in (("template", service.OCR_TEMPLATE_DPI), ("full_page", service.OCR_FULL_PAGE_DPI)):
+        rasterize(ctx, dpi)
+        cases[f"{name}_{dpi}dpi"] = measure(lambda: rasterize(ctx, dpi), 1, ctx.min_seconds)
+    return cases
+
+
+def bench_tesseract(ctx):
+    from form_ocr import FIELD_OCR_CONFIG, template_regions
+    from ocr_pool import ocr_gray_page
+
+    cv2 = service.registry.get("ocr").cv2
+    cases = {}
+    regions = template_regions(rasterize(ctx, service.OCR_TEMPLATE_DPI))
+    if regions is not None:
+        crop = cv2.cvtColor(regions["fields"]["claim_id"], cv2.COLOR_RGB2GRAY)
+        cases["field_crop"] = measure(lambda: ocr_gray_page(crop, config=FIELD_OCR_CONFIG), 1, ctx.min_seconds)
+    page = cv2.cvtColor(rasterize(ctx, service.OCR_FULL_PAGE_DPI), cv2.COLOR_RGB2GRAY)
+    cases["full_page"] = measure(lambda: ocr_gray_page(page), 1, ctx.min_seconds)
+    return cases
+
+
+def signature_crop(ctx):
+    """The form's signature box if the PDF can be rasterized, else the sample signature in test/."""
+    import cv2
+    from form_ocr import template_regions
+
+    try:
+        regions = template_regions(rasterize(ctx, service.OCR_TEMPLATE_DPI))
+        if regions is not None:
+            return regions["signature"]
+    except Exception as e:
+        print(f"Using test/agh1_1.jpg as the signature crop ({str(e)})")
+    return cv2.imread("test/agh1_1.jpg")
+
+
+def bench_signature(ctx):
+    from signature_service import preprocess_signature
+
+    backend = service.registry.get("signature").backend
+    crop = signature_crop(ctx)
+    cases = {"preprocess": measure(lambda: preprocess_signature(crop), 1, ctx.min_seconds)}
+    tensor = preprocess_signature(crop)
+    for size in SIGNATURE_BATCH_SIZES:
+        batch = np.repeat(tensor[None], size, axis=0)
+        cases[f"{backend.name}_{size}"] = measure(lambda: backend.predict(batch), size, ctx.min_seconds)
+    return cases
+
+
+def bench_clustering(ctx):
+    from cluster_analytics import ClusterModel
+
+    model = ClusterModel()
+    _, scaled = model.fit(ctx.frame)
+    return {
+        "fit": measure(lambda: ClusterModel().fit(ctx.frame), len(ctx.frame), ctx.min_seconds),
+        "project": measure(lambda: model.project(scaled), len(ctx.frame), ctx.min_seconds),
+    }
+
+
+def bench_plots(ctx):
+    import plot_render
+    from cluster_analytics import analyze_frame
+
+    # Drawn inline in this process; the renderer's pool and store would hide the drawing cost
+    plot_render._init_worker()
+    cases = {}
+    for key, draw_name, kwargs in plot_render.plot_specs(analyze_frame(ctx.frame)):
+        cases[".".join(key)] = measure(lambda: plot_render._render(draw_name, kwargs), 1, ctx.min_seconds)
+    return cases
+
+
+STAGES = {
+    "features": bench_features,
+    "scaler": bench_scaler,
+    "forest": bench_forest,
+    "rasterize": bench_rasterize,
+    "tesseract": bench_tesseract,
+    "signature": bench_signature,
+    "clustering": bench_clustering,
+    "plots": bench_plots,
+}
+
+
+class Context:
+    """Inputs shared by the stages; the model bundle and its feature matrices are loaded on first use."""
+
+    def __init__(self, rows, pdf, min_seconds):
+        self.frame = claims(rows)
+        with open(pdf, "rb") as f:
+            self.pdf_data = f.read()
+        self.min_seconds = min_seconds
+        self.raw = None
+        self.X = None
+        self._bundle = None
+
+    @property
+    def bundle(self):
+        if self._bundle is None:
+            self._bundle = service.registry.get("tabular").current
+            self.raw = self._bundle.features.raw_frame(self.frame)
+            self.X = self._bundle.features.scale(self.raw)
+        return self._bundle
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--rows", type=int, default=max(BATCH_SIZES), help="generated claims per batch stage")
+    parser.add_argument("--pdf", default=SAMPLE_PDFS[0])
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="time spent per case")
+    parser.add_argument("--output", default=f"bench_results/stages-{datetime.now():%Y%m%d-%H%M%S}.json")
+    args = parser.parse_args()
+
+    unknown = set(args.stages.split(",")) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    ctx = Context(args.rows, args.pdf, args.min_seconds)
+    results = {}
+    print(f"{'stage':<11} {'case':<40} {'rows':>6} {'p50':>10} {'p95':>10} {'rows/sec':>12}")
+    for name in args.stages.split(","):
+        try:
+            cases = STAGES[name](ctx)
+        except Exception as e:
+            # Missing binaries or models skip the stage; the others still run
+            results[name] = {"skipped": f"{type(e).__name__}: {str(e)}"}
+            print(f"{name:<11} skipped: {results[name]['skipped']}")
+            continue
+        results[name] = cases
+        for case, result in cases.items():
+            print(f"{name:<11} {case:<40} {result['rows']:>6} {result['p50_ms']:>8.3f}ms {result['p95_ms']:>8.3f}ms "
+                  f"{result['rows_per_sec'] or 0:>12,.0f}")
+
+    if service.registry.is_loaded("ocr"):
+        service.registry.get("ocr").pool.shutdown()
+    write_results(args.output, "stages", results, args)
+    return results
+
+
+if __name__ == "__main__":
+    main()
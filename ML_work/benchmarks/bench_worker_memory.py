@@ -0,0 +1,121 @@
+"""Total memory of the multi-worker service as workers are added.
+
+Starts `serve.py` with 1, 2 and 4 workers, waits for every worker to load its
+models and answer /predict, then sums RSS, PSS and USS across the gunicorn
+master and workers. PSS splits shared pages between the processes mapping
+them, so it is the figure that shows the memory-mapped forest being shared.
+RSS counts shared pages once per process and overstates the total.
+
+The `private` mode is the old layout for comparison: no preload, and every
+worker unpickles its own sklearn forest.
+
+With --max-worker-mib the script is a check: it exits non-zero if an extra
+worker adds more PSS than that in the shared layout, so CI can catch a change
+that makes workers load private copies again.
+
+Run from ML_work/ (Linux, needs gunicorn and psutil):
+    python benchmarks/bench_worker_memory.py [--modes shared] [--max-worker-mib 40]
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import psutil
+
+SAMPLE_CLAIM = {
+    "claim_id": "CLM000001", "age": 30, "premium_amount": 20000, "sum_assured": 900000, "income": 800000,
+    "claim_date": "2025-01-10", "policy_start_date": "2024-01-01", "channel": "Bancassurance", "product_type": "ULIP"
+}
+
+MODES = {
+    "shared": ({"PREWARM_MODELS": "tabular"}, []),
+    "private": ({"PREWARM_MODELS": "tabular", "FLAT_FOREST_MAX_ROWS": "0"}, ["--no-preload"]),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post_claim(port):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/predict", data=json.dumps(SAMPLE_CLAIM).encode(),
+                                     headers={"Content-Type": "application/json"})
+    return urllib.request.urlopen(request, timeout=30).read()
+
+
+def memory(proc):
+    procs = [proc] + proc.children(recursive=True)
+    totals = {"rss": 0, "pss": 0, "uss": 0}
+    for p in procs:
+        info = p.memory_full_info()
+        for key in totals:
+            totals[key] += getattr(info, key, 0)
+    return {key: value / 2 ** 20 for key, value in totals.items()}
+
+
+def measure(workers, mode):
+    port = free_port()
+    env_overrides, flags = MODES[mode]
+    server = subprocess.Popen([sys.executable, "serve.py", "--workers", str(workers), "--bind", f"127.0.0.1:{port}"] + flags,
+                              env=dict(os.environ, **env_overrides), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 120
+        while True:
+            try:
+                post_claim(port)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise RuntimeError("service did not start")
+                time.sleep(0.25)
+
+        # Spread traffic over all workers, then wait for background pre-warming to settle
+        for _ in range(50 * workers):
+            post_claim(port)
+        proc = psutil.Process(server.pid)
+        previous = None
+        while True:
+            time.sleep(2)
+            current = memory(proc)
+            if previous and abs(current["pss"] - previous["pss"]) < 2:
+                return current
+            previous = current
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated subset of {', '.join(MODES)}")
+    parser.add_argument("--max-worker-mib", type=float, default=None,
+                        help="fail if an extra shared-layout worker adds more PSS than this")
+    args = parser.parse_args()
+
+    results = {}
+    for mode in args.modes.split(","):
+        results[mode] = {}
+        for workers in (1, 2, 4):
+            results[mode][workers] = measure(workers, mode)
+            m = results[mode][workers]
+            print(f"{mode:<8} workers={workers}  rss={m['rss']:8.1f} MiB  pss={m['pss']:8.1f} MiB  uss={m['uss']:8.1f} MiB")
+        per_worker = (results[mode][4]["pss"] - results[mode][1]["pss"]) / 3
+        print(f"{mode:<8} PSS added per extra worker: {per_worker:.1f} MiB")
+        results[mode]["pss_per_worker"] = per_worker
+
+    shared = results.get("shared")
+    if args.max_worker_mib is not None and shared and shared["pss_per_worker"] > args.max_worker_mib:
+        sys.exit(f"FAIL: each extra worker adds {shared['pss_per_worker']:.1f} MiB PSS "
+                 f"(limit {args.max_worker_mib:.1f} MiB)")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Closed-loop HTTP load test of the scoring service (main.py) and the analytics service (anamoly.py).
+
+For each scenario and concurrency level, that many client threads send
+requests back to back for --duration seconds (each sends its next request
+as soon as the previous one answers), after a --warm-up run at the same
+level whose requests are not counted. Reports p50/p95/p99 latency, throughput and
+errors per level, and writes them as JSON for `suite.py compare`.
+
+    predict          POST /predict, cycling through --claims generated claims
+    bulk_predict     POST /bulk-predict with a --bulk-rows row CSV
+    ocr_predict      POST /ocr-predict, alternating the bundled claim form PDFs
+    signature_check  POST /signature_check with the same PDFs
+    fraud_analytics  GET /api/fraud-analytics?inline=0 on the analytics service
+
+By default each service is started in its own process on a free local port
+(Werkzeug's threaded server, as `app.run` uses, without the debugger), with
+the analytics CSV, scored-claim store and job directories in a temporary
+directory; claims and the analytics CSV are generated with a fixed seed. Pass
+--main-url/--analytics-url to load an already running deployment instead,
+e.g. one started with serve.py. --server asgi starts the scoring service as
+asgi.py under uvicorn instead.
+
+--background SCENARIO:CLIENTS keeps that many clients of another scenario
+running through every level's warm-up and measurement, to see how one kind of
+traffic slows another, e.g. /predict latency while OCR requests saturate the
+document pool:
+
+    python benchmarks/load_test.py --scenarios predict --background ocr_predict:16 --server asgi
+
+Run from ML_work/:  python benchmarks/load_test.py [--scenarios predict,ocr_predict] [--concurrency 1,4,16]
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from suite import SAMPLE_PDFS, claims, summarize, write_results  # noqa: E402
+
+CONCURRENCY = (1, 4, 16)
+ANALYTICS_ROWS = 10000
+
+
+def multipart(filename, data, content_type):
+    """A multipart/form-data body with one `file` field, and its Content-Type header."""
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: {content_type}\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def build_scenarios(args):
+    """name -> (service, method, path, function of the request index returning (body, content type))."""
+    records = claims(args.claims).to_dict("records")
+    bulk_csv = claims(args.bulk_rows, date_format="%d-%m-%Y").to_csv(index=False).encode()
+    pdfs = []
+    for path in SAMPLE_PDFS:
+        with open(path, "rb") as f:
+            pdfs.append((os.path.basename(path), f.read()))
+
+    def predict_body(i):
+        return json.dumps(records[i % len(records)], default=str).encode(), "application/json"
+
+    def pdf_body(i):
+        name, data = pdfs[i % len(pdfs)]
+        return multipart(name, data, "application/pdf")
+
+    return {
+        "predict": ("main", "POST", "/predict", predict_body),
+        "bulk_predict": ("main", "POST", "/bulk-predict",
+                         lambda i: multipart("claims.csv", bulk_csv, "text/csv")),
+        "ocr_predict": ("main", "POST", "/ocr-predict", pdf_body),
+        "signature_check": ("main", "POST", "/signature_check", pdf_body),
+        "fraud_analytics": ("analytics", "GET", "/api/fraud-analytics?inline=0", lambda i: (None, None)),
+    }
+
+
+class Client:
+    """One client's HTTP connection, kept open between requests when the server allows it.
+
+    gunicorn (serve.py) keeps connections alive; Werkzeug's development
+    server closes each one after its response, so against it every request
+    also pays for TCP setup, and long runs at high rates can run out of
+    local ports held in TIME_WAIT.
+    """
+
+    def __init__(self, base_url, timeout):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self.conn = None
+
+    def send(self, method, path, body, content_type):
+        """Latency in milliseconds and HTTP status of one request; status 0 for connection errors."""
+        headers = {"Content-Type": content_type} if content_type else {}
+        start = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                self.close()
+        except (http.client.HTTPException, OSError):
+            self.close()
+            status = 0
+        return (time.perf_counter() - start) * 1000, status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def run_level(base_url, method, path, make_body, concurrency, duration, timeout):
+    """Run `concurrency` closed-loop clients for `duration` seconds; latency percentiles and throughput."""
+    started = time.perf_counter()
+    stop_at = started + duration
+    counter = itertools.count()
+    lock = threading.Lock()
+    latencies, statuses = [], {}
+
+    def client():
+        connection = Client(base_url, timeout)
+        while True:
+            with lock:
+                i = next(counter)
+            sent_at = time.perf_counter()
+            if sent_at >= stop_at:
+                connection.close()
+                return
+            body, content_type = make_body(i)
+            latency, status = connection.send(method, path, body, content_type)
+            if status == 0:
+                # Don't spin on a server that is down
+                time.sleep(0.05)
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if 200 <= status < 400:
+                    latencies.append(latency)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Requests still in flight at stop_at finish late, so throughput is over the real elapsed time
+    elapsed = max(time.perf_counter() - started, 1e-9)
+
+    result = summarize(latencies)
+    result.update({
+        "concurrency": concurrency,
+        "requests": sum(statuses.values()),
+        "errors": sum(count for status, count in statuses.items() if not 200 <= status < 400),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "requests_per_sec": len(latencies) / elapsed,
+    })
+    return result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_service(module, env, log_path, timeout=120):
+    """Start `module`.app in a child process; returns (process, base URL) once it answers."""
+    port = free_port()
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", module, "--port", str(port)],
+                                   env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{module}.py exited with code {process.returncode}; see {log_path}")
+        probe = Client(url, timeout=1)
+        _, status = probe.send("GET", "/", None, None)
+        probe.close()
+        # Any HTTP answer, even a 404, means the server is accepting requests
+        if status:
+            return process, url
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{module}.py did not start within {timeout}s; see {log_path}")
+
+
+def serve(module, port):
+    import importlib
+
+    app = importlib.import_module(module).app
+    if module == "asgi":
+        import uvicorn
+        uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+    else:
+        from werkzeug.serving import make_server
+        make_server("127.0.0.1", port, app, threaded=True).serve_forever()
+
+
+def print_result(name, level, result):
+    if result["n"]:
+        print(f"{name:<16} {level:>7} {result['requests_per_sec']:>9.1f} {result['p50_ms']:>8.1f}ms "
+              f"{result['p95_ms']:>8.1f}ms {result['p99_ms']:>8.1f}ms {result['errors']:>7}")
+    else:
+        print(f"{name:<16} {level:>7} {'-':>9} {'-':>10} {'-':>10} {'-':>10} {result['errors']:>7}  "
+              f"statuses {result['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="predict,bulk_predict,ocr_predict,signature_check,fraud_analytics")
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY)),
+                        help="comma-separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per level")
+    parser.add_argument("--warm-up", type=float, default=2.0,
+                        help="seconds per level before measuring; a request in flight is always finished")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--claims", type=int, default=5000, help="distinct claims cycled through by /predict")
+    parser.add_argument("--bulk-rows", type=int, default=1000)
+    parser.add_argument("--main-url", help="load a running scoring service instead of starting one")
+    parser.add_argument("--analytics-url", help="load a running analytics service instead of starting one")
+    parser.add_argument("--server", choices=["wsgi", "asgi"], default="wsgi",
+                        help="start the scoring service as main.py under Werkzeug or asgi.py under uvicorn")
+    parser.add_argument("--background", help="SCENARIO:CLIENTS run alongside every measured level")
+    parser.add_argument("--output", default=f"bench_results/load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return None
+
+    scenarios = build_scenarios(args)
+    names = args.scenarios.split(",")
+    unknown = set(names) - set(scenarios)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(",")]
+    background = None
+    if args.background:
+        name, _, clients = args.background.partition(":")
+        if name not in scenarios or not clients.isdigit():
+            parser.error("--background takes SCENARIO:CLIENTS, e.g. ocr_predict:16")
+        background = (name, int(clients))
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    urls = {"main": args.main_url, "analytics": args.analytics_url}
+    processes = []
+    try:
+        needed = {scenarios[name][0] for name in names + ([background[0]] if background else [])}
+        if "main" in needed and not urls["main"]:
+            env = {"SCORED_CLAIMS_PATH": os.path.join(workdir, "scored"),
+                   "BULK_JOBS_DIR": os.path.join(workdir, "bulk_jobs")}
+            module = "asgi" if args.server == "asgi" else "main"
+            process, urls["main"] = start_service(module, env, os.path.join(workdir, "main.log"))
+            processes.append(process)
+        if "analytics" in needed and not urls["analytics"]:
+            data_path = os.path.join(workdir, "analytics_claims.csv")
+            claims(ANALYTICS_ROWS).to_csv(data_path, index=False)
+            env = {"ANALYTICS_DATA_PATH": data_path, "PLOT_STORE_DIR": os.path.join(workdir, "plot_store")}
+            process, urls["analytics"] = start_service("anamoly", env, os.path.join(workdir, "analytics.log"))
+            processes.append(process)
+
+        results = {}
+        print(f"{'scenario':<16} {'clients':>7} {'req/sec':>9} {'p50':>10} {'p95':>10} {'p99':>10} {'errors':>7}")
+        for name in names:
+            service, method, path, make_body = scenarios[name]
+            results[name] = {}
+            for level in levels:
+                if background:
+                    # Started with the warm-up, so the background traffic is at full load when measuring starts
+                    bg_name, bg_clients = background
+                    bg_service, bg_method, bg_path, bg_body = scenarios[bg_name]
+                    bg_result = {}
+                    bg_thread = threading.Thread(target=lambda: bg_result.update(run_level(
+                        urls[bg_service], bg_method, bg_path, bg_body, bg_clients,
+                        args.warm_up + args.duration, args.timeout)), daemon=True)
+                    bg_thread.start()
+                # Not counted: loads models, fills caches and lets the server's threads start
+                run_level(urls[service], method, path, make_body, level, args.warm_up, args.timeout)
+                result = run_level(urls[service], method, path, make_body, level, args.duration, args.timeout)
+                results[name][f"c{level}"] = result
+                print_result(name, level, result)
+                if background:
+                    bg_thread.join()
+                    result["background"] = {"scenario": bg_name, **bg_result}
+                    print_result(f"  +{bg_name}", bg_clients, bg_result)
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print(f"Server logs and state in {workdir}")
+    write_results(args.output, "load", results, args)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Shared inputs and result files for bench_stages.py and load_test.py, and a comparison of two runs.
+
+    python benchmarks/suite.py compare results/before.json results/after.json
+
+Inputs are fixed: claims come from generate.generate_shard with SEED and
+AS_OF, and documents are the claim form PDFs bundled in ML_work/, so two runs
+of a benchmark measure the same work. Results are written as JSON together
+with the machine and git commit they were measured on.
+
+Run from ML_work/.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from generate import generate_shard  # noqa: E402
+
+SEED = 20240601
+AS_OF = datetime(2025, 1, 1)
+SAMPLE_PDFS = ["insurance_claim_form.pdf", "Insurance_Claim_Form1.pdf"]
+
+
+def claims(rows, seed=SEED, date_format="%Y-%m-%d"):
+    """Generated claims without labels, with dates as strings in `date_format`."""
+    df = generate_shard(0, rows, seed, AS_OF).drop(columns="fraud_category")
+    for col in ["claim_date", "policy_start_date"]:
+        df[col] = df[col].dt.strftime(date_format)
+    return df
+
+
+def summarize(latencies_ms):
+    """Count, mean and percentiles of a list of latencies in milliseconds."""
+    if not latencies_ms:
+        return {"n": 0}
+    values = np.asarray(latencies_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"n": len(values), "mean_ms": float(values.mean()), "p50_ms": float(p50), "p95_ms": float(p95),
+            "p99_ms": float(p99), "max_ms": float(values.max())}
+
+
+def time_calls(fn, min_seconds=0.5, min_calls=5, max_calls=10000):
+    """Latency of every call to fn after one warm-up call, until both minimums are reached."""
+    fn()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_calls and (len(timings) < min_calls or time.perf_counter() - started < min_seconds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "git_commit": commit, "seed": SEED, "as_of": AS_OF.isoformat()}
+
+
+def write_results(path, benchmark, results, args=None):
+    """Write one run's results, with its arguments and environment, as JSON."""
+    payload = {"benchmark": benchmark, "run_at": datetime.now().isoformat(), "environment": environment(),
+               "args": vars(args) if args is not None else {}, "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2, default=str)
+    print(f"Results written to {path}")
+
+
+def _flatten(results, prefix=""):
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and key.endswith(("_ms", "_per_sec")):
+            yield name, value
+
+
+def compare(before_path, after_path):
+    """Print every latency and rate present in both runs with its relative change."""
+    with open(before_path) as f:
+        before = dict(_flatten(json.load(f)["results"]))
+    with open(after_path) as f:
+        after = dict(_flatten(json.load(f)["results"]))
+
+    print(f"{'metric':<56} {'before':>12} {'after':>12} {'change':>8}")
+    for name in (name for name in before if name in after):
+        old, new = before[name], after[name]
+        change = f"{(new - old) / old * 100:+7.1f}%" if old else "-"
+        print(f"{name:<56} {old:>12.3f} {new:>12.3f} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subparsers.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    args = parser.parse_args()
+    compare(args.before, args.after)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process servers only
+    fcntl = None
+
+
+class BulkJobManager:
+    """Background bulk-scoring jobs with on-disk checkpoints.
+
+    Each job lives in `<jobs_dir>/<job_id>/`: the uploaded `input.csv`, a
+    `job.json` manifest, and one `part-NNNNN.csv` per scored chunk. A part is
+    written to a temp file and renamed into place before the manifest records it,
+    so a restarted service resumes after the last recorded part instead of
+    rescoring the whole file. Each chunk is scored by `score_fn(chunk, batch_id)`,
+    where `batch_id` names the job and part. When several worker processes
+    share `jobs_dir`, an advisory lock on `job.lock` makes sure only one of
+    them runs each job.
+
+    A finished job's directory is removed by `delete` once its parts have been
+    collected, or by the sweep that runs on every submit once it has been
+    finished for `retention_seconds`.
+    """
+
+    def __init__(self, score_fn, jobs_dir="bulk_jobs", workers=2, chunk_size=10000, retention_seconds=86400.0):
+        self.score_fn = score_fn
+        self.jobs_dir = jobs_dir
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk-job")
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _manifest_path(self, job_id):
+        return os.path.join(self._job_dir(job_id), "job.json")
+
+    def part_path(self, job_id, part):
+        return os.path.join(self._job_dir(job_id), f"part-{part:05d}.csv")
+
+    def _read_manifest(self, job_id):
+        with open(self._manifest_path(job_id)) as f:
+            return json.load(f)
+
+    def _write_manifest(self, job_id, manifest):
+        path = self._manifest_path(job_id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def submit(self, upload, filename):
+        """Persist an uploaded CSV and queue it for scoring. Returns the job ID."""
+        self.sweep()
+        job_id = uuid.uuid4().hex
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+
+        input_path = os.path.join(job_dir, "input.csv")
+        with open(input_path, "wb") as f:
+            shutil.copyfileobj(upload, f)
+        with open(input_path, "rb") as f:
+            rows_total = max(sum(1 for _ in f) - 1, 0)
+
+        self._write_manifest(job_id, {
+            "job_id": job_id,
+            "filename": filename,
+            "state": "queued",
+            "rows_total": rows_total,
+            "parts": [],
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None
+        })
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def resume(self):
+        """Re-queue jobs that were queued or running when the service last stopped."""
+        resumed = []
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            if not os.path.exists(self._manifest_path(job_id)):
+                continue
+            if self._read_manifest(job_id)["state"] in ("queued", "running"):
+                self._executor.submit(self._run, job_id)
+                resumed.append(job_id)
+        return resumed
+
+    def _claim(self, job_id):
+        """Take the job's advisory lock; None if another process already holds it."""
+        lock = open(os.path.join(self._job_dir(job_id), "job.lock"), "w")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                return None
+        return lock
+
+    def _run(self, job_id):
+        lock = self._claim(job_id)
+        if lock is None:
+            return
+        try:
+            self._score(job_id)
+        finally:
+            lock.close()
+
+    def _score(self, job_id):
+        manifest = self._read_manifest(job_id)
+        if manifest["state"] not in ("queued", "running"):
+            return
+        parts = manifest["parts"]
+        rows_done = sum(parts)
+        manifest["state"] = "running"
+        self._write_manifest(job_id, manifest)
+
+        started = time.time()
+        rows_this_run = 0
+        try:
+            # Skip rows already checkpointed by an earlier run
+            chunks = pd.read_csv(
+                os.path.join(self._job_dir(job_id), "input.csv"),
+                chunksize=self.chunk_size,
+                skiprows=range(1, rows_done + 1)
+            )
+            for chunk in chunks:
+                path = self.part_path(job_id, len(parts))
+                # Named by job and part, so a chunk rescored after a restart replaces what it stored before
+                self.score_fn(chunk, f"{job_id}-{len(parts):05d}").to_csv(path + ".tmp", index=False)
+                os.replace(path + ".tmp", path)
+
+                parts.append(len(chunk))
+                rows_this_run += len(chunk)
+                manifest["rows_per_sec"] = rows_this_run / max(time.time() - started, 1e-9)
+                self._write_manifest(job_id, manifest)
+
+            manifest["state"] = "done"
+        except Exception as e:
+            print(f"Bulk job {job_id} failed: {str(e)}")
+            manifest["state"] = "failed"
+            manifest["error"] = str(e)
+
+        manifest["finished_at"] = time.time()
+        self._write_manifest(job_id, manifest)
+
+    def _exists(self, job_id):
+        return re.fullmatch(r"[0-9a-f]{32}", job_id) is not None and os.path.exists(self._manifest_path(job_id))
+
+    def delete(self, job_id):
+        """Remove a finished job and its files. None if it does not exist, False if it is still queued or running."""
+        if not self._exists(job_id):
+            return None
+        # Holding the job's lock keeps a worker in this or another process from starting it meanwhile
+        lock = self._claim(job_id)
+        if lock is None:
+            return False
+        try:
+            if self._read_manifest(job_id)["state"] in ("queued", "running"):
+                return False
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+        finally:
+            lock.close()
+        return True
+
+    def sweep(self):
+        """Delete jobs finished more than `retention_seconds` ago; returns their IDs."""
+        if self.retention_seconds is None:
+            return []
+        cutoff = time.time() - self.retention_seconds
+        removed = []
+        for job_id in os.listdir(self.jobs_dir):
+            try:
+                finished_at = self._read_manifest(job_id)["finished_at"]
+            except (OSError, ValueError, KeyError):
+                continue
+            if finished_at is not None and finished_at < cutoff and self.delete(job_id):
+                removed.append(job_id)
+        return removed
+
+    def status(self, job_id):
+        """Progress for a job, or None if it does not exist."""
+        if not self._exists(job_id):
+            return None
+        manifest = self._read_manifest(job_id)
+        rows_scored = sum(manifest["parts"])
+        rows_per_sec = manifest.get("rows_per_sec") or 0.0
+        remaining = max(manifest["rows_total"] - rows_scored, 0)
+
+        return {
+            "job_id": job_id,
+            "filename": manifest["filename"],
+            "state": manifest["state"],
+            "error": manifest["error"],
+            "rows_total": manifest["rows_total"],
+            "rows_scored": rows_scored,
+            "rows_per_sec": round(rows_per_sec, 1),
+            "eta_seconds": round(remaining / rows_per_sec, 1) if rows_per_sec and manifest["state"] == "running" else None,
+            "parts": len(manifest["parts"])
+        }
@@ -0,0 +1,79 @@
+import numpy as np
+
+# Probabilities are clipped away from 0 and 1 before computing log loss
+LOG_LOSS_EPS = 1e-15
+
+# Calibrator file inside a model bundle
+CALIBRATION_FILE = "calibration.npz"
+
+
+class ProbabilityCalibrator:
+    """Per-class isotonic calibration of forest probabilities, stored as plain arrays.
+
+    Fitted one-vs-rest on held-out rows, as sklearn's CalibratedClassifierCV
+    does for multiclass isotonic calibration. Each class keeps only the knots
+    of its step function, padded into one (classes x knots) table, so
+    applying it is one `np.interp` per class over the whole batch followed by
+    a renormalisation. Serving needs neither sklearn nor the calibration data.
+    """
+
+    def __init__(self, x_knots, y_knots, n_knots):
+        self.x_knots = x_knots
+        self.y_knots = y_knots
+        self.n_knots = n_knots
+
+    @classmethod
+    def fit(cls, proba, y):
+        """Fit on uncalibrated probabilities `proba` (rows x classes) and encoded labels `y`."""
+        from sklearn.isotonic import IsotonicRegression
+
+        knots = []
+        for k in range(proba.shape[1]):
+            iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip")
+            iso.fit(proba[:, k], (y == k).astype(np.float64))
+            knots.append((iso.X_thresholds_, iso.y_thresholds_))
+
+        width = max(len(x) for x, _ in knots)
+        x_knots = np.zeros((len(knots), width))
+        y_knots = np.zeros((len(knots), width))
+        for k, (x, y_k) in enumerate(knots):
+            # Padding repeats the last knot, so np.interp sees a flat tail
+            x_knots[k] = np.pad(x, (0, width - len(x)), mode="edge")
+            y_knots[k] = np.pad(y_k, (0, width - len(y_k)), mode="edge")
+        return cls(x_knots, y_knots, np.asarray([len(x) for x, _ in knots]))
+
+    def transform(self, proba):
+        calibrated = np.empty_like(proba, dtype=np.float64)
+        for k in range(proba.shape[1]):
+            n = self.n_knots[k]
+            calibrated[:, k] = np.interp(proba[:, k], self.x_knots[k, :n], self.y_knots[k, :n])
+        total = calibrated.sum(axis=1, keepdims=True)
+        # Rows every calibrator maps to zero fall back to the uncalibrated probabilities
+        empty = total[:, 0] == 0.0
+        calibrated[empty] = proba[empty]
+        total[empty] = 1.0
+        return calibrated / total
+
+    def save(self, path):
+        np.savez(path, x_knots=self.x_knots, y_knots=self.y_knots, n_knots=self.n_knots)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays["x_knots"], arrays["y_knots"], arrays["n_knots"])
+
+
+def probability_metrics(proba, y):
+    """Multiclass log loss and Brier score of `proba` against encoded labels `y`."""
+    onehot = np.eye(proba.shape[1])[y]
+    true_class = np.clip(proba[np.arange(len(y)), y], LOG_LOSS_EPS, 1.0)
+    return {
+        "log_loss": float(-np.log(true_class).mean()),
+        "brier": float(((proba - onehot) ** 2).sum(axis=1).mean())
+    }
+
+
+def risk_levels(fraud_probability, high_threshold, medium_threshold):
+    """Risk level (High, Medium or Low) for each fraud probability, in one vectorized pass."""
+    return np.select([fraud_probability >= high_threshold, fraud_probability >= medium_threshold],
+                     ["High", "Medium"], "Low")
@@ -0,0 +1,170 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from features import parse_dates
+
+_CATEGORY = pa.dictionary(pa.int32(), pa.string())
+
+# Typed columns of a stored claim; scoring outputs are null for claims that were never scored
+CLAIM_SCHEMA = pa.schema([
+    ("claim_id", pa.string()),
+    ("policy_start_date", pa.timestamp("us")),
+    ("claim_date", pa.timestamp("us")),
+    ("age", pa.int32()),
+    ("premium_amount", pa.float64()),
+    ("sum_assured", pa.float64()),
+    ("income", pa.float64()),
+    ("channel", _CATEGORY),
+    ("product_type", _CATEGORY),
+    ("fraud_category", _CATEGORY),
+    ("fraud_probability", pa.float64()),
+    ("risk_level", _CATEGORY),
+    ("status", _CATEGORY),
+    ("model_version", _CATEGORY),
+])
+DATE_COLUMNS = ["policy_start_date", "claim_date"]
+PARTITION_COLUMN = "claim_month"
+
+# Rows parsed per step when importing a CSV
+IMPORT_CHUNK_ROWS = 500_000
+
+
+class ClaimStore:
+    """Claims as typed Parquet files partitioned by claim month.
+
+    Files live under `<root>/claim_month=YYYY-MM/`. Dates are stored as
+    timestamps and categorical columns dictionary-encoded, so loading skips
+    text and date parsing entirely. `load` reads only the requested columns,
+    and a date range prunes whole month directories before any row-level
+    filtering. Each `append` writes new uniquely named files, so concurrent
+    writers never touch each other's output.
+    """
+
+    def __init__(self, root="claim_store"):
+        self.root = root
+
+    def exists(self):
+        return os.path.isdir(self.root) and any(
+            name.startswith(f"{PARTITION_COLUMN}=") for name in os.listdir(self.root))
+
+    @staticmethod
+    def to_table(df, dayfirst=False):
+        """Convert a claims DataFrame to CLAIM_SCHEMA; columns it lacks are stored as nulls."""
+        arrays = []
+        for field in CLAIM_SCHEMA:
+            if field.name not in df.columns:
+                arrays.append(pa.nulls(len(df), field.type))
+                continue
+            values = df[field.name]
+            if field.name in DATE_COLUMNS:
+                values = parse_dates(values, dayfirst=dayfirst)
+            elif field.name == "age":
+                values = pd.to_numeric(values).astype("Int32")
+            elif pa.types.is_floating(field.type):
+                values = pd.to_numeric(values).astype(np.float64)
+            else:
+                values = values.astype("string")
+            arrays.append(pa.array(values, from_pandas=True).cast(field.type))
+
+        # Format each distinct month once instead of every row
+        claim_month = arrays[CLAIM_SCHEMA.get_field_index("claim_date")].to_numpy(zero_copy_only=False)
+        months, inverse = np.unique(claim_month.astype("datetime64[M]"), return_inverse=True)
+        labels = np.array([None if np.isnat(m) else str(m) for m in months], dtype=object)
+        return pa.Table.from_arrays(arrays + [pa.array(labels[inverse], type=pa.string())],
+                                    schema=CLAIM_SCHEMA.append(pa.field(PARTITION_COLUMN, pa.string())))
+
+    def append(self, df, dayfirst=False, name=None):
+        """Write a DataFrame of claims into the store; returns the number of rows written.
+
+        Files are named after `name` when one is given, so writing the same batch again replaces it.
+        """
+        if not len(df):
+            return 0
+        ds.write_dataset(
+            self.to_table(df, dayfirst=dayfirst),
+            self.root,
+            format="parquet",
+            partitioning=[PARTITION_COLUMN],
+            partitioning_flavor="hive",
+            basename_template=f"part-{name or uuid.uuid4().hex}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        return len(df)
+
+    def import_csv(self, path, dayfirst=False, chunk_rows=IMPORT_CHUNK_ROWS):
+        """Load a claims CSV into the store chunk by chunk; returns the number of rows imported."""
+        rows = 0
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            rows += self.append(chunk, dayfirst=dayfirst)
+        return rows
+
+    def files(self):
+        """Paths of every Parquet file in the store, sorted."""
+        paths = []
+        for directory, _, names in os.walk(self.root):
+            paths += [os.path.join(directory, name) for name in names if name.endswith(".parquet")]
+        return sorted(paths)
+
+    def _dataset(self, files=None):
+        return ds.dataset(files if files is not None else self.root, format="parquet",
+                          partitioning="hive", partition_base_dir=self.root,
+                          schema=CLAIM_SCHEMA.append(pa.field(PARTITION_COLUMN, pa.string())))
+
+    def scan(self, columns=None, start=None, end=None, files=None):
+        """Arrow table of claims with claim_date in [start, end), restricted to `columns` (and to `files`)."""
+        dataset = self._dataset(files)
+        condition = None
+        if start is not None:
+            start = pd.Timestamp(start)
+            condition = ((ds.field(PARTITION_COLUMN) >= start.strftime("%Y-%m"))
+                         & (ds.field("claim_date") >= pa.scalar(start.to_datetime64(), pa.timestamp("us"))))
+        if end is not None:
+            end = pd.Timestamp(end)
+            before_end = ((ds.field(PARTITION_COLUMN) <= end.strftime("%Y-%m"))
+                          & (ds.field("claim_date") < pa.scalar(end.to_datetime64(), pa.timestamp("us"))))
+            condition = before_end if condition is None else condition & before_end
+        return dataset.to_table(columns=columns or CLAIM_SCHEMA.names, filter=condition)
+
+    def load(self, columns=None, start=None, end=None, files=None):
+        """Same as `scan`, as a DataFrame with categorical columns."""
+        return self.scan(columns, start, end, files).to_pandas()
+
+    def iter_batches(self, columns=None, batch_rows=IMPORT_CHUNK_ROWS):
+        """Stream the store as DataFrames of up to `batch_rows` rows, for data larger than memory."""
+        scanner = self._dataset().scanner(columns=columns or CLAIM_SCHEMA.names, batch_size=batch_rows)
+        for batch in scanner.to_batches():
+            if batch.num_rows:
+                yield batch.to_pandas()
+
+
+def load_claims(columns=None, store_path="claim_store/claims", csv_path="insurance_claims.csv"):
+    """Claims from the columnar store if it has been imported, otherwise from the CSV."""
+    store = ClaimStore(store_path)
+    if store.exists():
+        return store.load(columns)
+    return pd.read_csv(csv_path, usecols=columns)
+
+
+def iter_claims(columns=None, chunk_rows=IMPORT_CHUNK_ROWS, store_path="claim_store/claims",
+                csv_path="insurance_claims.csv"):
+    """`load_claims` in chunks of up to `chunk_rows` rows."""
+    store = ClaimStore(store_path)
+    if store.exists():
+        return store.iter_batches(columns, chunk_rows)
+    return pd.read_csv(csv_path, usecols=columns, chunksize=chunk_rows)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Import a claims CSV into the columnar claim store.")
+    parser.add_argument("csv", nargs="?", default="insurance_claims.csv")
+    parser.add_argument("--store", default="claim_store/claims")
+    parser.add_argument("--dayfirst", action="store_true", help="dates are DD-MM-YYYY")
+    args = parser.parse_args()
+    print(f"Imported {ClaimStore(args.store).import_csv(args.csv, dayfirst=args.dayfirst)} claims into {args.store}")
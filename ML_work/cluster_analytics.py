@@ -0,0 +1,287 @@
+import hashlib
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+ANALYSIS_FEATURES = ['age', 'premium_amount', 'sum_assured', 'income', 'channel', 'product_type']
+CATEGORICAL_FEATURES = ['channel', 'product_type']
+
+# Bytes read per step when re-hashing the part of the CSV that was already analysed
+HASH_BLOCK_BYTES = 1 << 20
+
+
+class ClusterModel:
+    """Encoders, scaler, k-means and 2-D PCA fitted over the analysis features.
+
+    `fit` fits everything from scratch. `partial_fit` folds new rows into the
+    existing clusters and projection with MiniBatchKMeans/IncrementalPCA
+    instead of refitting; it refuses (returns None) when the new rows have a
+    category the encoders have not seen or when they have drifted too far
+    from the fitted clusters, and the caller then refits. Drift is how much
+    the mean squared distance to the nearest centre of all rows added since
+    the last full fit exceeds that of the rows used for the fit.
+    """
+
+    def __init__(self, n_clusters=6, drift_threshold=0.25, random_state=42):
+        self.n_clusters = n_clusters
+        self.drift_threshold = drift_threshold
+        self.random_state = random_state
+        self.encoders = {}
+        self.scaler = None
+        self.kmeans = None
+        self.pca = None
+        self.baseline_inertia = None
+        self.pending = np.empty((0, len(ANALYSIS_FEATURES)))
+        self.last_drift = 0.0
+
+    def encode(self, df):
+        """Analysis features with categoricals label-encoded; None if a category is unseen."""
+        encoded = df[ANALYSIS_FEATURES].copy()
+        for column in CATEGORICAL_FEATURES:
+            classes = self.encoders[column].classes_
+            codes = pd.Index(classes).get_indexer(encoded[column])
+            if (codes < 0).any():
+                return None
+            encoded[column] = codes
+        return encoded
+
+    def fit(self, df):
+        encoded = df[ANALYSIS_FEATURES].copy()
+        for column in CATEGORICAL_FEATURES:
+            self.encoders[column] = LabelEncoder()
+            encoded[column] = self.encoders[column].fit_transform(encoded[column])
+
+        self.scaler = StandardScaler()
+        scaled = self.scaler.fit_transform(encoded)
+        self.kmeans = MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.random_state,
+                                      n_init=10, batch_size=2048)
+        self.kmeans.fit(scaled)
+        self.pca = IncrementalPCA(n_components=2, batch_size=max(len(scaled), 2))
+        self.pca.fit(scaled)
+
+        self.baseline_inertia = self._mean_sq_distance(scaled)
+        self.pending = np.empty((0, scaled.shape[1]))
+        return encoded, scaled
+
+    def partial_fit(self, df):
+        """Fold new rows in; returns (encoded, scaled), or None if a full refit is needed."""
+        encoded = self.encode(df)
+        if encoded is None:
+            return None
+        scaled = self.scaler.transform(encoded)
+
+        pending = np.vstack([self.pending, scaled])
+        self.last_drift = self._mean_sq_distance(pending) / max(self.baseline_inertia, 1e-12) - 1.0
+        if self.last_drift > self.drift_threshold:
+            return None
+
+        self.pending = pending
+        self.kmeans.partial_fit(scaled)
+        # IncrementalPCA needs at least n_components rows per update
+        if len(scaled) >= self.pca.n_components:
+            self.pca.partial_fit(scaled)
+        return encoded, scaled
+
+    def _mean_sq_distance(self, scaled):
+        return float((np.min(self.kmeans.transform(scaled), axis=1) ** 2).mean())
+
+    def project(self, scaled):
+        """Cluster labels and PCA coordinates for every row under the current model."""
+        return self.kmeans.predict(scaled), self.pca.transform(scaled)
+
+
+def analysis_frame(encoded, clusters, reduced):
+    frame = encoded.copy()
+    frame["cluster"] = clusters
+    frame["pca1"] = reduced[:, 0]
+    frame["pca2"] = reduced[:, 1]
+    return frame
+
+
+def analyze_frame(df, n_clusters=6):
+    """One-off full analysis of an uploaded claims frame."""
+    model = ClusterModel(n_clusters=n_clusters)
+    encoded, scaled = model.fit(df)
+    return analysis_frame(encoded, *model.project(scaled))
+
+
+class CsvClusterAnalytics:
+    """Cluster analysis of a claims CSV that is kept fitted between requests.
+
+    The file's size and mtime are checked on every `refresh`; when they are
+    unchanged the cached analysis frame is returned without reading the file.
+    Otherwise the previously analysed bytes are re-hashed: if they still
+    match, the file was appended to and only the new rows are parsed and
+    folded in with `ClusterModel.partial_fit`; if not, the file was rewritten
+    and is analysed from scratch. `fingerprint` is the SHA-256 of the analysed
+    content, so it can key caches of anything derived from the analysis.
+    """
+
+    def __init__(self, path, n_clusters=6, drift_threshold=0.25):
+        self.path = path
+        self.model = ClusterModel(n_clusters=n_clusters, drift_threshold=drift_threshold)
+        self.fingerprint = None
+        self.frame = None
+        self.full_fits = 0
+        self.incremental_updates = 0
+        self.last_refresh_seconds = None
+        self._stat = None
+        self._offset = 0
+        self._hasher = None
+        self._columns = None
+        self._encoded = None
+        self._scaled = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Bring the analysis up to date with the file; returns (fingerprint, frame)."""
+        with self._lock:
+            stat = os.stat(self.path)
+            if self._stat == (stat.st_size, stat.st_mtime_ns):
+                return self.fingerprint, self.frame
+
+            started = time.perf_counter()
+            with open(self.path, "rb") as f:
+                if self._hasher is not None and stat.st_size >= self._offset and self._prefix_matches(f):
+                    self._append(f.read())
+                else:
+                    f.seek(0)
+                    self._load(f.read())
+            self._stat = (stat.st_size, stat.st_mtime_ns)
+            self.last_refresh_seconds = round(time.perf_counter() - started, 4)
+            return self.fingerprint, self.frame
+
+    def _prefix_matches(self, f):
+        hasher = hashlib.sha256()
+        remaining = self._offset
+        while remaining:
+            block = f.read(min(HASH_BLOCK_BYTES, remaining))
+            if not block:
+                return False
+            hasher.update(block)
+            remaining -= len(block)
+        return hasher.digest() == self._hasher.digest()
+
+    @staticmethod
+    def _complete_lines(data):
+        # A writer may be mid-row; leave a trailing partial line for the next refresh
+        return data[:data.rfind(b"\n") + 1]
+
+    def _load(self, data):
+        data = self._complete_lines(data)
+        df = pd.read_csv(io.BytesIO(data))
+        self._columns = list(df.columns)
+        self._hasher = hashlib.sha256(data)
+        self._offset = len(data)
+        self._fit(df)
+
+    def _fit(self, df):
+        self._encoded, self._scaled = self.model.fit(df)
+        self.full_fits += 1
+        self._publish()
+
+    def _append(self, data):
+        data = self._complete_lines(data)
+        if not data:
+            return
+        self._hasher.update(data)
+        self._offset += len(data)
+        self._fold_in(pd.read_csv(io.BytesIO(data), header=None, names=self._columns))
+
+    def _fold_in(self, new_rows):
+        update = self.model.partial_fit(new_rows)
+        if update is None:
+            df = pd.concat([self._encoded_source(), new_rows[ANALYSIS_FEATURES]], ignore_index=True)
+            self._fit(df)
+            return
+        encoded, scaled = update
+        self._encoded = pd.concat([self._encoded, encoded], ignore_index=True)
+        self._scaled = np.vstack([self._scaled, scaled])
+        self.incremental_updates += 1
+        self._publish()
+
+    def _encoded_source(self):
+        # Undo the label encoding so a full refit sees the raw categories again
+        source = self._encoded.copy()
+        for column in CATEGORICAL_FEATURES:
+            source[column] = self.model.encoders[column].classes_[source[column].to_numpy()]
+        return source
+
+    def _publish(self):
+        self.fingerprint = self._hasher.hexdigest()
+        self.frame = analysis_frame(self._encoded, *self.model.project(self._scaled))
+
+    def stats(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "rows": 0 if self.frame is None else len(self.frame),
+            "full_fits": self.full_fits,
+            "incremental_updates": self.incremental_updates,
+            "rows_since_full_fit": len(self.model.pending),
+            "last_drift": round(self.model.last_drift, 4),
+            "drift_threshold": self.model.drift_threshold,
+            "last_refresh_seconds": self.last_refresh_seconds
+        }
+
+
+class StoreClusterAnalytics(CsvClusterAnalytics):
+    """The same kept-fitted cluster analysis over a `ClaimStore` instead of a CSV.
+
+    Only the analysis columns are read, restricted to claims dated in
+    [start, end) so month partitions outside the range are never opened.
+    `ClaimStore.append` only ever adds new files, so when every file seen at
+    the last `refresh` is unchanged just the new files are read and folded
+    in; a file that changed or disappeared means the store was rewritten and
+    it is analysed from scratch. `fingerprint` hashes the file listing.
+    """
+
+    def __init__(self, root, start=None, end=None, n_clusters=6, drift_threshold=0.25):
+        super().__init__(root, n_clusters=n_clusters, drift_threshold=drift_threshold)
+        # pyarrow is only needed once analytics are served from the store
+        from claim_store import ClaimStore
+        self.store = ClaimStore(root)
+        self.start = start
+        self.end = end
+        self._files = None
+
+    def refresh(self):
+        """Bring the analysis up to date with the store; returns (fingerprint, frame)."""
+        with self._lock:
+            files = {}
+            for path in self.store.files():
+                stat = os.stat(path)
+                files[path] = (stat.st_size, stat.st_mtime_ns)
+            if files == self._files:
+                return self.fingerprint, self.frame
+
+            started = time.perf_counter()
+            self._hasher = hashlib.sha256(repr((sorted(files.items()), self.start, self.end)).encode())
+            fitted = self.frame is not None and len(self.frame)
+            if fitted and all(files.get(path) == seen for path, seen in self._files.items()):
+                new_rows = self._read(sorted(set(files) - set(self._files)))
+                if len(new_rows):
+                    self._fold_in(new_rows)
+            else:
+                df = self._read(None)
+                if len(df):
+                    self._fit(df)
+                else:
+                    # Nothing dated in range yet; the caller reports there is no data
+                    self.fingerprint, self.frame = self._hasher.hexdigest(), pd.DataFrame()
+            self._files = files
+            self.last_refresh_seconds = round(time.perf_counter() - started, 4)
+            return self.fingerprint, self.frame
+
+    def _read(self, files):
+        df = self.store.load(ANALYSIS_FEATURES, self.start, self.end, files)
+        # Dictionary-encoded columns arrive as pandas categoricals; the encoders expect plain labels
+        for column in CATEGORICAL_FEATURES:
+            df[column] = df[column].astype(object)
+        return df
@@ -0,0 +1,9 @@
+from lru_cache import LRUCache
+
+
+class DocumentCache(LRUCache):
+    """LRU cache of rasterized pages and OCR text, keyed by the PDF content hash.
+
+    Lets /verify-document, /ocr-predict and /signature_check share one
+    rasterization + OCR pass for the same uploaded file.
+    """
@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# Column order the scaler and model were trained on
+FEATURE_COLUMNS = ["age", "premium_amount", "sum_assured", "income", "channel", "product_type", "claim_duration"]
+NUMERIC_COLUMNS = ["age", "premium_amount", "sum_assured", "income"]
+# Fields a single claim must carry; claim_duration is derived from the two dates
+RECORD_FIELDS = NUMERIC_COLUMNS + ["channel", "product_type", "claim_date", "policy_start_date"]
+
+
+def _parse_fixed_width_dates(values, dayfirst):
+    """Parse uniform DD-MM-YYYY (dayfirst) or YYYY-MM-DD strings with array arithmetic.
+
+    Returns None when any value does not fit the layout so the caller can fall back to pandas.
+    """
+    try:
+        text = np.asarray(values, dtype=str)
+    except (TypeError, ValueError):
+        return None
+    if text.ndim != 1 or not len(text) or text.dtype.itemsize != 40 or (np.char.str_len(text) != 10).any():
+        return None
+    try:
+        b = text.astype("S10").view(np.uint8).reshape(-1, 10)
+    except UnicodeEncodeError:
+        return None
+
+    seps, day, month, year = ((2, 5), (0, 2), (3, 5), (6, 10)) if dayfirst else ((4, 7), (8, 10), (5, 7), (0, 4))
+    if not (b[:, seps] == ord("-")).all():
+        return None
+    digits = b.astype(np.int64) - ord("0")
+    digit_cols = [i for i in range(10) if i not in seps]
+    if ((digits[:, digit_cols] < 0) | (digits[:, digit_cols] > 9)).any():
+        return None
+
+    def number(span):
+        out = np.zeros(len(b), dtype=np.int64)
+        for i in range(*span):
+            out = out * 10 + digits[:, i]
+        return out
+
+    d, m, y = number(day), number(month), number(year)
+    if ((m < 1) | (m > 12) | (d < 1)).any():
+        return None
+    months = (y - 1970) * 12 + (m - 1)
+    dates = months.astype("datetime64[M]") + (d - 1).astype("timedelta64[D]")
+    # Days past the end of the month roll into the next one
+    if (dates.astype("datetime64[M]") != months.astype("datetime64[M]")).any():
+        return None
+    return dates.astype("datetime64[ns]")
+
+
+def parse_dates(values, dayfirst=False):
+    """Vectorized date parsing to datetime64[ns]; unparseable values become NaT."""
+    # Columns from the claim store are already typed
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return np.asarray(values, dtype="datetime64[ns]")
+    fixed = _parse_fixed_width_dates(values, dayfirst)
+    if fixed is not None:
+        return fixed
+    if dayfirst:
+        # Explicit format parses in one C pass; fall back to inference for mixed input
+        try:
+            return pd.to_datetime(values, format="%d-%m-%Y").to_numpy()
+        except (ValueError, TypeError):
+            return pd.to_datetime(values, dayfirst=True, errors="coerce").to_numpy()
+    return pd.to_datetime(values, format="ISO8601", errors="coerce").to_numpy()
+
+
+def claim_duration_days(claim_dates, policy_start_dates):
+    """Whole days between two datetime64 arrays (floored, like Timedelta.days)."""
+    return (claim_dates - policy_start_dates) // np.timedelta64(1, "D")
+
+
+class FeatureTransformer:
+    """Compiled feature pipeline shared by training and every scoring endpoint.
+
+    Categorical columns are encoded through hash-table lookups built from the
+    fitted LabelEncoders, dates are diffed as datetime64 arrays, and scaling
+    applies the StandardScaler's mean_/scale_ directly. The output is a
+    float64 matrix in FEATURE_COLUMNS order.
+    """
+
+    def __init__(self, le_channel, le_product, scaler=None):
+        self.channel_index = pd.Index(le_channel.classes_)
+        self.product_index = pd.Index(le_product.classes_)
+        self.channel_lookup = {c: i for i, c in enumerate(le_channel.classes_)}
+        self.product_lookup = {c: i for i, c in enumerate(le_product.classes_)}
+        self.mean = None
+        self.scale_ = None
+        if scaler is not None:
+            self.set_scaler(scaler)
+
+    def set_scaler(self, scaler):
+        self.mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.scale_ = np.asarray(scaler.scale_, dtype=np.float64)
+
+    @staticmethod
+    def _encode(index, values, name):
+        codes = index.get_indexer(values)
+        if (codes < 0).any():
+            unseen = sorted(set(np.asarray(values)[codes < 0].tolist()))
+            raise ValueError(f"{name} contains previously unseen labels: {unseen}")
+        return codes
+
+    def raw_columns(self, age, premium_amount, sum_assured, income, channel, product_type, claim_duration):
+        """Stack already-typed columns into the unscaled feature matrix."""
+        n = len(age)
+        X = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.float64)
+        X[:, 0] = age
+        X[:, 1] = premium_amount
+        X[:, 2] = sum_assured
+        X[:, 3] = income
+        X[:, 4] = self._encode(self.channel_index, channel, "channel")
+        X[:, 5] = self._encode(self.product_index, product_type, "product_type")
+        X[:, 6] = claim_duration
+        return X
+
+    def raw_frame(self, df, dayfirst=False):
+        """Unscaled feature matrix for a DataFrame of claims."""
+        claim_date = parse_dates(df["claim_date"], dayfirst=dayfirst)
+        policy_start_date = parse_dates(df["policy_start_date"], dayfirst=dayfirst)
+        if pd.isnull(claim_date).any() or pd.isnull(policy_start_date).any():
+            raise ValueError("Some dates could not be parsed. Check the date format in your file.")
+
+        return self.raw_columns(
+            *(df[col].to_numpy(dtype=np.float64) for col in NUMERIC_COLUMNS),
+            df["channel"].to_numpy(),
+            df["product_type"].to_numpy(),
+            claim_duration_days(claim_date, policy_start_date)
+        )
+
+    def raw_record(self, record):
+        """Unscaled feature row for one claim dict with YYYY-MM-DD dates; ValueError names missing or unknown fields."""
+        # A null or blank value (e.g. a field OCR did not find) is as missing as an absent key
+        missing = [field for field in RECORD_FIELDS
+                   if record.get(field) is None or (isinstance(record[field], str) and not record[field].strip())]
+        if missing:
+            raise ValueError(f"Missing fields: {', '.join(missing)}")
+        try:
+            channel = self.channel_lookup[record["channel"]]
+            product_type = self.product_lookup[record["product_type"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Previously unseen label: {e.args[0]}")
+
+        claim_duration = (np.datetime64(record["claim_date"], "D")
+                          - np.datetime64(record["policy_start_date"], "D"))
+        # "NaT" parses without error, and would become a huge negative duration
+        if np.isnat(claim_duration):
+            raise ValueError("claim_date and policy_start_date must be YYYY-MM-DD dates")
+        claim_duration = claim_duration.astype(np.int64)
+        return [
+            float(record["age"]), float(record["premium_amount"]), float(record["sum_assured"]),
+            float(record["income"]), channel, product_type, float(claim_duration)
+        ]
+
+    def scale(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean) / self.scale_
+
+    def transform_frame(self, df, dayfirst=False):
+        return self.scale(self.raw_frame(df, dayfirst=dayfirst))
+
+    def transform_record(self, record):
+        return self.scale([self.raw_record(record)])
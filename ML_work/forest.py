@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+
+# Rows evaluated per pass; bounds the (rows x trees) node-index matrix
+EVAL_CHUNK_ROWS = 8192
+
+
+class FlatForest:
+    """A fitted RandomForestClassifier flattened into contiguous NumPy arrays.
+
+    All trees share one node table (feature, threshold, children, per-class
+    leaf probabilities). Leaves point to themselves, so a batch is scored by
+    advancing every (row, tree) pair one level per step for `max_depth` steps,
+    with no per-row Python or sklearn input validation. Probabilities are
+    accumulated tree by tree in the same order sklearn uses, so predictions
+    match `model.predict` exactly.
+
+    Arrays are stored in their evaluation layout as one `.npy` file each, so
+    `load` can memory-map them read-only and every worker process on a host
+    shares a single copy through the page cache.
+    """
+
+    ARRAYS = ("feature", "threshold", "children", "is_leaf", "value", "roots")
+
+    def __init__(self, feature, threshold, children, is_leaf, value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        # Left children followed by right children: child = children[node + went_right * n_nodes]
+        self.children = children
+        self.is_leaf = is_leaf
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+
+    @classmethod
+    def from_sklearn(cls, model):
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            node_ids = np.arange(n)
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n
+            max_depth = max(max_depth, tree.max_depth)
+
+        left = np.concatenate(lefts).astype(np.intp)
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate([left, np.concatenate(rights).astype(np.intp)]),
+            is_leaf=left == np.arange(len(left)),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            classes=np.asarray(model.classes_)
+        )
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(path, "classes.npy"), self.classes_)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"max_depth": self.max_depth, "n_trees": len(self.roots)}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in cls.ARRAYS}
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(classes=np.load(os.path.join(path, "classes.npy")), max_depth=meta["max_depth"], **arrays)
+
+    def _leaves(self, X):
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        flat_X = X.ravel()
+        row_base = np.repeat(np.arange(n_rows) * n_features, n_trees)
+        node = np.tile(self.roots, n_rows)
+
+        # Walk all (row, tree) pairs one level per step, dropping pairs that reached a leaf
+        active = np.arange(len(node))
+        n_nodes = len(self.threshold)
+        for _ in range(self.max_depth):
+            current = node[active]
+            went_right = flat_X[row_base[active] + self.feature[current]] > self.threshold[current]
+            current = self.children[current + went_right * n_nodes]
+            node[active] = current
+            active = active[~self.is_leaf[current]]
+            if not len(active):
+                break
+        return node.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X):
+        X = np.asarray(X)
+        proba = np.zeros((len(X), self.value.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), EVAL_CHUNK_ROWS):
+            leaves = self._leaves(X[start:start + EVAL_CHUNK_ROWS])
+            # Reducing over the tree axis adds trees in order, as sklearn does
+            proba[start:start + EVAL_CHUNK_ROWS] = self.value[leaves].sum(axis=1)
+        proba /= len(self.roots)
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def check_parity(model_path="fraud_model.pkl", forest_path="fraud_forest", data_path="insurance_claims.csv"):
+    """Check that the flat forest reproduces sklearn predictions on the training CSV."""
+    import time
+    import joblib
+    import pandas as pd
+    from features import FeatureTransformer
+
+    model = joblib.load(model_path)
+    forest = FlatForest.load(forest_path)
+    features = FeatureTransformer(joblib.load("label_encoder_channel.pkl"),
+                                  joblib.load("label_encoder_product.pkl"),
+                                  joblib.load("scaler.pkl"))
+    X = features.transform_frame(pd.read_csv(data_path))
+
+    expected = model.predict(X)
+    actual = forest.predict(X)
+    mismatches = int((expected != actual).sum())
+    print(f"{len(X)} rows, {mismatches} mismatched predictions")
+
+    for name, fn in [("sklearn", model.predict), ("flat forest", forest.predict)]:
+        start = time.perf_counter()
+        for row in X[:200]:
+            fn(row[None, :])
+        print(f"{name:<12} single-row latency: {(time.perf_counter() - start) / 200 * 1000:.3f} ms")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(0 if check_parity() else 1)
@@ -0,0 +1,128 @@
+import numpy as np
+
+# Geometry of the FPDF claim forms (test/pdftemplate.py and the filled forms it evolved into),
+# in PDF points from the top-left corner. Field rows hang below blue section bars, so fields are
+# located from the bars found on the page rather than from absolute page positions.
+BAR_COLOR = (0, 102, 204)
+BAR_LEFT = 28.35
+BAR_WIDTH = 538.58
+FIRST_ROW_OFFSET = 42.52  # bar height plus the 5 mm gap before the first row
+ROW_HEIGHT = 22.68
+VALUE_COLUMN = (212.60, 552.76)
+
+# Bar tops, field positions as (section, row), and the signature box as
+# (section, top and bottom offsets from that section's bar, left, right)
+FORM_LAYOUTS = {
+    # Filled forms such as insurance_claim_form.pdf (test/pdf1.py): a Gender row in section B
+    "claim_form": {
+        "bars": [93.55, 212.60, 399.69, 541.42],
+        "fields": {
+            "claim_id": (0, 0), "policy_start_date": (0, 1), "claim_date": (0, 2),
+            "age": (1, 1), "premium_amount": (1, 3), "sum_assured": (1, 4), "income": (1, 5),
+            "channel": (2, 0), "product_type": (2, 2)
+        },
+        "signature": (3, 185.0, 232.0, 84.0, 176.0)
+    },
+    # The blank template (test/pdftemplate.py), which has a declaration section E
+    "claim_template": {
+        "bars": [93.55, 212.60, 377.01, 496.07, 620.79],
+        "fields": {
+            "claim_id": (0, 0), "policy_start_date": (0, 1), "claim_date": (0, 2),
+            "age": (1, 1), "premium_amount": (1, 2), "sum_assured": (1, 3), "income": (1, 4),
+            "channel": (2, 0), "product_type": (2, 2)
+        },
+        "signature": (4, 88.0, 122.0, 90.0, 198.43)
+    }
+}
+
+# Labels written in front of each OCR'd value, matching the patterns in parse_claim_form
+FIELD_LABELS = {
+    "claim_id": "Claim ID", "policy_start_date": "Policy Start Date", "claim_date": "Claim Date",
+    "age": "Age", "premium_amount": "Premium Amount (INR)", "sum_assured": "Sum Assured (INR)",
+    "income": "Annual Income (INR)", "channel": "Insurance Channel", "product_type": "Product Type"
+}
+
+# Bars may sit this many points away from the layout before a page stops matching it
+BAR_TOLERANCE = 6.0
+
+# Tesseract setting for the field crops: each holds a single line of text
+FIELD_OCR_CONFIG = "--psm 7"
+
+
+def _bar_mask(pixels, color_tolerance):
+    distance = np.abs(pixels[..., :3].astype(np.int16) - np.asarray(BAR_COLOR, dtype=np.int16)).max(axis=-1)
+    return distance <= color_tolerance
+
+
+def find_section_bars(page, min_fill=0.5, color_tolerance=40, column_step=8):
+    """Section bars on an RGB page as (top, bottom, left, right) pixel boxes, top to bottom."""
+    page = np.asarray(page)
+    if page.ndim != 3 or page.shape[2] < 3:
+        return []
+    # Every `column_step`-th column is enough to find the bar rows; only those rows are scanned in full
+    filled_rows = _bar_mask(page[:, ::column_step], color_tolerance).mean(axis=1) >= min_fill
+
+    bars = []
+    # Runs of consecutive filled rows, from the edges of the boolean row profile
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], filled_rows.astype(np.int8), [0]])))
+    for top, bottom in zip(edges[::2], edges[1::2]):
+        columns = np.flatnonzero(_bar_mask(page[top:bottom], color_tolerance).mean(axis=0) >= 0.5)
+        if bottom - top >= 3 and len(columns):
+            bars.append((int(top), int(bottom), int(columns[0]), int(columns[-1]) + 1))
+    return bars
+
+
+def match_layout(bars):
+    """The layout whose section bars match the detected ones, with the pixels-per-point scale.
+
+    Returns (name, scale) or None when the page is not a known claim form.
+    """
+    if not bars:
+        return None
+    # Bars span the page's text width, which fixes the scale whatever the rasterization DPI
+    scale = np.median([right - left for _, _, left, right in bars]) / BAR_WIDTH
+    tops = np.asarray([top for top, _, _, _ in bars]) / scale
+    for name, layout in FORM_LAYOUTS.items():
+        expected = np.asarray(layout["bars"])
+        if len(tops) != len(expected):
+            continue
+        # Compare spacing relative to the first bar, so a shifted page still matches
+        if np.abs((tops - tops[0]) - (expected - expected[0])).max() <= BAR_TOLERANCE:
+            return name, float(scale)
+    return None
+
+
+def _crop(page, bar, scale, top, bottom, left, right):
+    bar_top, _, bar_left, _ = bar
+    x_offset = bar_left - BAR_LEFT * scale
+    y0, y1 = int(round(bar_top + top * scale)), int(round(bar_top + bottom * scale))
+    x0, x1 = int(round(x_offset + left * scale)), int(round(x_offset + right * scale))
+    return page[max(y0, 0):max(y1, 0), max(x0, 0):max(x1, 0)]
+
+
+def template_regions(page):
+    """Field value crops and the signature crop of a claim form page, or None if it is not one.
+
+    Field crops are inset from the cell borders so the table lines don't reach Tesseract.
+    """
+    bars = find_section_bars(page)
+    match = match_layout(bars)
+    if match is None:
+        return None
+    name, scale = match
+    layout = FORM_LAYOUTS[name]
+    inset = 2.0
+
+    fields = {}
+    for field, (section, row) in layout["fields"].items():
+        top = FIRST_ROW_OFFSET + row * ROW_HEIGHT
+        fields[field] = _crop(page, bars[section], scale, top + inset, top + ROW_HEIGHT - inset,
+                              VALUE_COLUMN[0] + inset, VALUE_COLUMN[1] - inset)
+    section, top, bottom, left, right = layout["signature"]
+    signature = _crop(page, bars[section], scale, top, bottom, left, right)
+    return {"layout": name, "fields": fields, "signature": signature}
+
+
+def fields_text(values):
+    """OCR'd field values as "Label: value" lines, the text parse_claim_form expects."""
+    return "".join(f"{FIELD_LABELS[field]}: {value.strip()}\n" for field, value in values.items())
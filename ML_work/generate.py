@@ -1,53 +1,146 @@
-import pandas as pd
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
 import numpy as np
-import random
-from datetime import datetime, timedelta
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report
-import joblib
-
-
-def generate_fake_data(num_samples=10000):
-    fraud_types = ["No Fraud", "Early Death Claim", "High Sum Assured Ratio", "Age-Based Risk", "Channel-Based Fraud", "Income Mismatch"]
-    product_types = ["Health", "Non Par", "Pension", "Traditional", "ULIP", "Variable"]
-    
-    data = []
-    for _ in range(num_samples):
-        claim_id = f"CLM{random.randint(100000, 999999)}"
-        policy_start_date = datetime.today() - timedelta(days=random.randint(1, 1000))
-        claim_date = policy_start_date + timedelta(days=random.randint(10, 400))
-        age = random.randint(18, 80)
-        premium_amount = random.randint(1000, 50000)
-        sum_assured = premium_amount * random.uniform(10, 50)
-        income = random.randint(100000, 10000000)
-        channel = random.choice(["RetailAgency", "Bancassurance"])
-        product_type = random.choice(product_types)
-        
-        early_death_claim = (claim_date - policy_start_date).days <= 180
-        high_sum_ratio = (sum_assured / premium_amount > 30)
-        age_based_risk = (age in range(20, 35) and sum_assured > 500000)
-        channel_fraud = (channel == "RetailAgency" and random.random() < 0.2)
-        income_mismatch = (income < 500000 and sum_assured > 5000000)
-        
-        fraud_category = "No Fraud"
-        if early_death_claim:
-            fraud_category = "Early Death Claim"
-        elif high_sum_ratio:
-            fraud_category = "High Sum Assured Ratio"
-        elif age_based_risk:
-            fraud_category = "Age-Based Risk"
-        elif channel_fraud:
-            fraud_category = "Channel-Based Fraud"
-        elif income_mismatch:
-            fraud_category = "Income Mismatch"
-        
-        data.append([claim_id, policy_start_date, claim_date, age, premium_amount, sum_assured, income, channel, product_type, fraud_category])
-    
-    df = pd.DataFrame(data, columns=["claim_id", "policy_start_date", "claim_date", "age", "premium_amount", "sum_assured", "income", "channel", "product_type", "fraud_category"])
-    df.to_csv("insurance_claims.csv", index=False)
-    print("Dataset generated and saved as insurance_claims.csv")
-
-
-generate_fake_data()
\ No newline at end of file
+import pandas as pd
+
+FRAUD_TYPES = ["No Fraud", "Early Death Claim", "High Sum Assured Ratio", "Age-Based Risk", "Channel-Based Fraud", "Income Mismatch"]
+PRODUCT_TYPES = ["Health", "Non Par", "Pension", "Traditional", "ULIP", "Variable"]
+CHANNELS = ["RetailAgency", "Bancassurance"]
+COLUMNS = ["claim_id", "policy_start_date", "claim_date", "age", "premium_amount", "sum_assured", "income", "channel", "product_type", "fraud_category"]
+
+# Rows per shard; a shard is generated by one worker from its own random stream
+SHARD_ROWS = 250_000
+
+
+def generate_shard(shard, rows, seed, as_of):
+    """One shard of claims; depends only on (seed, shard, rows, as_of), never on the worker count."""
+    rng = np.random.default_rng([seed, shard])
+
+    claim_id = "CLM" + pd.Series(rng.integers(100000, 1000000, rows)).astype(str)
+    policy_age_days = rng.integers(1, 1001, rows)
+    claim_delay_days = rng.integers(10, 401, rows)
+    policy_start_date = np.datetime64(as_of, "us") - policy_age_days.astype("timedelta64[D]")
+    claim_date = policy_start_date + claim_delay_days.astype("timedelta64[D]")
+    age = rng.integers(18, 81, rows)
+    premium_amount = rng.integers(1000, 50001, rows)
+    sum_assured = premium_amount * rng.uniform(10, 50, rows)
+    income = rng.integers(100000, 10000001, rows)
+    channel = np.asarray(CHANNELS)[rng.integers(0, len(CHANNELS), rows)]
+    product_type = np.asarray(PRODUCT_TYPES)[rng.integers(0, len(PRODUCT_TYPES), rows)]
+
+    # Same rules and priority as the original per-row if/elif chain; np.select takes the first match
+    fraud_category = np.select(
+        [
+            claim_delay_days <= 180,
+            sum_assured / premium_amount > 30,
+            (age >= 20) & (age < 35) & (sum_assured > 500000),
+            (channel == "RetailAgency") & (rng.random(rows) < 0.2),
+            (income < 500000) & (sum_assured > 5000000),
+        ],
+        ["Early Death Claim", "High Sum Assured Ratio", "Age-Based Risk", "Channel-Based Fraud", "Income Mismatch"],
+        "No Fraud"
+    )
+
+    return pd.DataFrame({
+        "claim_id": claim_id, "policy_start_date": policy_start_date, "claim_date": claim_date, "age": age,
+        "premium_amount": premium_amount, "sum_assured": sum_assured, "income": income,
+        "channel": channel, "product_type": product_type, "fraud_category": fraud_category
+    }, columns=COLUMNS)
+
+
+def shard_csv(df, header):
+    """CSV bytes for a shard; Arrow's writer is an order of magnitude faster than DataFrame.to_csv."""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return df.to_csv(index=False, header=header).encode()
+    buf = pa.BufferOutputStream()
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf,
+                     pa_csv.WriteOptions(include_header=False, quoting_style="none"))
+    text = buf.getvalue().to_pybytes()
+    return (",".join(COLUMNS) + "\n").encode() + text if header else text
+
+
+def _shard_output(shard, rows, seed, as_of, fmt):
+    df = generate_shard(shard, rows, seed, as_of)
+    # CSV text is formatted in the worker, which is where most of the time goes
+    return shard_csv(df, header=shard == 0) if fmt == "csv" else df
+
+
+def iter_shards(num_samples, seed, as_of, fmt, shard_rows=SHARD_ROWS, workers=None):
+    """Yield shard outputs in order, with at most 2x`workers` shards in flight."""
+    shards = [(i, min(shard_rows, num_samples - start)) for i, start in enumerate(range(0, num_samples, shard_rows))]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(shards) <= 1:
+        for shard, rows in shards:
+            yield _shard_output(shard, rows, seed, as_of, fmt)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for shard, rows in shards:
+            pending.append(executor.submit(_shard_output, shard, rows, seed, as_of, fmt))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def generate_fake_data(num_samples=10000, output="insurance_claims.csv", seed=None, as_of=None, fmt=None,
+                       shard_rows=SHARD_ROWS, workers=None):
+    """Write `num_samples` synthetic claims to CSV, a Parquet file, or the columnar claim store.
+
+    Shards are written as they complete, so memory stays bounded by a few
+    shards whatever the dataset size. The same seed, as_of and shard_rows
+    always produce the same rows.
+    """
+    seed = np.random.SeedSequence().entropy if seed is None else seed
+    as_of = datetime.today() if as_of is None else pd.Timestamp(as_of).to_pydatetime()
+    fmt = fmt or ("parquet" if output.endswith(".parquet") else "csv")
+    shards = iter_shards(num_samples, seed, as_of, fmt, shard_rows, workers)
+
+    if fmt == "csv":
+        with open(output, "wb") as f:
+            for text in shards:
+                f.write(text)
+    elif fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for df in shards:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                writer = writer or pq.ParquetWriter(output, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif fmt == "store":
+        from claim_store import ClaimStore
+        store = ClaimStore(output)
+        for df in shards:
+            store.append(df)
+    else:
+        raise ValueError(f"Unknown output format: {fmt}")
+
+    print(f"Dataset of {num_samples} claims generated and saved as {output}")
+    print(f"Reproduce with --seed {seed} --as-of '{as_of.isoformat()}' --shard-rows {shard_rows}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic insurance claims.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--output", default="insurance_claims.csv")
+    parser.add_argument("--format", choices=["csv", "parquet", "store"],
+                        help="default: from the output extension; store appends to a claim_store directory")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--as-of", help="date the policy and claim dates count back from (default: now)")
+    parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS)
+    parser.add_argument("--workers", type=int, help="default: one per CPU")
+    args = parser.parse_args()
+    generate_fake_data(args.rows, args.output, args.seed, args.as_of, args.format, args.shard_rows, args.workers)
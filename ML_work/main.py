@@ -1,69 +1,423 @@
 import pandas as pd
 import numpy as np
-import random
-from datetime import datetime, timedelta
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report
-import joblib
-from flask import Flask, request, jsonify, send_file, Response
-import pytesseract
-from pdf2image import convert_from_path
+import functools
+import hmac
+from types import SimpleNamespace
+from flask import Flask, request, jsonify, send_file, Response, abort
 import re
-import json
-import cv2
-from tensorflow.keras.models import load_model
 import io
+import multiprocessing
+import os
+import shutil
+import tempfile
 from flask_cors import CORS
+from bulk_jobs import BulkJobManager
+from document_cache import DocumentCache
+from metrics import ServiceMetrics
+from form_ocr import FIELD_OCR_CONFIG, fields_text, template_regions
+from pdf_text import read_text_layer, scanned_pages
+from prediction_cache import PredictionCache
+from rules import RuleEngine
+from model_registry import ModelRegistry
+
+# TensorFlow, OpenCV, Tesseract and the sklearn artifacts are imported/loaded lazily
+# through `registry`, so the service starts serving before any of them are needed.
 
 # Set Tesseract OCR path if required (For Windows Users)
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+TESSERACT_CMD = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 POPPLER_PATH = r"C:\Program Files\poppler-24.08.0\Library\bin"
 SIGNATURE_MODEL_PATH = "./signature.keras"
-
-# Load Model
-signature_model = load_model(SIGNATURE_MODEL_PATH)
+SIGNATURE_TFLITE_PATH = "./signature.tflite"
+SIGNATURE_ONNX_PATH = "./signature.onnx"
+
+# Batches up to this many rows use the memory-mapped flat forest (when exported); larger ones use sklearn
+FLAT_FOREST_MAX_ROWS = int(os.environ.get("FLAT_FOREST_MAX_ROWS", 512))
+
+# Micro-batching window for /predict: flush after this many rows or this many ms
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", 5))
+
+# Versioned model bundles written by train.py; the one named in LATEST is served (loose files in
+# ML_work/ are used until the first bundle exists) and LATEST is re-checked every few seconds
+MODEL_BUNDLES_DIR = os.environ.get("MODEL_BUNDLES_DIR", "./model_bundles")
+MODEL_WATCH_SECONDS = float(os.environ.get("MODEL_WATCH_SECONDS", 5))
+
+# Risk level from the calibrated fraud probability (1 - P(No Fraud)): High at or above the first
+# threshold, Medium at or above the second, Low below
+RISK_HIGH_THRESHOLD = float(os.environ.get("RISK_HIGH_THRESHOLD", 0.7))
+RISK_MEDIUM_THRESHOLD = float(os.environ.get("RISK_MEDIUM_THRESHOLD", 0.4))
+
+# Deterministic fraud rules checked before the model (empty path disables them), and how often
+# the file is checked for edits
+RULES_PATH = os.environ.get("RULES_PATH", "./fraud_rules.json")
+RULES_WATCH_SECONDS = float(os.environ.get("RULES_WATCH_SECONDS", 5))
+
+# /predict result cache: entries kept per process (0 disables it) and how long they stay valid.
+# With a path, results are also shared between worker processes through a SQLite file.
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", 10000))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get("PREDICTION_CACHE_TTL_SECONDS", 3600))
+PREDICTION_CACHE_PATH = os.environ.get("PREDICTION_CACHE_PATH", "")
+PREDICTION_CACHE_DISK_SIZE = int(os.environ.get("PREDICTION_CACHE_DISK_SIZE", 100000))
+
+# Number of documents whose rasterized pages and OCR text are kept in memory
+DOCUMENT_CACHE_SIZE = int(os.environ.get("DOCUMENT_CACHE_SIZE", 8))
+
+# Worker processes used to OCR the pages of a document in parallel (defaults to all cores)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+
+# Largest upload accepted by the document endpoints; bigger requests get 413 before their body is read
+MAX_DOCUMENT_UPLOAD_BYTES = int(os.environ.get("MAX_DOCUMENT_UPLOAD_BYTES", 20 * 1024 * 1024))
+# Allowance for the multipart headers and boundaries around the file in a document request body
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# "template" OCRs only the field boxes of a recognised claim form (page 1, at OCR_TEMPLATE_DPI) and
+# falls back to full-page OCR for anything else; "full" always OCRs every page at OCR_FULL_PAGE_DPI
+OCR_MODE = os.environ.get("OCR_MODE", "template")
+OCR_TEMPLATE_DPI = int(os.environ.get("OCR_TEMPLATE_DPI", 150))
+OCR_FULL_PAGE_DPI = int(os.environ.get("OCR_FULL_PAGE_DPI", 200))
+
+# Read born-digital PDFs from their embedded text layer and only OCR scanned pages ("0" always OCRs)
+PDF_TEXT_LAYER = os.environ.get("PDF_TEXT_LAYER", "1") == "1"
+
+# Rows per chunk when /bulk-predict streams its results
+BULK_CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", 10000))
+
+# Signature CNN backend (auto, keras, tflite or onnx) and its cross-request batching window
+SIGNATURE_BACKEND = os.environ.get("SIGNATURE_BACKEND", "auto")
+SIGNATURE_BATCH_MAX_SIZE = int(os.environ.get("SIGNATURE_BATCH_MAX_SIZE", 32))
+SIGNATURE_BATCH_MAX_WAIT_MS = float(os.environ.get("SIGNATURE_BATCH_MAX_WAIT_MS", 10))
+
+# Scored bulk claims are appended here (Parquet, partitioned by claim month), e.g. ./claim_store/scored;
+# empty (the default) disables it
+SCORED_CLAIMS_PATH = os.environ.get("SCORED_CLAIMS_PATH", "")
+
+# Background bulk-scoring jobs: checkpoint directory and worker threads
+BULK_JOBS_DIR = os.environ.get("BULK_JOBS_DIR", "./bulk_jobs")
+BULK_JOB_WORKERS = int(os.environ.get("BULK_JOB_WORKERS", 2))
+
+# Hours a finished bulk job's files are kept if nobody deletes the job; -1 keeps them forever
+BULK_JOB_RETENTION_HOURS = float(os.environ.get("BULK_JOB_RETENTION_HOURS", 24))
+
+# Artifact groups loaded in the background after startup ("" disables pre-warming)
+PREWARM_MODELS = [name for name in os.environ.get("PREWARM_MODELS", "tabular,ocr,signature").split(",") if name]
+
+# /metrics: worker processes pool their samples in this directory so any worker reports the whole
+# server (serve.py sets one; "" reports this process only), writing them every few seconds
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 5))
+
+# Fraction of requests run under cProfile; profiles of those taking PROFILE_SLOW_MS or longer are saved
+# to PROFILE_DIR. With PROFILE_ON_DEMAND=1 a request sent with "X-Profile: 1" is always profiled.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", 1000))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "./profiles")
+PROFILE_ON_DEMAND = os.environ.get("PROFILE_ON_DEMAND", "0") == "1"
+
+# Endpoints that change what the service serves need "Authorization: Bearer <ADMIN_TOKEN>";
+# with no token set (the default) they only accept requests from this machine
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+# Admin endpoints are left out of CORS, so pages on other origins cannot call them from a browser
+ADMIN_PATHS = ["/models/activate", "/models/rollback", "/rules/reload"]
 
 
 def load_models():
-    model = joblib.load("fraud_model.pkl")
-    scaler = joblib.load("scaler.pkl")
-    le_channel = joblib.load("label_encoder_channel.pkl")
-    le_product = joblib.load("label_encoder_product.pkl")
-    le_fraud = joblib.load("label_encoder_fraud.pkl")
-    return model, scaler, le_channel, le_product, le_fraud
+    """The bundle manager, serving the newest model bundle and watching for new ones."""
+    from model_bundles import BundleManager, ModelBundle
+
+    def load_bundle(path, version):
+        return ModelBundle(path, version, flat_forest_max_rows=FLAT_FOREST_MAX_ROWS,
+                           batch_max_size=BATCH_MAX_SIZE, batch_max_wait_ms=BATCH_MAX_WAIT_MS,
+                           risk_high_threshold=RISK_HIGH_THRESHOLD, risk_medium_threshold=RISK_MEDIUM_THRESHOLD,
+                           rules=rule_engine)
+
+    def warm_up(bundle, current):
+        # Preload sklearn too if the serving bundle needed it, so large batches don't stall after the swap
+        bundle.warm_up(include_sklearn=current is not None and current.sklearn_loaded)
+
+    manager = BundleManager(MODEL_BUNDLES_DIR, load_bundle, warm_up, poll_seconds=MODEL_WATCH_SECONDS,
+                            report_error=metrics.error)
+    manager.load_initial()
+    return manager
+
+def load_ocr():
+    """OpenCV, Poppler rasterization and the Tesseract process pool."""
+    import cv2
+    import pytesseract
+    from pdf2image import convert_from_bytes
+    from ocr_pool import OCRPool
+
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return SimpleNamespace(cv2=cv2, convert_from_bytes=convert_from_bytes,
+                           pool=OCRPool(workers=OCR_WORKERS, observe=metrics.observe_stage))
+
+def load_signature_model():
+    """Signature CNN behind a batching scorer; TFLite/ONNX conversions are used when present."""
+    from signature_service import SignatureScorer, load_backend
+
+    backend = load_backend(SIGNATURE_BACKEND, SIGNATURE_MODEL_PATH, SIGNATURE_TFLITE_PATH, SIGNATURE_ONNX_PATH)
+    return SignatureScorer(backend, max_batch_size=SIGNATURE_BATCH_MAX_SIZE,
+                           max_wait_ms=SIGNATURE_BATCH_MAX_WAIT_MS)
+
+registry = ModelRegistry()
+registry.register("tabular", load_models)
+registry.register("ocr", load_ocr)
+registry.register("signature", load_signature_model)
 
 app = Flask(__name__)
-CORS(app)
-model, scaler, le_channel, le_product, le_fraud = load_models()
+CORS(app, resources={r"^(?!(%s)$).*" % "|".join(ADMIN_PATHS): {}})
+
+metrics = ServiceMetrics("scoring", snapshot_dir=METRICS_DIR or None, flush_seconds=METRICS_FLUSH_SECONDS,
+                         profile_sample_rate=PROFILE_SAMPLE_RATE, profile_slow_ms=PROFILE_SLOW_MS,
+                         profile_dir=PROFILE_DIR, profile_on_demand=PROFILE_ON_DEMAND)
+metrics.instrument(app)
+
+document_cache = DocumentCache(max_entries=DOCUMENT_CACHE_SIZE)
+rule_engine = RuleEngine(RULES_PATH, poll_seconds=RULES_WATCH_SECONDS) if RULES_PATH else None
+prediction_cache = PredictionCache(max_entries=PREDICTION_CACHE_SIZE, ttl_seconds=PREDICTION_CACHE_TTL_SECONDS,
+                                   sqlite_path=PREDICTION_CACHE_PATH or None,
+                                   max_disk_entries=PREDICTION_CACHE_DISK_SIZE)
+
+def component_metrics():
+    """Counters the caches, batchers and model registry already keep, read when /metrics is scraped."""
+    predictions, documents = prediction_cache.stats(), document_cache.stats()
+    families = [
+        ("prediction_cache_hits_total", "counter", "/predict results served from the cache, by tier.",
+         [({"tier": "memory"}, predictions["hits"]), ({"tier": "disk"}, predictions["disk_hits"])]),
+        ("prediction_cache_misses_total", "counter", "/predict results computed by the model.",
+         [({}, predictions["misses"])]),
+        ("prediction_cache_entries", "gauge", "/predict results held in memory.", [({}, predictions["entries"])]),
+        ("document_cache_hits_total", "counter", "Uploads whose extraction was reused.", [({}, documents["hits"])]),
+        ("document_cache_misses_total", "counter", "Uploads extracted from scratch.", [({}, documents["misses"])]),
+        ("model_loaded", "gauge", "Whether each artifact group is loaded.",
+         [({"group": name}, int(stats["loaded"])) for name, stats in registry.stats()["models"].items()]),
+    ]
+
+    # Only groups already loaded are read; a scrape never loads a model
+    batchers = []
+    if registry.is_loaded("tabular"):
+        manager = registry.get("tabular")
+        bundle = manager.current
+        batchers.append(("predict", bundle.batcher))
+        families += [
+            ("model_bundle_info", "gauge", "The model bundle version being served.", [({"version": bundle.version}, 1)]),
+            ("model_bundle_swaps_total", "counter", "Model bundle activations.", [({}, manager.swaps)]),
+            ("model_bundle_rollbacks_total", "counter", "Model bundle rollbacks.", [({}, manager.rollbacks)]),
+            ("model_bundle_failures_total", "counter", "Model bundle versions that failed to load or warm up.",
+             [({}, manager.failures)]),
+        ]
+    if registry.is_loaded("signature"):
+        batchers.append(("signature", registry.get("signature").batcher))
+    if rule_engine is not None:
+        rules = rule_engine.stats()
+        families += [
+            ("rules_rows_total", "counter", "Claims checked against the fraud rules.", [({}, rules["rows"])]),
+            ("rules_decided_rows_total", "counter", "Claims a rule decided without the model, by rule.",
+             [({"rule": name}, count) for name, count in rules["decided_by_rule"].items()]),
+        ]
+    if batchers:
+        families += [
+            ("batch_size", "histogram", "Rows per micro-batched model call.",
+             [({"batcher": name}, batcher.batch_sizes.snapshot()) for name, batcher in batchers]),
+            ("batch_queue_wait_milliseconds", "histogram", "Time a row waited for its micro-batch.",
+             [({"batcher": name}, batcher.queue_wait_ms.snapshot()) for name, batcher in batchers]),
+            ("batch_queued", "gauge", "Rows waiting for a micro-batch.",
+             [({"batcher": name}, batcher.stats()["queued"]) for name, batcher in batchers]),
+        ]
+    return families
+
+metrics.registry.add_collector(component_metrics)
+metrics.registry.add_ratio("prediction_cache_hit_ratio", "Share of /predict lookups answered from the cache.",
+                           ["prediction_cache_hits_total"],
+                           ["prediction_cache_hits_total", "prediction_cache_misses_total"])
+metrics.registry.add_ratio("rules_fast_path_ratio", "Share of claims decided by a rule without the model.",
+                           ["rules_decided_rows_total"], ["rules_rows_total"])
+metrics.registry.add_ratio("document_cache_hit_ratio", "Share of uploads whose extraction was reused.",
+                           ["document_cache_hits_total"],
+                           ["document_cache_hits_total", "document_cache_misses_total"])
+
+def admin_only(view):
+    """Refuse the request with 403 unless it carries ADMIN_TOKEN (or, without one, comes from localhost)."""
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        if ADMIN_TOKEN:
+            supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+            allowed = hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+        else:
+            allowed = request.remote_addr in ("127.0.0.1", "::1")
+        if not allowed:
+            return jsonify({"error": "Admin access required"}), 403
+        return view(*args, **kwargs)
+    return guarded
 
 @app.route("/", methods=["GET"])
 def working():
     return "Server is running"
 
+@app.route("/models", methods=["GET"])
+def model_stats():
+    """Which artifact groups are loaded, with per-group load time and resident memory."""
+    return jsonify(registry.stats())
+
+@app.route("/models/bundle", methods=["GET"])
+def model_bundle_stats():
+    """Serving and previous bundle versions, the versions on disk and swap counters."""
+    return jsonify(registry.get("tabular").stats())
+
+@app.route("/models/activate", methods=["POST"])
+@admin_only
+def activate_model_bundle():
+    """Load, warm up and switch to the bundle version given as {"version": ...}."""
+    version = (request.json or {}).get("version")
+    if not version:
+        return jsonify({"error": "No version provided"}), 400
+    try:
+        bundle = registry.get("tabular").activate(version)
+    except Exception as e:
+        metrics.error("models.activate", f"Error activating model bundle {version}: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    return jsonify(bundle.describe())
+
+@app.route("/models/rollback", methods=["POST"])
+@admin_only
+def rollback_model_bundle():
+    """Switch back to the previously served bundle, which is still in memory."""
+    try:
+        bundle = registry.get("tabular").rollback()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(bundle.describe())
+
+def claim_features(data):
+    """The serving bundle, a claim's feature row and its cached result (None on a miss)."""
+    # One bundle for the whole request, even if a new version is swapped in meanwhile
+    bundle = registry.get("tabular").current
+    with metrics.stage("claim.features"):
+        input_data = bundle.features.raw_record(data)
+
+    # Re-scored claims are answered from the cache; it is keyed by model version, so a swap invalidates it
+    return bundle, input_data, prediction_cache.get(bundle.cache_version, input_data)
+
+def decide_claim(bundle, input_data):
+    """`score_batch` result for a claim a fraud rule decides, else None; such claims skip the batching wait."""
+    with metrics.stage("claim.rules"):
+        return bundle.decide_row(input_data)
+
 @app.route("/predict", methods=["POST"])
 def predict():
     data = request.json
-    input_data = np.array([[
-        data["age"], data["premium_amount"], data["sum_assured"], data["income"],
-        (datetime.strptime(data["claim_date"], "%Y-%m-%d") - datetime.strptime(data["policy_start_date"], "%Y-%m-%d")).days,
-        le_channel.transform([data["channel"]])[0],
-        le_product.transform([data["product_type"]])[0]
-    ]])
-    
-    input_data = scaler.transform(input_data)
-    fraud_prediction = model.predict(input_data)[0]
-    fraud_category = le_fraud.inverse_transform([fraud_prediction])[0]
-    
+    try:
+        bundle, input_data, result = claim_features(data)
+    except ValueError as e:
+        # Missing fields, unknown labels and malformed values are the client's to fix
+        return jsonify({"error": str(e)}), 400
+    if result is None:
+        scored = decide_claim(bundle, input_data)
+        if scored is None:
+            # Concurrent requests are coalesced into a single scaler/model/calibration call
+            with metrics.stage("claim.model"):
+                scored = bundle.batcher.predict(input_data)
+        result = bundle.describe_row(scored)
+        prediction_cache.put(bundle.cache_version, input_data, result)
+    metrics.count_rows("predict")
+
     response = {
-        "claim_id": data["claim_id"],
-        "fraud_category": fraud_category,
-        "confidence": "high" if fraud_prediction > 3 else "medium" if fraud_prediction > 1 else "low"
+        "claim_id": data.get("claim_id"),
+        **result
     }
     
     return jsonify(response)
 
+@app.route("/predict/stats", methods=["GET"])
+def predict_stats():
+    """Batch-size and queue-wait histograms for tuning the batching window, and result cache counters."""
+    bundle = registry.get("tabular").current
+    return jsonify({**bundle.batcher.stats(), "model_version": bundle.version, "cache": prediction_cache.stats()})
+
+@app.route("/rules", methods=["GET"])
+def rule_stats():
+    """Fraud rules in force, and how many claims each decided without the model."""
+    if rule_engine is None:
+        return jsonify({"error": "Fraud rules are disabled (RULES_PATH is empty)"}), 404
+    return jsonify(rule_engine.stats())
+
+@app.route("/rules/reload", methods=["POST"])
+@admin_only
+def reload_rules():
+    """Re-read the rule file now instead of at the next check."""
+    if rule_engine is None:
+        return jsonify({"error": "Fraud rules are disabled (RULES_PATH is empty)"}), 404
+    if not rule_engine.reload():
+        return jsonify({"error": rule_engine.last_error}), 400
+    return jsonify(rule_engine.stats())
+
+def score_claims_frame(df):
+    """Score a DataFrame of claims, adding fraud_category, fraud_probability, risk_level, status and model_version."""
+    bundle = registry.get("tabular").current
+    # Dates are DD-MM-YYYY in uploaded files
+    with metrics.stage("bulk.features"):
+        raw = bundle.features.raw_frame(df, dayfirst=True)
+    # Rows a fraud rule decides are settled by NumPy masks; only the rest are scaled and scored
+    with metrics.stage("bulk.model"):
+        scores = bundle.score_raw(raw)
+    metrics.count_rows("bulk", len(df))
+
+    # Add predictions to the original columns
+    scored = df.assign(fraud_category=scores["fraud_category"],
+                       fraud_probability=scores["fraud_probability"].round(4),
+                       risk_level=scores["risk_level"])
+    scored["status"] = "Pending"
+    scored["model_version"] = bundle.version
+    return scored
+
+def store_scored_claims(scored, batch_id=None):
+    """Append scored claims to the columnar claim store; a storage failure never fails scoring.
+
+    A `batch_id` names the files, so a replayed batch (a resumed job's chunk) overwrites instead of duplicating.
+    """
+    if not SCORED_CLAIMS_PATH:
+        return
+    try:
+        from claim_store import ClaimStore
+        with metrics.stage("bulk.store"):
+            ClaimStore(SCORED_CLAIMS_PATH).append(scored, dayfirst=True, name=batch_id)
+    except Exception as e:
+        metrics.error("bulk.store", f"Error storing scored claims: {str(e)}")
+
+def score_and_store_claims(df, batch_id=None):
+    scored = score_claims_frame(df)
+    store_scored_claims(scored, batch_id)
+    return scored
+
+def stream_scored_csv(upload):
+    """Yield scored CSV text chunk by chunk so memory stays bounded by BULK_CHUNK_SIZE."""
+    # Flask closes request files once the view returns, so the generator reads from its own copy
+    source = tempfile.TemporaryFile()
+    shutil.copyfileobj(upload, source)
+    source.seek(0)
+
+    try:
+        chunks = pd.read_csv(source, chunksize=BULK_CHUNK_SIZE)
+        # Score the first chunk eagerly so bad input still gets a 400 before streaming starts
+        first = score_and_store_claims(next(chunks)).to_csv(index=False)
+    except BaseException:
+        source.close()
+        raise
+
+    def generate():
+        try:
+            yield first
+            for chunk in chunks:
+                yield score_and_store_claims(chunk).to_csv(index=False, header=False)
+        except Exception as e:
+            # Headers are already sent; re-raising makes the server drop the connection before the final
+            # chunk, so the client sees an incomplete transfer instead of a 200 with a truncated CSV
+            metrics.error("bulk.stream", f"Streaming error: {str(e)}")
+            raise
+        finally:
+            source.close()
+
+    return generate()
+
 @app.route("/bulk-predict", methods=["POST"])
 def bulk_predict():
     try:
@@ -74,50 +428,34 @@ def bulk_predict():
         if not file.filename:
             return jsonify({"error": "No file selected"}), 400
 
+        # Streaming mode reads and scores the CSV in fixed-size chunks
+        stream = request.args.get("stream", "").lower() in ("1", "true", "yes")
+
         # Read input data
         if file.filename.endswith(".csv"):
-            df = pd.read_csv(file)
+            with metrics.stage("bulk.read"):
+                df = None if stream else pd.read_csv(file)
         elif file.filename.endswith(".xlsx"):
-            df = pd.read_excel(file)
+            with metrics.stage("bulk.read"):
+                df = pd.read_excel(file)
+            stream = False
         else:
-            print(f"Unsupported file format: {file.filename}")
+            metrics.error("bulk.read", f"Unsupported file format: {file.filename}")
             return jsonify({"error": "Unsupported file format. Please upload a CSV or XLSX file."}), 400
 
         try:
-            # Keep original data
-            original_df = df.copy()
-
-            # Convert dates with dayfirst=True for DD-MM-YYYY format
-            df["claim_date"] = pd.to_datetime(df["claim_date"], dayfirst=True, errors='coerce')
-            df["policy_start_date"] = pd.to_datetime(df["policy_start_date"], dayfirst=True, errors='coerce')
-
-            # Check for invalid dates
-            if df["claim_date"].isnull().any() or df["policy_start_date"].isnull().any():
-                return jsonify({"error": "Some dates could not be parsed. Check the date format in your file."}), 400
+            if stream:
+                return Response(
+                    stream_scored_csv(file.stream),
+                    mimetype='text/csv',
+                    headers={"Content-Disposition": "attachment;filename=processed_claims.csv"}
+                )
 
-            # Calculate claim duration
-            df["claim_duration"] = (df["claim_date"] - df["policy_start_date"]).dt.days
-
-            # Drop columns not needed for prediction
-            df_pred = df.drop(columns=["claim_id", "policy_start_date", "claim_date"])
-
-            # Transform categorical variables
-            df_pred["channel"] = le_channel.transform(df_pred["channel"])
-            df_pred["product_type"] = le_product.transform(df_pred["product_type"])
-
-            # Scale features in the exact order used during training
-            df_scaled = scaler.transform(df_pred)
-            fraud_predictions = model.predict(df_scaled)
-
-            # Add predictions to original dataframe
-            original_df["fraud_category"] = le_fraud.inverse_transform(fraud_predictions)
-            original_df["risk_level"] = ["High" if p > 3 else "Medium" if p > 1 else "Low"
-                                         for p in fraud_predictions]
-            original_df["status"] = "Pending"
-            
             # Prepare response
             output = io.StringIO()
-            original_df.to_csv(output, index=False)
+            scored = score_and_store_claims(df)
+            with metrics.stage("bulk.serialize"):
+                scored.to_csv(output, index=False)
 
             return Response(
                 output.getvalue(),
@@ -125,31 +463,179 @@ def bulk_predict():
                 headers={"Content-Disposition": "attachment;filename=processed_claims.csv"}
             )
 
+        except StopIteration:
+            return jsonify({"error": "The uploaded file contains no rows"}), 400
         except Exception as e:
-            print(f"Processing error: {str(e)}")
+            metrics.error("bulk_predict", f"Processing error: {str(e)}")
             return jsonify({"error": f"Error processing data: {str(e)}"}), 400
 
     except Exception as e:
-        print(f"General error: {str(e)}")
+        metrics.error("bulk_predict", f"General error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/bulk-predict/jobs", methods=["POST"])
+def submit_bulk_job():
+    """Queue a CSV for background scoring and return its job ID immediately."""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file provided"}), 400
 
-
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF using OCR."""
-    images = convert_from_path(pdf_path, poppler_path=POPPLER_PATH)
-    extracted_text = ""
-    image_data = []
-
-    for img in images:
-        img_np = np.array(img)
-        gray = cv2.cvtColor(img_np, cv2.COLOR_BGR2GRAY)
-        processed_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-        text = pytesseract.image_to_string(processed_img, lang='eng')
-        extracted_text += text + "\n"
-        image_data.append((text, img_np))
-
-    return extracted_text, image_data
+    file = request.files["file"]
+    if not file.filename.endswith(".csv"):
+        return jsonify({"error": "Background jobs accept CSV files only"}), 400
+
+    job_id = bulk_jobs.submit(file.stream, file.filename)
+    return jsonify(bulk_jobs.status(job_id)), 202
+
+@app.route("/bulk-predict/jobs/<job_id>", methods=["GET"])
+def bulk_job_status(job_id):
+    status = bulk_jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+@app.route("/bulk-predict/jobs/<job_id>/parts/<int:part>", methods=["GET"])
+def bulk_job_part(job_id, part):
+    """Download one scored chunk; each part is a standalone CSV with a header row."""
+    status = bulk_jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if part >= status["parts"]:
+        return jsonify({"error": "Part not ready"}), 404
+    return send_file(os.path.abspath(bulk_jobs.part_path(job_id, part)), mimetype='text/csv',
+                     as_attachment=True, download_name=f"processed_claims_part{part}.csv")
+
+@app.route("/bulk-predict/jobs/<job_id>", methods=["DELETE"])
+def delete_bulk_job(job_id):
+    """Remove a finished job's input and scored parts once the caller has collected them."""
+    deleted = bulk_jobs.delete(job_id)
+    if deleted is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not deleted:
+        return jsonify({"error": "Job is still queued or running"}), 409
+    return jsonify({"job_id": job_id, "deleted": True})
+
+
+
+bulk_jobs = BulkJobManager(score_and_store_claims, jobs_dir=BULK_JOBS_DIR,
+                           workers=BULK_JOB_WORKERS, chunk_size=BULK_CHUNK_SIZE,
+                           retention_seconds=BULK_JOB_RETENTION_HOURS * 3600 if BULK_JOB_RETENTION_HOURS >= 0 else None)
+
+def uploaded_pdf():
+    """Bytes of the request's PDF upload, read in memory, and an error message if there is none.
+
+    Uploads over MAX_DOCUMENT_UPLOAD_BYTES are refused with 413. Werkzeug
+    enforces the limit while it parses the body: from the Content-Length
+    header when there is one, and by counting bytes as a chunked upload
+    arrives, so an oversized body is never spooled in full.
+    """
+    # The whole multipart body may exceed the file by its part headers and boundaries
+    request.max_content_length = MAX_DOCUMENT_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    if "file" not in request.files:
+        return None, "No file provided"
+    data = request.files["file"].read(MAX_DOCUMENT_UPLOAD_BYTES + 1)
+    if len(data) > MAX_DOCUMENT_UPLOAD_BYTES:
+        abort(413)
+    # The PDF header may follow up to 1 KB of other bytes
+    if b"%PDF-" not in data[:1024]:
+        return None, "The uploaded file is not a PDF"
+    return data, None
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"File too large; the limit is {MAX_DOCUMENT_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+
+def extract_text_from_pdf(data):
+    """Extract text from a PDF's bytes, reusing earlier results for identical files.
+
+    Born-digital pages are read from the embedded text layer; only scanned
+    pages are rasterized and OCR'd. Returns the document's text, its
+    (page text, page image) pairs, the signature crop when the form layout
+    located it, and which extraction path ran. Documents read entirely from
+    the text layer are rasterized only if their signature is checked.
+    """
+    cache_key = document_cache.key_for(data)
+    cached = document_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    texts = None
+    if PDF_TEXT_LAYER:
+        with metrics.stage("pdf.text_layer"):
+            texts = read_text_layer(data, poppler_path=POPPLER_PATH)
+    scanned = scanned_pages(texts) if texts else None
+    if texts and not scanned:
+        document = SimpleNamespace(text="".join(text + "\n" for text in texts), image_data=None, signature=None,
+                                   mode="text_layer", source=data)
+    else:
+        # The form fields are on page 1, so the template path only helps when that page is scanned
+        use_template = OCR_MODE == "template" and (scanned is None or 0 in scanned)
+        document = ocr_form_fields(data) if use_template else None
+        if document is None:
+            document = ocr_full_pages(data, texts, scanned)
+
+    document_cache.put(cache_key, document)
+    return document
+
+def ocr_form_fields(data):
+    """OCR only the field boxes of a claim form's first page; None if the page is not a known form."""
+    ocr = registry.get("ocr")
+    with metrics.stage("pdf.rasterize"):
+        images = ocr.convert_from_bytes(data, dpi=OCR_TEMPLATE_DPI, first_page=1, last_page=1,
+                                        poppler_path=POPPLER_PATH)
+        page = np.array(images[0])
+    with metrics.stage("form.locate_fields"):
+        regions = template_regions(page)
+    if regions is None:
+        return None
+
+    # Single-line crops are OCR'd concurrently; values come back in field order
+    crops = [ocr.cv2.cvtColor(crop, ocr.cv2.COLOR_RGB2GRAY) for crop in regions["fields"].values()]
+    values = dict(zip(regions["fields"], ocr.pool.ocr_pages(crops, config=FIELD_OCR_CONFIG)))
+    # Mostly empty boxes mean the layout matched but the fields are elsewhere; let full-page OCR try
+    if sum(1 for value in values.values() if value.strip()) < len(values) / 2:
+        return None
+
+    text = fields_text(values)
+    return SimpleNamespace(text=text, image_data=[(text, page)], signature=regions["signature"],
+                           mode=f"template:{regions['layout']}", source=None)
+
+def ocr_full_pages(data, texts=None, scanned=None):
+    """OCR whole pages: only the `scanned` ones when the rest have a text layer, otherwise all of them."""
+    ocr = registry.get("ocr")
+    with metrics.stage("pdf.rasterize"):
+        images = ocr.convert_from_bytes(data, dpi=OCR_FULL_PAGE_DPI, poppler_path=POPPLER_PATH)
+        pages = [np.array(img) for img in images]
+    if texts is None or scanned is None or len(texts) != len(pages):
+        texts, scanned = [""] * len(pages), list(range(len(pages)))
+
+    # Pages are OCR'd concurrently as grayscale buffers; texts come back in page order
+    ocr_texts = ocr.pool.ocr_pages([ocr.cv2.cvtColor(pages[i], ocr.cv2.COLOR_BGR2GRAY) for i in scanned])
+    texts = list(texts)
+    for i, text in zip(scanned, ocr_texts):
+        texts[i] = text
+    extracted_text = "".join(text + "\n" for text in texts)
+    mode = "full_page" if len(scanned) == len(pages) else f"text_layer+ocr:{len(scanned)}"
+    return SimpleNamespace(text=extracted_text, image_data=list(zip(texts, pages)), signature=None,
+                           mode=mode, source=None)
+
+def locate_signature(document):
+    """Signature crop of a document: from the form layout, else next to the 'Signature' keyword."""
+    if document.signature is not None:
+        return document.signature
+    if document.image_data is None:
+        # Read from the text layer, so page 1 is only rasterized now that the signature is needed
+        ocr = registry.get("ocr")
+        with metrics.stage("pdf.rasterize"):
+            page = np.array(ocr.convert_from_bytes(document.source, dpi=OCR_TEMPLATE_DPI, first_page=1, last_page=1,
+                                                   poppler_path=POPPLER_PATH)[0])
+        with metrics.stage("form.locate_fields"):
+            regions = template_regions(page)
+        # Kept on the cached document, so later requests for the same file skip rasterizing
+        document.image_data = [(document.text, page)]
+        document.signature = regions["signature"] if regions is not None else None
+        if document.signature is not None:
+            return document.signature
+    return extract_signature(document.image_data)
 
 def parse_claim_form(text):
     fields = {
@@ -165,48 +651,45 @@ def parse_claim_form(text):
     }
     
     claim_data = {}
-    for key, regex in fields.items():
-        match = re.search(regex, text)
-        claim_data[key] = match.group(1).strip() if match else None
+    with metrics.stage("form.parse"):
+        for key, regex in fields.items():
+            match = re.search(regex, text)
+            claim_data[key] = match.group(1).strip() if match else None
     
     return claim_data
 
 @app.route("/ocr-predict", methods=["POST"])
 def ocr_predict():
-    if "file" not in request.files:
-        return jsonify({"error": "No file provided"}), 400
-    
-    file = request.files["file"]
-    pdf_path = "uploaded_claim_form.pdf"
-    file.save(pdf_path)
+    data, error = uploaded_pdf()
+    if error:
+        return jsonify({"error": error}), 400
     
-    extracted_text, image_data = extract_text_from_pdf(pdf_path)
-    claim_data = parse_claim_form(extracted_text)
+    document = extract_text_from_pdf(data)
+    claim_data = parse_claim_form(document.text)
     
     if not claim_data:
         return jsonify({"error": "Could not extract data from PDF"}), 400
-    
-    input_data = np.array([[
-        int(claim_data.get("age", 0)), 
-        int(claim_data.get("premium_amount", 0)), 
-        int(claim_data.get("sum_assured", 0)), 
-        int(claim_data.get("income", 0)),
-        (datetime.strptime(claim_data["claim_date"], "%Y-%m-%d") - datetime.strptime(claim_data["policy_start_date"], "%Y-%m-%d")).days,
-        le_channel.transform([claim_data["channel"]])[0],
-        le_product.transform([claim_data["product_type"]])[0]
-    ]])
-    
-    input_data = scaler.transform(input_data)
-    fraud_prediction = model.predict(input_data)[0]
-    fraud_category = le_fraud.inverse_transform([fraud_prediction])[0]
-    
-    response = {
-        **claim_data,
-        "fraud_category": fraud_category,
-        "confidence": "high" if fraud_prediction > 3 else "medium" if fraud_prediction > 1 else "low"
-    }
-    
-    return jsonify(response)
+
+    try:
+        scored = predict_claim_form(claim_data)
+    except ValueError as e:
+        return jsonify({"error": f"Could not score the claim form: {str(e)}", **claim_data}), 400
+    return jsonify({**scored, "extraction": document.mode})
+
+def predict_claim_form(claim_data):
+    """Run the fraud model on fields parsed from a claim form."""
+    # OCR'd amounts may carry thousands separators
+    record = {key: value.replace(",", "") if value else value for key, value in claim_data.items()}
+    bundle = registry.get("tabular").current
+    with metrics.stage("claim.features"):
+        input_data = bundle.features.raw_record(record)
+    scored = decide_claim(bundle, input_data)
+    if scored is None:
+        with metrics.stage("claim.model"):
+            scored = bundle.batcher.predict(input_data)
+    result = bundle.describe_row(scored)
+    metrics.count_rows("document")
+    return {**claim_data, **result}
 
 def extract_signature(image_data):
     """Find and extract the signature region based on 'Signature' keyword in OCR text."""
@@ -223,46 +706,73 @@ def extract_signature(image_data):
 def predict_signature(image):
     """Predict if the extracted signature is real or forged."""
     try:
-        # Convert to grayscale if not already
-        if len(image.shape) == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-        # Resize to exact dimensions needed
-        image_resized = cv2.resize(image, (128, 128))
-        
-        # Ensure correct shape and normalization
-        image_resized = image_resized.astype('float32') / 255.0
-        image_resized = image_resized.reshape(1, 128, 128, 1)
-        
-        prediction = signature_model.predict(image_resized, verbose=0)
-        result = "forged" if prediction[0][0] >= 0.5 else "real"
-        confidence = prediction[0][0] if prediction[0][0] >= 0.5 else 1 - prediction[0][0]
-
-        return {"result": result, "confidence": round(confidence * 100, 2)}
-    
+        # Crops from concurrent requests are scored together in one batch
+        scorer = registry.get("signature")
+        with metrics.stage("signature.model"):
+            return scorer.score(image)
+
     except Exception as e:
-        print(f"Error in predict_signature: {str(e)}")  # Add debugging
+        metrics.error("signature.model", f"Error in predict_signature: {str(e)}")
         return {"error": str(e)}
 
 @app.route("/signature_check", methods=["POST"])
 def signature_check():
     """API Endpoint to check the authenticity of a signature in a PDF."""
-    if "file" not in request.files:
-        return jsonify({"error": "No file provided"}), 400
+    data, error = uploaded_pdf()
+    if error:
+        return jsonify({"error": error}), 400
 
-    file = request.files["file"]
-    pdf_path = "uploaded_claim_form.pdf"
-    file.save(pdf_path)
+    document = extract_text_from_pdf(data)
+    return jsonify({**check_signature(document), "extraction": document.mode})
 
-    extracted_text, image_data = extract_text_from_pdf(pdf_path)
-    signature_img = extract_signature(image_data)
+def check_signature(document):
+    with metrics.stage("signature.locate"):
+        signature_img = locate_signature(document)
 
     if signature_img is not None:
-        signature_prediction = predict_signature(signature_img)
-    else:
-        signature_prediction = {"error": "Signature not found"}
+        return predict_signature(signature_img)
+    return {"error": "Signature not found"}
+
+@app.route("/verify-document", methods=["POST"])
+def verify_document():
+    """Extract a claim form once (text layer or OCR), then run fraud scoring and the signature check on it."""
+    data, error = uploaded_pdf()
+    if error:
+        return jsonify({"error": error}), 400
 
-    return jsonify(signature_prediction)
+    document = extract_text_from_pdf(data)
+    claim_data = parse_claim_form(document.text)
+
+    if not claim_data:
+        return jsonify({"error": "Could not extract data from PDF"}), 400
+
+    try:
+        scored = predict_claim_form(claim_data)
+    except ValueError as e:
+        return jsonify({"error": f"Could not score the claim form: {str(e)}", **claim_data}), 400
+    return jsonify({
+        **scored,
+        "signature": check_signature(document),
+        "extraction": document.mode
+    })
+
+@app.route("/document-cache/stats", methods=["GET"])
+def document_cache_stats():
+    return jsonify(document_cache.stats())
+
+def start_background_work():
+    """Resume unfinished bulk jobs and pre-warm models; starts threads, so run it after any fork."""
+    bulk_jobs.resume()
+    # A pre-forking master loads the bundles without a watcher; each worker watches from the start
+    if registry.is_loaded("tabular"):
+        registry.get("tabular").start_watcher()
+    if PREWARM_MODELS:
+        registry.prewarm(PREWARM_MODELS)
+
+# Pre-forking servers defer this to each worker (see serve.py). OCR and chart pool processes import
+# the main script again while they start up (multiprocessing sets `_inheriting` then); they never run it
+if os.environ.get("DEFER_BACKGROUND_WORK") != "1" and not getattr(multiprocessing.current_process(), "_inheriting", False):
+    start_background_work()
 
 if __name__ == "__main__":
     app.run(debug=True)
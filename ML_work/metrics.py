@@ -0,0 +1,336 @@
+import cProfile
+import glob
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from batching import Histogram
+
+# Seconds: from sub-millisecond model calls on cached features up to multi-page OCR
+LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# A worker's snapshot older than this many flush intervals is from a dead process; its gauges are dropped
+STALE_FLUSHES = 3
+
+
+class Metric:
+    """One metric family: a counter, gauge or histogram keyed by label values."""
+
+    def __init__(self, name, kind, help, labelnames=(), buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets or LATENCY_BUCKETS
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def inc(self, value=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value=1, **labels):
+        self.inc(-value, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        histogram = self._values.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._values.setdefault(key, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(dict(zip(self.labelnames, key)), value.snapshot() if self.kind == "histogram" else value)
+                for key, value in values]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are updated in place under a per-family lock, so recording is a
+    dict update. Collectors are called only when metrics are rendered, to
+    read counters that other components already keep (cache hits, batch
+    sizes). With `snapshot_dir`, every process writes its samples there
+    every `flush_seconds` and `render` sums all of them, so a scrape of any
+    gunicorn worker reports the whole server; counters of exited workers are
+    kept, their gauges dropped. Ratios are computed after that merge.
+    """
+
+    def __init__(self, namespace, const_labels=None, snapshot_dir=None, flush_seconds=5.0):
+        self.namespace = namespace
+        self.const_labels = dict(const_labels or {})
+        self.snapshot_dir = snapshot_dir
+        self.flush_seconds = flush_seconds
+        self._metrics = {}
+        self._collectors = []
+        self._ratios = []
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    def _add(self, name, kind, help, labelnames=(), buckets=None):
+        metric = Metric(f"{self.namespace}_{name}", kind, help, labelnames, buckets)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(name, "counter", help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(name, "gauge", help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=None):
+        return self._add(name, "histogram", help, labelnames, buckets)
+
+    def add_collector(self, collect):
+        """`collect()` returns (name, kind, help, [(labels, value or Histogram snapshot)]) tuples."""
+        self._collectors.append(collect)
+
+    def add_ratio(self, name, help, numerator, denominator):
+        """Gauge of sum(numerator metrics) / sum(denominator metrics), over all label values."""
+        self._ratios.append((f"{self.namespace}_{name}", help, numerator, denominator))
+
+    def snapshot(self):
+        families = {name: (metric.kind, metric.help, metric.samples()) for name, metric in self._metrics.items()}
+        for collect in self._collectors:
+            try:
+                for name, kind, help, samples in collect():
+                    families[f"{self.namespace}_{name}"] = (kind, help, samples)
+            except Exception as e:
+                print(f"Metrics collector error: {str(e)}")
+        return families
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.snapshot_dir, f"{pid}.json")
+
+    def flush(self):
+        """Write this process's samples for the other workers' scrapes."""
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def ensure_flusher(self):
+        # Threads do not survive fork, so each worker starts its own on first use
+        if not self.snapshot_dir or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Metrics flush error: {str(e)}")
+            time.sleep(self.flush_seconds)
+
+    def _snapshots(self):
+        own = self.snapshot()
+        if not self.snapshot_dir:
+            return [own]
+        snapshots = [own]
+        own_path = self._snapshot_path(os.getpid())
+        stale_before = time.time() - STALE_FLUSHES * self.flush_seconds
+        for path in glob.glob(os.path.join(self.snapshot_dir, "*.json")):
+            if path == own_path:
+                continue
+            try:
+                live = os.path.getmtime(path) >= stale_before
+                with open(path) as f:
+                    families = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not live:
+                families = {name: family for name, family in families.items() if family[0] != "gauge"}
+            snapshots.append(families)
+        return snapshots
+
+    def collect(self):
+        """All families summed across processes, as {name: (kind, help, {label tuple: value})}."""
+        merged = {}
+        for families in self._snapshots():
+            for name, (kind, help, samples) in families.items():
+                _, _, values = merged.setdefault(name, (kind, help, {}))
+                for labels, value in samples:
+                    key = tuple(sorted(labels.items()))
+                    if kind == "histogram":
+                        summed = values.setdefault(key, {"buckets": {}, "count": 0, "sum": 0.0})
+                        for bound, count in value["buckets"].items():
+                            summed["buckets"][bound] = summed["buckets"].get(bound, 0) + count
+                        summed["count"] += value["count"]
+                        summed["sum"] += value["sum"]
+                    else:
+                        values[key] = values.get(key, 0) + value
+
+        def total(names):
+            names = [f"{self.namespace}_{name}" for name in names]
+            return sum(sum(merged[name][2].values()) for name in names if name in merged)
+
+        for name, help, numerator, denominator in self._ratios:
+            den = total(denominator)
+            merged[name] = ("gauge", help, {(): total(numerator) / den if den else 0.0})
+        return merged
+
+    def render(self):
+        lines = []
+        for name, (kind, help, values) in self.collect().items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in values.items():
+                labels = {**self.const_labels, **dict(key)}
+                if kind == "histogram":
+                    for bound, count in value["buckets"].items():
+                        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value['sum']}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class ServiceMetrics:
+    """Request, stage, row and error metrics for one Flask service, with sampled request profiling.
+
+    `instrument(app)` counts requests by endpoint and status, times them,
+    tracks in-flight requests and adds GET /metrics. Code on the hot path
+    wraps its steps in `stage(name)`. When a request is sampled
+    (`profile_sample_rate`, or an `X-Profile: 1` header if
+    `profile_on_demand`), it runs under cProfile, and the profile is saved
+    to `profile_dir` if the request took at least `profile_slow_ms` (always,
+    for on-demand requests). One request is profiled at a time per process;
+    work done on other threads, such as the micro-batcher or the OCR pool,
+    shows up in the stage timers instead.
+    """
+
+    def __init__(self, service, snapshot_dir=None, flush_seconds=5.0, profile_sample_rate=0.0,
+                 profile_slow_ms=1000.0, profile_dir="./profiles", profile_on_demand=False):
+        self.registry = MetricsRegistry("fraud", {"service": service}, snapshot_dir, flush_seconds)
+        self.requests = self.registry.counter(
+            "http_requests_total", "Requests handled, by endpoint, method and status.",
+            ["endpoint", "method", "status"])
+        self.request_seconds = self.registry.histogram(
+            "http_request_duration_seconds", "Request latency, by endpoint.", ["endpoint"])
+        self.in_flight = self.registry.gauge(
+            "http_requests_in_flight", "Requests being handled, by endpoint.", ["endpoint"])
+        self.stage_seconds = self.registry.histogram(
+            "stage_duration_seconds", "Time spent in each pipeline stage.", ["stage"])
+        self.rows = self.registry.counter("rows_processed_total", "Claims scored or analysed, by source.",
+                                          ["source"])
+        self.errors = self.registry.counter("errors_total", "Errors caught and logged, by stage.", ["stage"])
+        self.profiles = self.registry.counter("profiles_captured_total", "Request profiles saved to disk.")
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = profile_dir
+        self.profile_on_demand = profile_on_demand
+        self._profile_lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+    def observe_stage(self, name, seconds):
+        self.stage_seconds.observe(seconds, stage=name)
+
+    def count_rows(self, source, rows=1):
+        self.rows.inc(rows, source=source)
+
+    def error(self, stage, message):
+        """Log an error as before and count it."""
+        print(message)
+        self.errors.inc(stage=stage)
+
+    def record_request(self, endpoint, method, status, seconds):
+        self.requests.inc(endpoint=endpoint, method=method, status=status)
+        self.request_seconds.observe(seconds, endpoint=endpoint)
+
+    def instrument(self, app):
+        from flask import Response, g, request
+
+        @app.before_request
+        def start_request():
+            self.registry.ensure_flusher()
+            g.metrics_started = time.perf_counter()
+            g.metrics_endpoint = request.endpoint or "unmatched"
+            self.in_flight.inc(endpoint=g.metrics_endpoint)
+            forced = self.profile_on_demand and request.headers.get("X-Profile") == "1"
+            if (forced or random.random() < self.profile_sample_rate) and self._profile_lock.acquire(blocking=False):
+                g.metrics_profiler = cProfile.Profile()
+                g.metrics_profile_forced = forced
+                try:
+                    g.metrics_profiler.enable()
+                except ValueError:
+                    # Another profiler is active in this thread (e.g. a debugger)
+                    g.metrics_profiler = None
+                    self._profile_lock.release()
+
+        @app.after_request
+        def record_status(response):
+            g.metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def finish_request(exc):
+            started = g.pop("metrics_started", None)
+            if started is None:
+                return
+            elapsed = time.perf_counter() - started
+            endpoint = g.pop("metrics_endpoint")
+            self.in_flight.dec(endpoint=endpoint)
+            # Unhandled exceptions skip after_request and become 500s
+            self.record_request(endpoint, request.method, g.pop("metrics_status", 500), elapsed)
+            profiler = g.pop("metrics_profiler", None)
+            if profiler is not None:
+                profiler.disable()
+                try:
+                    if g.pop("metrics_profile_forced", False) or elapsed * 1000 >= self.profile_slow_ms:
+                        self._save_profile(profiler, endpoint, elapsed)
+                finally:
+                    self._profile_lock.release()
+
+        @app.route("/metrics", methods=["GET"])
+        def metrics():
+            return Response(self.registry.render(), mimetype="text/plain; version=0.0.4")
+
+    def _save_profile(self, profiler, endpoint, elapsed):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof"
+        path = os.path.join(self.profile_dir, name)
+        # Open with `python -m pstats <file>` or snakeviz
+        profiler.dump_stats(path)
+        self.profiles.inc()
+        print(f"Saved profile of a {elapsed * 1000:.0f} ms {endpoint} request to {path}")
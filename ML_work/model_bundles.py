@@ -0,0 +1,392 @@
+import json
+import os
+import re
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from batching import MicroBatcher
+from calibration import CALIBRATION_FILE, ProbabilityCalibrator, risk_levels
+from features import FeatureTransformer
+from forest import FlatForest
+
+# Bundle directory names as written by train.py; anything else is rejected
+VERSION_PATTERN = re.compile(r"[\w.-]+")
+
+# Class whose probability is the complement of the fraud probability
+NO_FRAUD_CATEGORY = "No Fraud"
+
+
+class ModelBundle:
+    """One trained model version, loaded for scoring.
+
+    Holds the encoders, scaler, compiled feature pipeline and memory-mapped
+    flat forest from a bundle directory written by train.py (or from the
+    legacy loose files in ML_work/). The sklearn forest is unpickled only
+    when a batch is too large for the flat forest. Each bundle has its own
+    /predict micro-batcher, so a row is always encoded and scored by the
+    same version even while a new one is being swapped in.
+
+    Scoring returns calibrated class probabilities (uncalibrated forest
+    probabilities for bundles trained without a calibrator); the risk level
+    comes from the fraud probability and the configured thresholds. With a
+    `rules` engine, `score_raw` and `decide_row` settle the rows a rule
+    decides with all probability on the rule's category, and only the other
+    rows are scaled and scored.
+    """
+
+    def __init__(self, path, version, flat_forest_max_rows=512, batch_max_size=32, batch_max_wait_ms=5.0,
+                 risk_high_threshold=0.7, risk_medium_threshold=0.4, rules=None):
+        self.path = path
+        self.version = version
+        self.rules = rules
+        self.flat_forest_max_rows = flat_forest_max_rows
+        self.risk_high_threshold = risk_high_threshold
+        self.risk_medium_threshold = risk_medium_threshold
+        self.scaler = joblib.load(os.path.join(path, "scaler.pkl"))
+        self.le_channel = joblib.load(os.path.join(path, "label_encoder_channel.pkl"))
+        self.le_product = joblib.load(os.path.join(path, "label_encoder_product.pkl"))
+        self.le_fraud = joblib.load(os.path.join(path, "label_encoder_fraud.pkl"))
+        self.features = FeatureTransformer(self.le_channel, self.le_product, self.scaler)
+        self.classes = np.asarray(self.le_fraud.classes_)
+        self.class_index = {c: i for i, c in enumerate(self.classes)}
+        no_fraud = np.flatnonzero(self.classes == NO_FRAUD_CATEGORY)
+        self.no_fraud_index = int(no_fraud[0]) if len(no_fraud) else None
+        calibration_path = os.path.join(path, CALIBRATION_FILE)
+        self.calibrator = ProbabilityCalibrator.load(calibration_path) if os.path.exists(calibration_path) else None
+        forest_path = os.path.join(path, "fraud_forest")
+        # Read-only memory map: worker processes share one copy through the page cache
+        self.forest = FlatForest.load(forest_path, mmap_mode="r") if os.path.exists(forest_path) else None
+        manifest_path = os.path.join(path, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        self.loaded_at = time.time()
+        self.batcher = MicroBatcher(self.score_batch, max_batch_size=batch_max_size, max_wait_ms=batch_max_wait_ms)
+        self._sklearn_model = None
+        self._sklearn_lock = threading.Lock()
+
+    @property
+    def sklearn_loaded(self):
+        return self._sklearn_model is not None
+
+    def sklearn_model(self):
+        # Unpickled trees are private to each process, so this is only loaded when the flat forest can't serve
+        if self._sklearn_model is None:
+            with self._sklearn_lock:
+                if self._sklearn_model is None:
+                    self._sklearn_model = joblib.load(os.path.join(self.path, "fraud_model.pkl"))
+        return self._sklearn_model
+
+    def predict_proba(self, X):
+        """Class probabilities for scaled features, calibrated when the bundle has a calibrator."""
+        if self.forest is not None and len(X) <= self.flat_forest_max_rows:
+            proba = self.forest.predict_proba(X)
+        else:
+            proba = self.sklearn_model().predict_proba(X)
+        return self.calibrator.transform(proba) if self.calibrator is not None else proba
+
+    def score(self, X):
+        """Category, fraud probability, risk level and class probabilities for each row of scaled features."""
+        proba = self.predict_proba(X)
+        if self.no_fraud_index is None:
+            fraud_probability = np.ones(len(proba))
+        else:
+            fraud_probability = 1.0 - proba[:, self.no_fraud_index]
+        return {
+            "fraud_category": self.classes[np.argmax(proba, axis=1)],
+            "fraud_probability": fraud_probability,
+            "risk_level": risk_levels(fraud_probability, self.risk_high_threshold, self.risk_medium_threshold),
+            "probabilities": proba
+        }
+
+    def score_raw(self, raw):
+        """`score` for unscaled feature rows, plus which rule (or "model") decided each one."""
+        raw = np.asarray(raw, dtype=np.float64)
+        decision = self.rules.evaluate(raw, self.features) if self.rules is not None else None
+        if decision is None or not decision.decided.any():
+            scores = self.score(self.features.scale(raw))
+            scores["decided_by"] = np.full(len(raw), "model", dtype=object)
+            return scores
+
+        decided = decision.decided
+        proba = np.zeros((len(raw), len(self.classes)))
+        if not decided.all():
+            proba[~decided] = self.predict_proba(self.features.scale(raw[~decided]))
+        for category in set(decision.categories[decided]):
+            # A category this bundle was not trained on gets no column, so its row is all zeros
+            if category in self.class_index:
+                proba[decided & (decision.categories == category), self.class_index[category]] = 1.0
+
+        fraud_category = self.classes[np.argmax(proba, axis=1)].astype(object)
+        fraud_category[decided] = decision.categories[decided]
+        if self.no_fraud_index is None:
+            model_probability = np.ones(len(proba))
+        else:
+            model_probability = 1.0 - proba[:, self.no_fraud_index]
+        fraud_probability = np.where(decided, (decision.categories != NO_FRAUD_CATEGORY).astype(np.float64),
+                                     model_probability)
+        return {
+            "fraud_category": fraud_category,
+            "fraud_probability": fraud_probability,
+            "risk_level": risk_levels(fraud_probability, self.risk_high_threshold, self.risk_medium_threshold),
+            "probabilities": proba,
+            "decided_by": decision.rules
+        }
+
+    def decide_row(self, row):
+        """`score_batch` result for one unscaled row if a rule decides it, else None (it needs the model)."""
+        if self.rules is None:
+            return None
+        raw = np.asarray([row], dtype=np.float64)
+        decision = self.rules.evaluate(raw, self.features)
+        if decision is None or not decision.decided[0]:
+            return None
+        category = decision.categories[0]
+        probabilities = np.zeros(len(self.classes))
+        if category in self.class_index:
+            probabilities[self.class_index[category]] = 1.0
+        fraud_probability = 0.0 if category == NO_FRAUD_CATEGORY else 1.0
+        risk_level = risk_levels(np.asarray([fraud_probability]), self.risk_high_threshold,
+                                 self.risk_medium_threshold)[0]
+        return category, fraud_probability, risk_level, probabilities, decision.rules[0]
+
+    @property
+    def cache_version(self):
+        """Key for cached results: the model version, and the rule file's version when rules apply."""
+        if self.rules is None:
+            return self.version
+        # Checked here too, so an edited rule file also takes effect for claims answered from the cache
+        self.rules.check_for_update()
+        return f"{self.version}+rules.{self.rules.version}"
+
+    def score_batch(self, rows):
+        """Score a 2-D array of raw feature rows in one vectorized pass; one result tuple per row."""
+        scores = self.score(self.features.scale(rows))
+        return [(*result, "model") for result in zip(scores["fraud_category"], scores["fraud_probability"],
+                                                     scores["risk_level"], scores["probabilities"])]
+
+    def describe_row(self, result):
+        """JSON fields for one `score_batch` or `decide_row` result."""
+        fraud_category, fraud_probability, risk_level, probabilities, decided_by = result
+        return {
+            "fraud_category": str(fraud_category),
+            "fraud_probability": round(float(fraud_probability), 4),
+            "risk_level": str(risk_level),
+            # Lower-case risk level, as the claims backend stores it
+            "confidence": str(risk_level).lower(),
+            "probabilities": {str(c): round(float(p), 4) for c, p in zip(self.classes, probabilities)},
+            "model_version": self.version,
+            "decided_by": str(decided_by)
+        }
+
+    def sample_claims(self):
+        """Claims to warm up on: the bundle's held-out sample, or one per channel/product pair."""
+        path = os.path.join(self.path, "sample_claims.csv")
+        if os.path.exists(path):
+            return pd.read_csv(path)
+        pairs = [(c, p) for c in self.le_channel.classes_ for p in self.le_product.classes_]
+        return pd.DataFrame({
+            "age": 40, "premium_amount": 20000, "sum_assured": 600000, "income": 900000,
+            "channel": [c for c, _ in pairs], "product_type": [p for _, p in pairs],
+            "claim_date": "2025-01-10", "policy_start_date": "2024-01-01"
+        })
+
+    def warm_up(self, include_sklearn=False):
+        """Score sample claims through every path this bundle will serve, and check the output."""
+        X = self.features.transform_frame(self.sample_claims())
+        for batch in (X[:1], X):
+            proba = self.predict_proba(batch)
+            if proba.shape[1] != len(self.classes) or not np.allclose(proba.sum(axis=1), 1.0):
+                raise ValueError(f"Bundle {self.version} does not produce probabilities over its label encoder")
+        if include_sklearn or self.forest is None:
+            self.sklearn_model().predict_proba(X)
+        return len(X)
+
+    def close(self):
+        self.batcher.close()
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "created_at": self.manifest.get("created_at"),
+            "params": self.manifest.get("params"),
+            "calibrated": self.calibrator is not None,
+            "sklearn_loaded": self.sklearn_loaded
+        }
+
+
+class BundleManager:
+    """Serves one model bundle at a time and swaps versions without a restart.
+
+    `current` is read once per request and the bundle it returns is used for
+    the whole request, so a swap never mixes versions within a prediction.
+    A new bundle is loaded and warmed up before a single reference
+    assignment makes it current; requests already holding the old bundle
+    finish on it. The replaced bundle stays in memory for `rollback`.
+
+    A watcher thread (started lazily in each process, like the batchers, or
+    by `start_watcher`) polls `<bundles_dir>/LATEST` and activates the
+    version it names when it changes. After a rollback the watcher only reacts to the next change of
+    LATEST, not to the version that was rolled back. A version that fails to
+    load or warm up is counted in `failures` and, when the watcher found it,
+    passed to `report_error(stage, message)`.
+    """
+
+    def __init__(self, bundles_dir, load_bundle, warm_up=None, poll_seconds=5.0, fallback_path=".",
+                 report_error=None):
+        self.bundles_dir = bundles_dir
+        self.load_bundle = load_bundle
+        self.warm_up = warm_up
+        self.poll_seconds = poll_seconds
+        self.fallback_path = fallback_path
+        self.report_error = report_error
+        self.swaps = 0
+        self.rollbacks = 0
+        self.failures = 0
+        self.last_error = None
+        self._current = None
+        self._previous = None
+        self._latest_seen = None
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+
+    @property
+    def current(self):
+        self._ensure_watcher()
+        return self._current
+
+    @property
+    def serving(self):
+        """The serving bundle without starting the watcher, for a process that is about to fork."""
+        return self._current
+
+    def start_watcher(self):
+        """Start this process's watcher now instead of at the first `current` read."""
+        self._ensure_watcher()
+
+    def read_latest(self):
+        try:
+            with open(os.path.join(self.bundles_dir, "LATEST")) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def versions(self):
+        if not os.path.isdir(self.bundles_dir):
+            return []
+        return sorted(name for name in os.listdir(self.bundles_dir)
+                      if VERSION_PATTERN.fullmatch(name) and not name.startswith(".")
+                      and os.path.isdir(os.path.join(self.bundles_dir, name)))
+
+    def load_initial(self):
+        """Load the bundle named by LATEST, or the legacy loose artifacts if there is none."""
+        latest = self.read_latest()
+        self._latest_seen = latest
+        if latest is not None:
+            return self.activate(latest)
+        with self._lock:
+            bundle = self.load_bundle(self.fallback_path, "legacy")
+            self._install(bundle)
+            return bundle
+
+    def activate(self, version):
+        """Load, warm up and switch to `version`; the serving bundle is untouched if any step fails."""
+        if not VERSION_PATTERN.fullmatch(version) or version.startswith("."):
+            raise ValueError(f"Invalid bundle version: {version}")
+        path = os.path.join(self.bundles_dir, version)
+        if not os.path.isdir(path):
+            raise ValueError(f"Unknown bundle version: {version}")
+
+        with self._lock:
+            if self._current is not None and self._current.version == version:
+                return self._current
+            if self._previous is not None and self._previous.version == version:
+                self._previous, self._current = self._current, self._previous
+                self.swaps += 1
+                return self._current
+            try:
+                bundle = self.load_bundle(path, version)
+                if self.warm_up is not None:
+                    self.warm_up(bundle, self._current)
+            except Exception as e:
+                self.last_error = f"{version}: {str(e)}"
+                self.failures += 1
+                raise
+            self._install(bundle)
+            self.last_error = None
+            return bundle
+
+    def _install(self, bundle):
+        retired = self._previous
+        self._previous = self._current
+        # The swap itself: one reference assignment, atomic for concurrent readers
+        self._current = bundle
+        if self._previous is not None:
+            self.swaps += 1
+        if retired is not None and retired is not bundle:
+            retired.close()
+
+    def rollback(self):
+        """Make the previous in-memory bundle current again (no loading involved)."""
+        with self._lock:
+            if self._previous is None:
+                raise ValueError("No previous bundle to roll back to")
+            self._previous, self._current = self._current, self._previous
+            self.rollbacks += 1
+            return self._current
+
+    def check_for_update(self):
+        latest = self.read_latest()
+        if latest is None or latest == self._latest_seen:
+            return False
+        # Recorded first, so a bundle that fails to load is not retried on every poll
+        self._latest_seen = latest
+        try:
+            self.activate(latest)
+            return True
+        except Exception as e:
+            message = f"Error activating model bundle {latest}: {str(e)}"
+            if self.report_error is not None:
+                self.report_error("model_bundles", message)
+            else:
+                print(message)
+            return False
+
+    def _ensure_watcher(self):
+        if self.poll_seconds <= 0:
+            return
+        # Threads do not survive fork, so pre-forking servers get a watcher per worker
+        if self._watcher is not None and self._watcher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._watcher is not None and self._watcher_pid == os.getpid():
+                return
+            self._watcher = threading.Thread(target=self._watch, name="bundle-watcher", daemon=True)
+            self._watcher_pid = os.getpid()
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            self.check_for_update()
+
+    def stats(self):
+        return {
+            "current": self._current.describe() if self._current is not None else None,
+            "previous": self._previous.describe() if self._previous is not None else None,
+            "latest": self.read_latest(),
+            "available": self.versions(),
+            "swaps": self.swaps,
+            "rollbacks": self.rollbacks,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "poll_seconds": self.poll_seconds
+        }
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ModelRegistry:
+    """Loads named artifact groups the first time they are used.
+
+    Each group is registered with a zero-argument loader. `get` runs the loader
+    once (concurrent callers wait for the same load) and records how long it
+    took and how much resident memory it added. `prewarm` loads groups in a
+    background thread so the service can accept requests before heavy
+    frameworks such as TensorFlow are imported.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+
+    def register(self, name, loader):
+        with self._registry_lock:
+            self._loaders[name] = loader
+            self._locks[name] = threading.Lock()
+            self._stats[name] = {"loaded": False, "load_seconds": None, "rss_delta_bytes": None,
+                                 "loaded_at": None, "error": None}
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+
+            rss_before = current_rss_bytes()
+            started = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                self._stats[name]["error"] = str(e)
+                raise
+            rss_after = current_rss_bytes()
+
+            self._stats[name].update({
+                "loaded": True,
+                "load_seconds": round(time.perf_counter() - started, 4),
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+                "loaded_at": time.time(),
+                "error": None
+            })
+            self._models[name] = model
+            return model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def prewarm(self, names=None):
+        """Load the given groups (default: all) in a background thread."""
+        names = list(names) if names is not None else list(self._loaders)
+
+        def warm():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Pre-warming {name} failed: {str(e)}")
+
+        thread = threading.Thread(target=warm, name="model-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {
+            "models": {name: dict(stats) for name, stats in self._stats.items()},
+            "rss_bytes": current_rss_bytes()
+        }
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import pytesseract
+
+# Workers come from a forkserver (spawn where there is none), not a fork of the service: the pool is
+# started from a request thread, and forking a threaded process that may hold TensorFlow's or a
+# logging lock can leave the child deadlocked
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+def _init_worker(tesseract_cmd):
+    # Tesseract's own OpenMP threads would oversubscribe cores already used by the pool
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+
+def ocr_gray_page(gray, lang="eng", config="", timings=None):
+    """Otsu-threshold a grayscale page (or field crop) and OCR it; seconds per step are appended to `timings`."""
+    started = time.perf_counter()
+    processed_img = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    thresholded = time.perf_counter()
+    text = pytesseract.image_to_string(processed_img, lang=lang, config=config)
+    if timings is not None:
+        timings.append(("ocr.threshold", thresholded - started))
+        timings.append(("ocr.tesseract", time.perf_counter() - thresholded))
+    return text
+
+
+def _ocr_shared_page(shm_name, shape, lang, config):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        timings = []
+        text = ocr_gray_page(np.ndarray(shape, dtype=np.uint8, buffer=shm.buf), lang, config, timings)
+        return text, timings
+    finally:
+        shm.close()
+
+
+class OCRPool:
+    """Process pool that OCRs the pages of a document concurrently.
+
+    Pages are handed to workers as single-channel uint8 buffers in shared memory,
+    so only the segment name and shape are pickled. Results come back in page order.
+    With one worker (or a single page) OCR runs inline and no pool is started.
+    `observe(stage, seconds)`, if given, receives the threshold and Tesseract
+    time of every page, measured in whichever process OCR'd it.
+    """
+
+    def __init__(self, workers=None, lang="eng", observe=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.lang = lang
+        self.observe = observe
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=_MP_CONTEXT,
+                    initializer=_init_worker,
+                    initargs=(pytesseract.pytesseract.tesseract_cmd,)
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def ocr_pages(self, gray_pages, config=""):
+        """OCR grayscale images concurrently; `config` is passed to Tesseract (e.g. "--psm 7" for one line)."""
+        if self.workers <= 1 or len(gray_pages) <= 1:
+            timings = []
+            texts = [ocr_gray_page(gray, self.lang, config, timings) for gray in gray_pages]
+            self._report(timings)
+            return texts
+
+        executor = self._get_executor()
+        segments = []
+        try:
+            futures = []
+            for gray in gray_pages:
+                gray = np.ascontiguousarray(gray, dtype=np.uint8)
+                shm = shared_memory.SharedMemory(create=True, size=gray.nbytes)
+                segments.append(shm)
+                np.ndarray(gray.shape, dtype=np.uint8, buffer=shm.buf)[:] = gray
+                futures.append(executor.submit(_ocr_shared_page, shm.name, gray.shape, self.lang, config))
+            texts = []
+            for future in futures:
+                text, timings = future.result()
+                self._report(timings)
+                texts.append(text)
+            return texts
+        finally:
+            for shm in segments:
+                shm.close()
+                shm.unlink()
+
+    def _report(self, timings):
+        if self.observe is not None:
+            for stage, seconds in timings:
+                self.observe(stage, seconds)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,70 @@
+import io
+import os
+import subprocess
+import threading
+
+# Pages with fewer non-space characters than this in their text layer are treated as scanned
+TEXT_LAYER_MIN_CHARS = 20
+
+# PDFium is not thread-safe: concurrent calls from request threads crash the process
+_pdfium_lock = threading.Lock()
+
+
+def _pdfium_pages(data):
+    import pypdfium2 as pdfium
+
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(data)
+        try:
+            texts = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+                textpage.close()
+                page.close()
+            return texts
+        finally:
+            pdf.close()
+
+
+def _pdfplumber_pages(data):
+    import pdfplumber
+
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def _pdftotext_pages(data, poppler_path=None):
+    # Poppler is already required by pdf2image, so this reader is always available where OCR is
+    command = os.path.join(poppler_path, "pdftotext") if poppler_path else "pdftotext"
+    output = subprocess.run([command, "-layout", "-enc", "UTF-8", "-", "-"], input=data,
+                            capture_output=True, check=True, timeout=30).stdout
+    # Each page ends with a form feed
+    return output.decode("utf-8").split("\f")[:-1]
+
+
+def read_text_layer(data, poppler_path=None):
+    """Text of every page from a PDF's embedded text layer, or None if no reader can open it.
+
+    Tries pypdfium2, pdfplumber and Poppler's pdftotext, in that order of
+    speed. Scanned pages come back empty (or nearly so); see `scanned_pages`.
+    """
+    readers = [_pdfium_pages, _pdfplumber_pages, lambda d: _pdftotext_pages(d, poppler_path)]
+    for reader in readers:
+        try:
+            return reader(data)
+        except ImportError:
+            continue
+        except FileNotFoundError:
+            # No pdftotext binary either
+            return None
+        except Exception as e:
+            # Malformed or encrypted files: treat as having no text layer and let OCR handle them
+            print(f"Text layer read error: {str(e)}")
+            return None
+    return None
+
+
+def scanned_pages(texts, min_chars=TEXT_LAYER_MIN_CHARS):
+    """Indices of pages whose text layer is too thin to use, so they need OCR."""
+    return [i for i, text in enumerate(texts) if len("".join(text.split())) < min_chars]
@@ -0,0 +1,276 @@
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Bump when the drawing code changes so previously stored charts are not reused
+PLOT_VERSION = "1"
+# Scatter plots with more points than this are drawn from a per-cluster sample
+SCATTER_MAX_POINTS = 3000
+
+# Drawing processes come from a forkserver (spawn where there is none), not a fork of the threaded service
+_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use("Agg")
+    # Fixed SVG element ids, so identical inputs give byte-identical files
+    matplotlib.rcParams["svg.hashsalt"] = "fraud-analytics"
+
+
+def _svg(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="svg", bbox_inches="tight", metadata={"Date": None})
+    return buf.getvalue()
+
+
+def _new_axes(figsize):
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize)
+    return fig, fig.add_subplot()
+
+
+def draw_cluster_scatter(pca1, pca2, cluster, total):
+    import seaborn as sns
+    fig, ax = _new_axes((10, 6))
+    # Points are rasterized inside the SVG; axes and text stay vector
+    sns.scatterplot(x=pca1, y=pca2, hue=cluster, palette="viridis", alpha=0.7, ax=ax, rasterized=True)
+    title = "Fraud Detection Clusters (PCA Reduced)"
+    if len(pca1) < total:
+        title += f" - {len(pca1):,} of {total:,} claims"
+    ax.set_title(title)
+    ax.set_xlabel("Principal Component 1")
+    ax.set_ylabel("Principal Component 2")
+    return _svg(fig)
+
+
+def draw_cluster_distribution(clusters, counts):
+    import seaborn as sns
+    fig, ax = _new_axes((8, 5))
+    sns.barplot(x=clusters, y=counts, hue=clusters, palette="coolwarm", legend=False, ax=ax)
+    ax.set_title("Cluster Size Distribution")
+    ax.set_xlabel("Cluster")
+    ax.set_ylabel("Number of Data Points")
+    return _svg(fig)
+
+
+def draw_feature_boxplot(cluster, values, feature):
+    import seaborn as sns
+    fig, ax = _new_axes((8, 5))
+    sns.boxplot(x=cluster, y=values, hue=cluster, palette="Set2", legend=False, ax=ax)
+    ax.set_title(f"Distribution of {feature} Across Clusters")
+    ax.set_xlabel("Cluster")
+    ax.set_ylabel(feature)
+    return _svg(fig)
+
+
+def draw_correlation_heatmap(corr, labels):
+    import pandas as pd
+    import seaborn as sns
+    fig, ax = _new_axes((10, 8))
+    sns.heatmap(pd.DataFrame(corr, index=labels, columns=labels), annot=True, cmap="coolwarm", fmt=".2f", ax=ax)
+    ax.set_title("Feature Correlation Heatmap")
+    return _svg(fig)
+
+
+def _render(draw_name, kwargs):
+    return globals()[draw_name](**kwargs)
+
+
+def sample_per_cluster(cluster, max_points, seed=0):
+    """Row indices of a deterministic sample that keeps every cluster's share of the points."""
+    if len(cluster) <= max_points:
+        return np.arange(len(cluster))
+    rng = np.random.default_rng(seed)
+    keep = []
+    for label in np.unique(cluster):
+        rows = np.flatnonzero(cluster == label)
+        take = max(1, round(len(rows) * max_points / len(cluster)))
+        keep.append(rng.choice(rows, size=min(take, len(rows)), replace=False))
+    return np.sort(np.concatenate(keep))
+
+
+def plot_specs(df_analysis):
+    """(key path, draw function, inputs) for every chart on the analytics page."""
+    cluster = df_analysis["cluster"].to_numpy()
+    sample = sample_per_cluster(cluster, SCATTER_MAX_POINTS)
+    clusters, counts = np.unique(cluster, return_counts=True)
+
+    specs = [
+        (("cluster_scatter",), "draw_cluster_scatter", {
+            "pca1": df_analysis["pca1"].to_numpy()[sample], "pca2": df_analysis["pca2"].to_numpy()[sample],
+            "cluster": cluster[sample], "total": len(cluster)}),
+        (("cluster_distribution",), "draw_cluster_distribution", {"clusters": clusters, "counts": counts}),
+    ]
+    for feature in [f for f in ["age", "premium_amount", "sum_assured", "income"] if f in df_analysis.columns]:
+        specs.append((("feature_distributions", feature), "draw_feature_boxplot", {
+            "cluster": cluster, "values": df_analysis[feature].to_numpy(), "feature": feature}))
+    specs.append((("correlation_heatmap",), "draw_correlation_heatmap", {
+        "corr": df_analysis.corr().to_numpy(), "labels": list(df_analysis.columns)}))
+    return specs
+
+
+def spec_digest(draw_name, kwargs):
+    """Content address of a chart: a hash of the drawing code version and every input."""
+    hasher = hashlib.sha256(f"{PLOT_VERSION}:{draw_name}".encode())
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        hasher.update(name.encode())
+        if isinstance(value, np.ndarray):
+            hasher.update(f"{value.dtype}{value.shape}".encode())
+            hasher.update(np.ascontiguousarray(value).tobytes())
+        else:
+            hasher.update(repr(value).encode())
+    return hasher.hexdigest()
+
+
+def _flat_digests(digests):
+    for value in digests.values():
+        if isinstance(value, dict):
+            yield from _flat_digests(value)
+        else:
+            yield value
+
+
+class PlotRenderer:
+    """Renders analytics charts in a process pool into a content-addressed store.
+
+    Every chart is keyed by `spec_digest` of its inputs and saved once as
+    `<store_dir>/<digest>.svg`; a chart whose inputs are unchanged is never
+    redrawn, and the digest doubles as its HTTP ETag. Drawing uses
+    matplotlib's object-oriented API (no pyplot state), so charts render
+    concurrently in worker processes. Base64 encodings are kept in a small
+    LRU for the JSON response.
+
+    Each new chart adds a file, so after a render that drew anything the
+    store is pruned: a chart is deleted once it is not among the last
+    `keep_renders` renders of this process and no process has rendered or
+    reused it for `keep_seconds` (reuse refreshes the file's mtime, which is
+    what other processes sharing the store go by).
+    """
+
+    def __init__(self, store_dir="plot_store", workers=None, max_encoded=64, keep_renders=8, keep_seconds=3600.0):
+        self.store_dir = store_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.max_encoded = max_encoded
+        self.keep_seconds = keep_seconds
+        self.rendered = 0
+        self.reused = 0
+        self.pruned = 0
+        self._recent = deque(maxlen=keep_renders)
+        self._encoded = OrderedDict()
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(store_dir, exist_ok=True)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_MP_CONTEXT,
+                                                     initializer=_init_worker)
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def path_for(self, digest):
+        return os.path.join(self.store_dir, f"{digest}.svg")
+
+    def render(self, df_analysis):
+        """Render missing charts; returns the digests nested like the response's `plots`."""
+        pending = {}
+        digests = {}
+        for key, draw_name, kwargs in plot_specs(df_analysis):
+            digest = spec_digest(draw_name, kwargs)
+            target = digests
+            for part in key[:-1]:
+                target = target.setdefault(part, {})
+            target[key[-1]] = digest
+            if digest in pending:
+                self.reused += 1
+                continue
+            try:
+                os.utime(self.path_for(digest))
+                self.reused += 1
+            except FileNotFoundError:
+                pending[digest] = (draw_name, kwargs)
+
+        if self.workers <= 1 or len(pending) <= 1:
+            _init_worker()
+            outputs = {digest: _render(*job) for digest, job in pending.items()}
+        else:
+            executor = self._get_executor()
+            futures = {digest: executor.submit(_render, *job) for digest, job in pending.items()}
+            outputs = {digest: future.result() for digest, future in futures.items()}
+
+        for digest, svg in outputs.items():
+            tmp_path = f"{self.path_for(digest)}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(svg)
+            os.replace(tmp_path, self.path_for(digest))
+        self.rendered += len(outputs)
+        with self._lock:
+            self._recent.append(set(_flat_digests(digests)))
+        if outputs:
+            self.prune()
+        return digests
+
+    def stored(self, digests):
+        """True if every chart of a `render` result is still in the store."""
+        return all(os.path.exists(self.path_for(digest)) for digest in _flat_digests(digests))
+
+    def prune(self):
+        """Delete charts neither rendered recently by this process nor used by any process lately."""
+        with self._lock:
+            keep = set().union(*self._recent)
+        cutoff = time.time() - self.keep_seconds
+        for name in os.listdir(self.store_dir):
+            digest, ext = os.path.splitext(name)
+            if ext != ".svg" or digest in keep:
+                continue
+            path = os.path.join(self.store_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    self.pruned += 1
+            except FileNotFoundError:
+                # Another process pruned it first
+                pass
+
+    def load(self, digest):
+        """SVG bytes for a digest, or None if it is not in the store."""
+        try:
+            with open(self.path_for(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def encoded(self, digest):
+        with self._lock:
+            data = self._encoded.get(digest)
+            if data is not None:
+                self._encoded.move_to_end(digest)
+                return data
+        data = base64.b64encode(self.load(digest)).decode('utf-8')
+        with self._lock:
+            self._encoded[digest] = data
+            while len(self._encoded) > self.max_encoded:
+                self._encoded.popitem(last=False)
+        return data
+
+    def stats(self):
+        return {"rendered": self.rendered, "reused": self.reused, "pruned": self.pruned, "workers": self.workers}
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
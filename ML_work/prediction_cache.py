@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Disk entries are pruned (expired rows, then the oldest beyond the limit) once every this many writes
+PRUNE_EVERY_PUTS = 1000
+
+
+class PredictionCache:
+    """LRU/TTL cache of /predict results, keyed by model version and feature vector.
+
+    The key is a hash of the bundle version and the raw feature row built by
+    `FeatureTransformer.raw_record`, so claims the model cannot tell apart
+    ("30" vs 30, different dates with the same claim duration) share an
+    entry, and a model swap makes every older entry unreachable. The
+    in-memory entries are also dropped the first time a lookup uses a new
+    version.
+
+    With `sqlite_path`, entries are also written to a SQLite file in WAL
+    mode that every worker process on the host reads, so a claim scored by
+    one worker is a hit in the others. Storage errors are printed and
+    treated as misses; the cache never fails a prediction.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600.0, sqlite_path=None, max_disk_entries=100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sqlite_path = sqlite_path
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._puts = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def key_for(version, row):
+        digest = hashlib.sha256(version.encode())
+        digest.update(np.asarray(row, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def _check_version(self, version):
+        # Called with the lock held
+        if version != self._version:
+            if self._version is not None:
+                self._entries.clear()
+                self.invalidations += 1
+            self._version = version
+
+    def get(self, version, row):
+        """The cached result for this row under this model version, or None."""
+        if not self.enabled:
+            return None
+        key = self.key_for(version, row)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, value, now)
+        return value
+
+    def put(self, version, row, value):
+        if not self.enabled:
+            return
+        key = self.key_for(version, row)
+        now = time.time()
+        with self._lock:
+            # Results from a request that started before a swap are not worth keeping
+            if version != self._version:
+                return
+            self._remember(key, value, now)
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY_PUTS == 0
+        self._disk_put(key, version, value, now, prune)
+
+    def _remember(self, key, value, now):
+        # Called with the lock held
+        self._entries[key] = (now + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or forks, so each thread of each process opens its own
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.sqlite_path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS predictions "
+                     "(key TEXT PRIMARY KEY, version TEXT, value TEXT, expires_at REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS predictions_expires_at ON predictions (expires_at)")
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _disk_get(self, key, now):
+        if not self.sqlite_path:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM predictions WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        except sqlite3.Error as e:
+            print(f"Prediction cache read error: {str(e)}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _disk_put(self, key, version, value, now, prune):
+        if not self.sqlite_path:
+            return
+        try:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                         (key, version, json.dumps(value), now + self.ttl_seconds))
+            if prune:
+                conn.execute("DELETE FROM predictions WHERE expires_at <= ?", (now,))
+                evicted = conn.execute(
+                    "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions "
+                    "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (self.max_disk_entries,)).rowcount
+                with self._lock:
+                    self.evictions += max(evicted, 0)
+        except sqlite3.Error as e:
+            print(f"Prediction cache write error: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.sqlite_path:
+            try:
+                self._connection().execute("DELETE FROM predictions")
+            except sqlite3.Error as e:
+                print(f"Prediction cache clear error: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "shared_path": self.sqlite_path,
+                "model_version": self._version,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,184 @@
+import json
+import operator
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from features import FEATURE_COLUMNS
+
+OPERATORS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+             "==": operator.eq, "!=": operator.ne}
+
+# Encoded columns; rules compare them with labels, which are looked up in the bundle's encoders
+CATEGORICAL_FIELDS = {"channel": "channel_lookup", "product_type": "product_lookup"}
+
+# Values computed from the unscaled feature columns
+DERIVED_FIELDS = {
+    "sum_assured_ratio": lambda raw: raw[:, FEATURE_COLUMNS.index("sum_assured")]
+    / raw[:, FEATURE_COLUMNS.index("premium_amount")],
+}
+
+
+def _compile_rule(spec):
+    name, category = spec["name"], spec["category"]
+    conditions = []
+    for field, op, value in spec["when"]:
+        if field not in FEATURE_COLUMNS and field not in DERIVED_FIELDS:
+            raise ValueError(f"Rule {name}: unknown field {field!r}")
+        if op not in OPERATORS:
+            raise ValueError(f"Rule {name}: unknown operator {op!r}")
+        if field in CATEGORICAL_FIELDS and op not in ("==", "!="):
+            raise ValueError(f"Rule {name}: {field} can only be compared with == or !=")
+        if field not in CATEGORICAL_FIELDS and not isinstance(value, (int, float)):
+            raise ValueError(f"Rule {name}: {field} must be compared with a number")
+        conditions.append((field, op, value))
+    return SimpleNamespace(name=name, category=category, certain=spec.get("certain", True), conditions=conditions)
+
+
+def load_rules(path):
+    """Compiled rules from a JSON rule file; ValueError if it is malformed."""
+    with open(path) as f:
+        config = json.load(f)
+    # A catch-all category would settle every unmatched claim without the model
+    if "default" in config:
+        raise ValueError("A default category is not supported; claims no rule matches are scored by the model")
+    try:
+        rules = [_compile_rule(spec) for spec in config["rules"]]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Malformed rule: {str(e)}")
+    names = [rule.name for rule in rules]
+    if len(set(names)) != len(names) or "model" in names:
+        raise ValueError("Rule names must be unique and not 'model'")
+    return rules
+
+
+def _field(raw, field):
+    if field in DERIVED_FIELDS:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return DERIVED_FIELDS[field](raw)
+    return raw[:, FEATURE_COLUMNS.index(field)]
+
+
+def _matches(rule, raw, features):
+    mask = np.ones(len(raw), dtype=bool)
+    for field, op, value in rule.conditions:
+        if field in CATEGORICAL_FIELDS:
+            lookup = getattr(features, CATEGORICAL_FIELDS[field])
+            # A label this bundle's encoder has never seen matches no row, with == and != alike;
+            # != would otherwise match every row and let the rule decide the whole batch
+            if value not in lookup:
+                return np.zeros(len(raw), dtype=bool)
+            value = lookup[value]
+        mask &= OPERATORS[op](_field(raw, field), value)
+    return mask
+
+
+class RuleEngine:
+    """Deterministic fraud rules, evaluated as NumPy masks over a batch before it reaches the model.
+
+    Rules come from a JSON file and are checked in order: a row gets the
+    category of the first rule it matches, as in the if/elif chain
+    generate.py labels claims with. Only rows whose first match is a rule
+    that settles them with certainty skip scaling and the forest; rows matched
+    first by a rule marked "certain": false (one the labelling applies at
+    random) and rows no rule matches are left to the model. The
+    file is re-read when its modification time changes, checked at most
+    every `poll_seconds`; a file that fails to load keeps the previous rules.
+    """
+
+    def __init__(self, path, poll_seconds=5.0):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.rules = []
+        # The file's modification time, so every worker process names the same rules the same way
+        self.version = None
+        self.reloads = 0
+        self.last_error = None
+        self._seen_mtime = None
+        self.rows = 0
+        self.decided = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.check_for_update(force=True)
+
+    def reload(self):
+        """Load the rule file now; True if the new rules are in force."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            rules = load_rules(self.path)
+        except (OSError, ValueError) as e:
+            self.last_error = f"{self.path}: {str(e)}"
+            print(f"Rule config error: {str(e)}")
+            return False
+        # One assignment, so a batch never sees half of an update
+        self.rules = rules
+        self.version = mtime
+        self.reloads += 1
+        self.last_error = None
+        return True
+
+    def check_for_update(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.poll_seconds:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        # A file that failed to load is retried once it changes again, not on every check
+        if mtime is not None and mtime != self._seen_mtime:
+            with self._lock:
+                if mtime != self._seen_mtime:
+                    self._seen_mtime = mtime
+                    self.reload()
+
+    def evaluate(self, raw, features):
+        """Category, deciding rule and a `decided` mask for unscaled feature rows; None if no rules are loaded."""
+        self.check_for_update()
+        rules = self.rules
+        if not rules:
+            return None
+
+        n = len(raw)
+        undecided = np.ones(n, dtype=bool)
+        decided = np.zeros(n, dtype=bool)
+        categories = np.empty(n, dtype=object)
+        names = np.full(n, "model", dtype=object)
+        counts = {}
+        for rule in rules:
+            mask = undecided & _matches(rule, raw, features)
+            # First match wins, so rows an uncertain rule matches are not tried against later rules
+            undecided &= ~mask
+            if rule.certain:
+                decided |= mask
+                categories[mask] = rule.category
+                names[mask] = rule.name
+                counts[rule.name] = int(mask.sum())
+
+        with self._lock:
+            self.rows += n
+            for name, count in counts.items():
+                self.decided[name] = self.decided.get(name, 0) + count
+        return SimpleNamespace(categories=categories, rules=names, decided=decided)
+
+    def stats(self):
+        with self._lock:
+            decided = dict(self.decided)
+            rows = self.rows
+        fast_path = sum(decided.values())
+        return {
+            "path": self.path,
+            "rules": [{"name": rule.name, "category": rule.category, "certain": rule.certain,
+                       "when": rule.conditions} for rule in self.rules],
+            "version": self.version,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "rows": rows,
+            "fast_path_rows": fast_path,
+            "fast_path_fraction": round(fast_path / rows, 4) if rows else None,
+            "decided_by_rule": decided,
+        }
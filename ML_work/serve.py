@@ -0,0 +1,103 @@
+"""Production launch mode for the scoring service: several gunicorn workers on one port.
+
+    python serve.py --workers 4 --bind 0.0.0.0:5000
+
+The master imports main.py and loads the tabular group once before forking, so
+workers share the interpreter, pandas/sklearn and the encoders copy-on-write.
+The flat forest is memory-mapped read-only, so every worker also shares the
+same pages of fraud_forest/ through the page cache. Batches up to
+FLAT_FOREST_MAX_ROWS use it, as in single-process mode; bigger ones (bulk
+chunks) are faster through sklearn's compiled trees, so the master also loads
+the sklearn model before forking and workers share its node arrays
+copy-on-write rather than each unpickling a copy. A bundle swapped in later
+loads sklearn privately in each worker. OCR/TensorFlow are only loaded when a
+document request needs them.
+
+With --asgi, workers are uvicorn workers serving asgi.py: /predict is scored
+on each worker's event loop and document and bulk requests run on their own
+thread pools, so OCR traffic cannot hold up tabular scoring (--threads does
+not apply; see DOCUMENT_WORKERS and friends in asgi.py).
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+
+def build_options(args):
+    options = {
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        # OCR and signature requests can take several seconds
+        "timeout": args.timeout,
+        "preload_app": not args.no_preload,
+        "post_worker_init": post_worker_init,
+        "accesslog": "-" if args.access_log else None,
+    }
+    if args.asgi:
+        options["worker_class"] = "uvicorn.workers.UvicornWorker"
+    return options
+
+
+def post_worker_init(worker):
+    # Threads do not survive fork, so background work (bundle watcher included) starts in each worker
+    import main
+    main.start_background_work()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bind", default=os.environ.get("BIND", "127.0.0.1:5000"))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_WORKERS", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("WEB_THREADS", 8)),
+                        help="threads per worker; concurrent /predict calls in a worker share micro-batches")
+    parser.add_argument("--timeout", type=int, default=120)
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--no-preload", action="store_true",
+                        help="import main.py and load models separately in every worker")
+    parser.add_argument("--asgi", action="store_true",
+                        help="serve asgi.py with uvicorn workers instead of main.py with threads")
+    args = parser.parse_args(argv)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit("Multi-worker mode needs gunicorn (pip install gunicorn); on Windows run `python main.py`.")
+    if args.asgi:
+        try:
+            import uvicorn.workers  # noqa: F401
+        except ImportError:
+            sys.exit("--asgi needs uvicorn (pip install uvicorn).")
+
+    # Set before main.py is imported in the master
+    os.environ["DEFER_BACKGROUND_WORK"] = "1"
+    os.environ.setdefault("PREWARM_MODELS", "tabular")
+    # Workers pool their /metrics samples here, so a scrape of any one covers the whole server
+    os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"fraud-metrics-{os.getpid()}"))
+    # One OCR process per core across the whole host, not per worker
+    os.environ.setdefault("OCR_WORKERS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+
+    class ScoringService(BaseApplication):
+        def load_config(self):
+            for key, value in build_options(args).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import main
+            # With preload this runs once before fork, so workers share these pages instead of each building a copy
+            for name in main.PREWARM_MODELS:
+                main.registry.get(name)
+            if "tabular" in main.PREWARM_MODELS:
+                # `serving`, not `current`: a watcher thread started here could be holding the manager's lock at fork
+                main.registry.get("tabular").serving.sklearn_model()
+            if args.asgi:
+                import asgi
+                return asgi.app
+            return main.app
+
+    ScoringService().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import os
+
+import cv2
+import numpy as np
+
+from batching import MicroBatcher
+
+SIGNATURE_INPUT_SIZE = 128
+
+
+def preprocess_signature(image):
+    """Grayscale, resize and normalise a signature crop to the CNN's (128, 128, 1) input."""
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    image = cv2.resize(image, (SIGNATURE_INPUT_SIZE, SIGNATURE_INPUT_SIZE))
+    return (image.astype(np.float32) / 255.0).reshape(SIGNATURE_INPUT_SIZE, SIGNATURE_INPUT_SIZE, 1)
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, path):
+        from tensorflow.keras.models import load_model
+        self.model = load_model(path)
+
+    def predict(self, batch):
+        # Calling the model directly skips predict()'s per-call tf.data setup
+        return np.asarray(self.model(batch, training=False)).reshape(-1)
+
+
+class TFLiteBackend:
+    """TFLite interpreter on CPU, with one allocated interpreter per batch size seen."""
+
+    name = "tflite"
+
+    def __init__(self, path, threads=None):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        self._interpreter_cls = Interpreter
+        self.path = path
+        self.threads = threads
+        self._interpreters = {}
+
+    def _interpreter(self, batch_size):
+        interpreter = self._interpreters.get(batch_size)
+        if interpreter is None:
+            interpreter = self._interpreter_cls(model_path=self.path, num_threads=self.threads)
+            input_index = interpreter.get_input_details()[0]["index"]
+            interpreter.resize_tensor_input(input_index, [batch_size, SIGNATURE_INPUT_SIZE, SIGNATURE_INPUT_SIZE, 1])
+            interpreter.allocate_tensors()
+            self._interpreters[batch_size] = interpreter
+        return interpreter
+
+    def predict(self, batch):
+        interpreter = self._interpreter(len(batch))
+        interpreter.set_tensor(interpreter.get_input_details()[0]["index"], np.ascontiguousarray(batch, dtype=np.float32))
+        interpreter.invoke()
+        return interpreter.get_tensor(interpreter.get_output_details()[0]["index"]).reshape(-1).copy()
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        output = self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+        return np.asarray(output).reshape(-1)
+
+
+def load_backend(name, keras_path, tflite_path, onnx_path, threads=None):
+    """Build a backend by name; "auto" prefers a converted TFLite, then ONNX model, then Keras."""
+    if name == "auto":
+        name = "tflite" if os.path.exists(tflite_path) else "onnx" if os.path.exists(onnx_path) else "keras"
+    if name == "tflite":
+        return TFLiteBackend(tflite_path, threads)
+    if name == "onnx":
+        return OnnxBackend(onnx_path, threads)
+    if name == "keras":
+        return KerasBackend(keras_path)
+    raise ValueError(f"Unknown signature backend: {name}")
+
+
+def convert_to_tflite(keras_path, output_path, quantize=False):
+    """Convert signature.keras to TFLite; `quantize` applies dynamic-range weight quantization."""
+    import tensorflow as tf
+    model = tf.keras.models.load_model(keras_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def convert_to_onnx(keras_path, output_path):
+    import tensorflow as tf
+    import tf2onnx
+    model = tf.keras.models.load_model(keras_path)
+    spec = [tf.TensorSpec((None, SIGNATURE_INPUT_SIZE, SIGNATURE_INPUT_SIZE, 1), tf.float32, name="image")]
+    # from_keras does not understand Keras 3 models; tracing the call works for both
+    forward = tf.function(lambda image: model(image, training=False), input_signature=spec)
+    tf2onnx.convert.from_function(forward, input_signature=spec, output_path=output_path)
+
+
+class SignatureScorer:
+    """Scores signature crops from concurrent requests in shared batches.
+
+    Crops are preprocessed on the caller's thread, then a MicroBatcher stacks
+    them into one (n, 128, 128, 1) tensor per backend call.
+    """
+
+    def __init__(self, backend, max_batch_size=32, max_wait_ms=10.0):
+        self.backend = backend
+        self.batcher = MicroBatcher(backend.predict, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms, dtype=np.float32)
+
+    def score(self, image):
+        score = float(self.batcher.predict(preprocess_signature(image)))
+        result = "forged" if score >= 0.5 else "real"
+        confidence = score if score >= 0.5 else 1 - score
+        return {"result": result, "confidence": round(confidence * 100, 2), "backend": self.backend.name}
@@ -1,51 +1,270 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
 import pandas as pd
 import numpy as np
-import random
-from datetime import datetime, timedelta
-from sklearn.model_selection import train_test_split
+import sklearn
+from sklearn.model_selection import train_test_split, RandomizedSearchCV, StratifiedKFold
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report
+from sklearn.metrics import classification_report, accuracy_score, f1_score
 import joblib
+from features import FeatureTransformer, FEATURE_COLUMNS
+from forest import FlatForest
+from calibration import CALIBRATION_FILE, ProbabilityCalibrator, probability_metrics
+
+TRAINING_COLUMNS = ["policy_start_date", "claim_date", "age", "premium_amount", "sum_assured",
+                    "income", "channel", "product_type", "fraud_category"]
+
+# Each trained model is written to <BUNDLES_DIR>/<version>/; LATEST names the newest complete bundle
+BUNDLES_DIR = os.environ.get("MODEL_BUNDLES_DIR", "model_bundles")
+
+# Held-out claims saved with each bundle for warming it up in the scoring service
+SAMPLE_CLAIMS = 64
+
+# Searched with RandomizedSearchCV; trees are fitted in parallel within each candidate's final refit
+PARAM_DISTRIBUTIONS = {
+    "n_estimators": [100, 200, 300],
+    "max_depth": [None, 12, 20, 30],
+    "min_samples_leaf": [1, 2, 5],
+    "max_features": ["sqrt", 0.5, None],
+}
+
+
+def iter_claims(columns, chunk_rows):
+    """Training claims in chunks: from claim_store/claims once a CSV has been imported, else from the CSV."""
+    if os.path.isdir("claim_store/claims"):
+        # Only the columnar store needs pyarrow
+        from claim_store import iter_claims as iter_stored_claims
+        return iter_stored_claims(columns, chunk_rows)
+    return pd.read_csv("insurance_claims.csv", usecols=columns, chunksize=chunk_rows)
+
+
+def split_mask(chunk_index, rows, test_size, seed):
+    """Held-out rows of one chunk; the same for every pass over the data."""
+    return np.random.default_rng([seed, chunk_index]).random(rows) < test_size
+
+
+def sample_rows(sample, chunk, max_rows, rng):
+    """Keep a uniform sample of at most `max_rows` rows across chunks (smallest random keys win)."""
+    chunk = chunk.assign(_key=rng.random(len(chunk)))
+    merged = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+    return merged if max_rows is None or len(merged) <= max_rows else merged.nsmallest(max_rows, "_key")
+
+
+def scan_claims(chunk_rows, test_size, max_rows, seed):
+    """One pass over the claims: categories seen, plus uniform samples of the train and test rows."""
+    rng = np.random.default_rng(seed)
+    channels, products, categories = set(), set(), set()
+    train, test = None, None
+    for i, chunk in enumerate(iter_claims(TRAINING_COLUMNS, chunk_rows)):
+        channels.update(chunk["channel"].unique())
+        products.update(chunk["product_type"].unique())
+        categories.update(chunk["fraud_category"].unique())
+        held_out = split_mask(i, len(chunk), test_size, seed)
+        train = sample_rows(train, chunk[~held_out], max_rows, rng)
+        test = sample_rows(test, chunk[held_out], max_rows, rng)
+    encoders = (LabelEncoder().fit(sorted(channels)), LabelEncoder().fit(sorted(products)),
+                LabelEncoder().fit(sorted(categories)))
+    return encoders, train.drop(columns="_key"), test.drop(columns="_key")
+
+
+def search_hyperparameters(X, y, n_iter, cv, seed):
+    """Cross-validated random search; candidates and folds run in parallel on every core."""
+    search = RandomizedSearchCV(
+        RandomForestClassifier(random_state=seed, n_jobs=1),
+        PARAM_DISTRIBUTIONS,
+        n_iter=n_iter,
+        cv=StratifiedKFold(n_splits=cv, shuffle=True, random_state=seed),
+        scoring="f1_macro",
+        n_jobs=-1,
+        refit=False,
+        random_state=seed,
+    )
+    search.fit(X, y)
+    results = pd.DataFrame(search.cv_results_).sort_values("rank_test_score")
+    top = [{"params": row.params, "mean_f1_macro": round(row.mean_test_score, 4), "std": round(row.std_test_score, 4)}
+           for row in results.head(5).itertuples()]
+    return search.best_params_, float(search.best_score_), top
+
+
+def fit_in_chunks(params, features, le_fraud, chunk_rows, test_size, seed):
+    """Grow the forest chunk by chunk with warm_start, so the training data never has to fit in memory.
 
+    Each fit adds trees in proportion to its share of the rows and sees only
+    those rows. warm_start needs every fit to see every class, so chunks
+    missing a rare class are held back and merged with the next one.
+    """
+    total_rows = sum(int((~split_mask(i, len(chunk), test_size, seed)).sum())
+                     for i, chunk in enumerate(iter_claims(["fraud_category"], chunk_rows)))
+    n_estimators = params.get("n_estimators", 100)
+    model = RandomForestClassifier(**dict(params, n_estimators=0), warm_start=True, random_state=seed, n_jobs=-1)
+    classes = set(le_fraud.classes_)
+    pending = []
+    for i, chunk in enumerate(iter_claims(TRAINING_COLUMNS, chunk_rows)):
+        pending.append(chunk[~split_mask(i, len(chunk), test_size, seed)])
+        rows = pd.concat(pending, ignore_index=True)
+        if set(rows["fraud_category"]) != classes:
+            continue
+        pending = []
+        trees = max(1, round(n_estimators * len(rows) / total_rows))
+        model.set_params(n_estimators=model.n_estimators + trees)
+        model.fit(features.transform_frame(rows), le_fraud.transform(rows["fraud_category"]))
+    if pending:
+        print(f"Skipped the last {sum(len(rows) for rows in pending)} rows: they do not cover every class")
+    return model
 
-def train_model():
-    df = pd.read_csv("insurance_claims.csv")
-    df["policy_start_date"] = pd.to_datetime(df["policy_start_date"])
-    df["claim_date"] = pd.to_datetime(df["claim_date"])
-    df["claim_duration"] = (df["claim_date"] - df["policy_start_date"]).dt.days
-    df.drop(columns=["claim_id", "policy_start_date", "claim_date"], inplace=True)
-    
-    le_channel = LabelEncoder()
-    df["channel"] = le_channel.fit_transform(df["channel"])
-    
-    le_product = LabelEncoder()
-    df["product_type"] = le_product.fit_transform(df["product_type"])
-    
-    le_fraud = LabelEncoder()
-    df["fraud_category"] = le_fraud.fit_transform(df["fraud_category"])
-    
-    X = df.drop(columns=["fraud_category"])
-    y = df["fraud_category"]
-    
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    scaler = StandardScaler()
-    X_train = scaler.fit_transform(X_train)
-    X_test = scaler.transform(X_test)
-    
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    
-    y_pred = model.predict(X_test)
+
+def calibrate(model, X_held_out, y_held_out, calibration_size, seed):
+    """Fit isotonic calibrators on part of the held-out rows; the rest are kept for evaluation."""
+    # Stratify when every class has at least two held-out rows
+    stratify = y_held_out if np.bincount(y_held_out, minlength=len(model.classes_)).min() >= 2 else None
+    X_cal, X_eval, y_cal, y_eval = train_test_split(X_held_out, y_held_out, train_size=calibration_size,
+                                                    stratify=stratify, random_state=seed)
+    calibrator = ProbabilityCalibrator.fit(model.predict_proba(X_cal), y_cal)
+    return calibrator, X_eval, y_eval
+
+
+def write_bundle(bundles_dir, version, model, scaler, le_channel, le_product, le_fraud, metrics, manifest,
+                 sample_claims=None, calibrator=None):
+    """Write a complete bundle next to the others, then move it into place and point LATEST at it."""
+    os.makedirs(bundles_dir, exist_ok=True)
+    final_path = os.path.join(bundles_dir, version)
+    tmp_path = os.path.join(bundles_dir, f".tmp-{version}")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    joblib.dump(model, os.path.join(tmp_path, "fraud_model.pkl"))
+    joblib.dump(scaler, os.path.join(tmp_path, "scaler.pkl"))
+    joblib.dump(le_channel, os.path.join(tmp_path, "label_encoder_channel.pkl"))
+    joblib.dump(le_product, os.path.join(tmp_path, "label_encoder_product.pkl"))
+    joblib.dump(le_fraud, os.path.join(tmp_path, "label_encoder_fraud.pkl"))
+    # Flat-array copy of the forest for the low-latency scoring backend
+    FlatForest.from_sklearn(model).save(os.path.join(tmp_path, "fraud_forest"))
+    if calibrator is not None:
+        calibrator.save(os.path.join(tmp_path, CALIBRATION_FILE))
+    # Held-out claims the scoring service warms a new bundle up on before swapping it in
+    if sample_claims is not None:
+        sample_claims.to_csv(os.path.join(tmp_path, "sample_claims.csv"), index=False)
+    with open(os.path.join(tmp_path, "metrics.json"), "w") as f:
+        json.dump(metrics, f, indent=2, default=str)
+    with open(os.path.join(tmp_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    os.replace(tmp_path, final_path)
+    with open(os.path.join(bundles_dir, "LATEST.tmp"), "w") as f:
+        f.write(version)
+    os.replace(os.path.join(bundles_dir, "LATEST.tmp"), os.path.join(bundles_dir, "LATEST"))
+    return final_path
+
+
+def train_model(max_rows=None, chunk_rows=500_000, search_rows=50_000, n_iter=10, cv=3, test_size=0.2,
+                chunked=False, seed=42, bundles_dir=BUNDLES_DIR, calibration_size=0.5):
+    """Search hyperparameters, fit the fraud model on every core and write a versioned bundle.
+
+    Claims are read in chunks from the claim store (or the CSV). By default
+    the training rows (optionally a uniform sample of `max_rows`) are fitted
+    in memory; `chunked` instead grows the forest chunk by chunk for data
+    that does not fit in memory. `calibration_size` of the held-out rows
+    calibrate the class probabilities and the rest measure the model.
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    # Chunked training only keeps samples in memory, for the scaler, the search and the test metrics
+    sample_limit = (max_rows or search_rows) if chunked else max_rows
+    (le_channel, le_product, le_fraud), train, test = scan_claims(chunk_rows, test_size, sample_limit, seed)
+    timings["load_seconds"] = round(time.perf_counter() - started, 3)
+
+    # Same compiled feature pipeline the scoring service uses
+    features = FeatureTransformer(le_channel, le_product)
+    scaler = StandardScaler().fit(features.raw_frame(train))
+    features.set_scaler(scaler)
+    X_train = features.transform_frame(train)
+    y_train = le_fraud.transform(train["fraud_category"])
+    X_test = features.transform_frame(test)
+    y_test = le_fraud.transform(test["fraud_category"])
+
+    phase = time.perf_counter()
+    if len(X_train) > search_rows:
+        X_search, _, y_search, _ = train_test_split(X_train, y_train, train_size=search_rows,
+                                                    stratify=y_train, random_state=seed)
+    else:
+        X_search, y_search = X_train, y_train
+    best_params, best_score, top_candidates = search_hyperparameters(X_search, y_search, n_iter, cv, seed)
+    timings["search_seconds"] = round(time.perf_counter() - phase, 3)
+    print(f"Best parameters (CV macro F1 {best_score:.4f}): {best_params}")
+
+    phase = time.perf_counter()
+    if chunked:
+        model = fit_in_chunks(best_params, features, le_fraud, chunk_rows, test_size, seed)
+    else:
+        model = RandomForestClassifier(**best_params, random_state=seed, n_jobs=-1)
+        model.fit(X_train, y_train)
+    timings["fit_seconds"] = round(time.perf_counter() - phase, 3)
+
+    calibrator, X_test, y_test = calibrate(model, X_test, y_test, calibration_size, seed)
+    raw_proba = model.predict_proba(X_test)
+    calibrated_proba = calibrator.transform(raw_proba)
+    y_pred = np.argmax(calibrated_proba, axis=1)
     print("Classification Report:")
-    print(classification_report(y_test, y_pred))
-    
-    joblib.dump(model, "fraud_model.pkl")
-    joblib.dump(scaler, "scaler.pkl")
-    joblib.dump(le_channel, "label_encoder_channel.pkl")
-    joblib.dump(le_product, "label_encoder_product.pkl")
-    joblib.dump(le_fraud, "label_encoder_fraud.pkl")
-    print("Model trained and saved successfully!")
-
-train_model()
\ No newline at end of file
+    print(classification_report(y_test, y_pred, labels=np.arange(len(le_fraud.classes_)),
+                                target_names=le_fraud.classes_, zero_division=0))
+    timings["training_seconds"] = round(time.perf_counter() - started, 3)
+
+    version = datetime.now().strftime("%Y%m%d-%H%M%S")
+    metrics = {
+        "accuracy": accuracy_score(y_test, y_pred),
+        "f1_macro": f1_score(y_test, y_pred, average="macro"),
+        "cv_f1_macro": best_score,
+        "report": classification_report(y_test, y_pred, labels=np.arange(len(le_fraud.classes_)),
+                                        target_names=le_fraud.classes_, zero_division=0, output_dict=True),
+        "top_candidates": top_candidates,
+        "uncalibrated": probability_metrics(raw_proba, y_test),
+        "calibrated": probability_metrics(calibrated_proba, y_test),
+    }
+    manifest = {
+        "version": version,
+        "created_at": datetime.now().isoformat(),
+        "params": best_params,
+        "mode": "chunked" if chunked else "in-memory",
+        "rows_train": None if chunked else len(X_train),
+        "rows_test": len(X_test),
+        "rows_calibration": len(test) - len(X_test),
+        "rows_search": len(X_search),
+        "seed": seed,
+        "feature_columns": FEATURE_COLUMNS,
+        "classes": list(le_fraud.classes_),
+        "sklearn_version": sklearn.__version__,
+        "cpu_count": os.cpu_count(),
+        **timings,
+    }
+    print(f"Log loss {metrics['uncalibrated']['log_loss']:.4f} uncalibrated, "
+          f"{metrics['calibrated']['log_loss']:.4f} calibrated")
+    path = write_bundle(bundles_dir, version, model, scaler, le_channel, le_product, le_fraud, metrics, manifest,
+                        sample_claims=test.drop(columns="fraud_category").head(SAMPLE_CLAIMS),
+                        calibrator=calibrator)
+    print(f"Model trained and saved as bundle {path} in {timings['training_seconds']:.1f}s")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the fraud model and write a versioned bundle.")
+    parser.add_argument("--max-rows", type=int, help="train on a uniform sample of this many rows")
+    parser.add_argument("--chunked", action="store_true", help="grow the forest chunk by chunk (out of core)")
+    parser.add_argument("--chunk-rows", type=int, default=500_000)
+    parser.add_argument("--search-rows", type=int, default=50_000, help="rows used for the hyperparameter search")
+    parser.add_argument("--n-iter", type=int, default=10, help="hyperparameter candidates to try")
+    parser.add_argument("--cv", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--calibration-size", type=float, default=0.5,
+                        help="share of the held-out rows used to calibrate probabilities")
+    parser.add_argument("--bundles-dir", default=BUNDLES_DIR)
+    args = parser.parse_args()
+    train_model(args.max_rows, args.chunk_rows, args.search_rows, args.n_iter, args.cv, chunked=args.chunked,
+                seed=args.seed, bundles_dir=args.bundles_dir,
+                calibration_size=args.calibration_size)
@@ -11,6 +11,59 @@ import FormData from 'form-data';
 const router = express.Router();
 const upload = multer({ dest: 'uploads/' });
 
+const FLASK_URL = 'http://127.0.0.1:5000';
+const JOB_POLL_INTERVAL_MS = 1000;
+// Give up on a scoring job that has not finished in this long
+const JOB_TIMEOUT_MS = 30 * 60 * 1000;
+
+// Submit a CSV as a background scoring job, wait for it to finish and return the scored CSV.
+// Each request to Flask is short, so large uploads no longer hit HTTP timeouts.
+const scoreCsvInBackground = async (file) => {
+  const form = new FormData();
+  form.append('file', fs.createReadStream(file.path), {
+    filename: file.originalname,
+    contentType: 'text/csv',
+  });
+
+  const { data: submitted } = await axios.post(`${FLASK_URL}/bulk-predict/jobs`, form, {
+    headers: form.getHeaders(),
+    maxContentLength: Infinity,
+    maxBodyLength: Infinity
+  });
+
+  let job = submitted;
+  const deadline = Date.now() + JOB_TIMEOUT_MS;
+  while (job.state === 'queued' || job.state === 'running') {
+    if (Date.now() > deadline) {
+      throw new Error(`Scoring job ${submitted.job_id} did not finish within ${JOB_TIMEOUT_MS / 1000}s`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    ({ data: job } = await axios.get(`${FLASK_URL}/bulk-predict/jobs/${submitted.job_id}`));
+  }
+
+  if (job.state !== 'done') {
+    throw new Error(job.error || `Scoring job ${job.job_id} ${job.state}`);
+  }
+
+  // Every part is a standalone CSV; keep the header from the first one only
+  const parts = [];
+  for (let part = 0; part < job.parts; part++) {
+    const { data } = await axios.get(`${FLASK_URL}/bulk-predict/jobs/${job.job_id}/parts/${part}`, {
+      responseType: 'arraybuffer'
+    });
+    const text = Buffer.from(data).toString('utf-8');
+    parts.push(part === 0 ? text : text.slice(text.indexOf('\n') + 1));
+  }
+
+  // The parts are collected, so the job's files can go; Flask sweeps any left behind after a day
+  try {
+    await axios.delete(`${FLASK_URL}/bulk-predict/jobs/${job.job_id}`);
+  } catch (error) {
+    console.error(`Could not delete scoring job ${job.job_id}:`, error.message);
+  }
+  return parts.join('');
+};
+
 // Single claim entry
 router.post('/single', async (req, res) => {
   try {
@@ -72,23 +125,8 @@ router.post('/single', async (req, res) => {
 // CSV upload
 router.post('/bulk', upload.single('file'), async (req, res) => {
   try {
-    // Create form data for Flask API
-    const form = new FormData();
-    form.append('file', fs.createReadStream(req.file.path), {
-      filename: req.file.originalname,
-      contentType: 'text/csv',
-    });
-
-    // Send to Flask API first
-    const flaskResponse = await axios.post('http://127.0.0.1:5000/bulk-predict', form, {
-      headers: form.getHeaders(),
-      maxContentLength: Infinity,
-      maxBodyLength: Infinity,
-      responseType: 'arraybuffer'
-    });
-
-    // Convert Flask response to string
-    const csvString = Buffer.from(flaskResponse.data).toString('utf-8');
+    // Score the file through the Flask background job queue first
+    const csvString = await scoreCsvInBackground(req.file);
     
     // Process the CSV string
     const results = [];
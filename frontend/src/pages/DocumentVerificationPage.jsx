@@ -33,12 +33,9 @@ export default function DocumentVerificationPage() {
     formData.append('file', file);
 
     try {
-      const ocrResponse = await axios.post('http://127.0.0.1:5000/ocr-predict', formData);
-      const signatureResponse = await axios.post('http://127.0.0.1:5000/signature_check', formData);
-      setVerificationResult({
-        ...ocrResponse.data,
-        signature: signatureResponse.data
-      });
+      // Single pass: the PDF is rasterized and OCR'd once for both fraud and signature checks
+      const response = await axios.post('http://127.0.0.1:5000/verify-document', formData);
+      setVerificationResult(response.data);
       toast.success('Document verified successfully');
     } catch (error) {
       toast.error('Verification failed: ' + error.message);